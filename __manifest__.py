@@ -1,12 +1,15 @@
 
 {
     'name': 'GT Empréstimos - Extensão Vendas',
-    'version': '18.0.1.0.0',
+    'version': '18.0.1.1.0',
     'category': 'Sales', 
     'summary': 'Gestão completa de empréstimos',
     'author': 'GT Empréstimos',
     'license': 'LGPL-3',
     'depends': ['sale_management', 'account', 'product'],
+    'external_dependencies': {
+        'python': ['numpy'],
+    },
     'data': [
         'data/security_data.xml',
         'data/product_data.xml',
@@ -14,6 +17,15 @@
         'views/sale_order_views.xml',
         'views/loan_installment_views.xml',
         'views/renegotiation_wizard_views.xml', 
+        'wizard/loan_renegotiation_wizard.xml',
+        'views/res_config_settings_views.xml',
+        'views/loan_dashboard_views.xml',
+        'views/loan_holiday_views.xml',
+        'views/loan_payment_views.xml',
+        'views/loan_aging_report_views.xml',
+        'views/loan_collection_task_views.xml',
+        'views/loan_perf_sample_views.xml',
+        'views/loan_cron_job_views.xml',
     ],
     'installable': True,
     'auto_install': False,
@@ -0,0 +1,35 @@
+# -*- coding: utf-8 -*-
+import logging
+
+from odoo import SUPERUSER_ID
+
+_logger = logging.getLogger(__name__)
+
+
+def migrate(cr, version):
+    """Lança como saldo inicial o valor pago que ainda não está no razão.
+    
+    Cobre as parcelas pagas antes da existência do razão de pagamentos, para
+    que o valor pago (agora a soma dos lançamentos) não seja zerado.
+    """
+    if not version:
+        return
+    
+    cr.execute("""
+        INSERT INTO loan_payment (installment_id, sale_order_id, partner_id, date, amount,
+                                  currency_id, payment_type, memo,
+                                  create_uid, write_uid, create_date, write_date)
+        SELECT li.id, li.sale_order_id, li.partner_id,
+               COALESCE(li.payment_date, li.write_date::date, CURRENT_DATE),
+               li.amount_paid - COALESCE(ledger.total, 0),
+               li.currency_id, 'opening', 'Saldo inicial',
+               %(uid)s, %(uid)s, NOW() AT TIME ZONE 'UTC', NOW() AT TIME ZONE 'UTC'
+          FROM loan_installment li
+     LEFT JOIN (
+              SELECT installment_id, SUM(amount) AS total
+                FROM loan_payment
+            GROUP BY installment_id
+          ) ledger ON ledger.installment_id = li.id
+         WHERE COALESCE(li.amount_paid, 0) != COALESCE(ledger.total, 0)
+    """, {'uid': SUPERUSER_ID})
+    _logger.info("Razão de pagamentos: %s lançamento(s) de saldo inicial criados", cr.rowcount)
@@ -1,5 +1,16 @@
 # -*- coding: utf-8 -*-
+from . import loan_perf_sample
+from . import loan_cron_job
 from . import product_template
 from . import sale_order  
+from . import loan_installment_event
 from . import loan_installment
+from . import loan_payment
+from . import loan_payment_import
 from . import res_partner
+from . import account_move
+from . import res_config_settings
+from . import loan_dashboard
+from . import loan_holiday
+from . import loan_aging_report
+from . import loan_collection_task
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields
+
+# Chave, nos dados de pré-commit do cursor, da fila de faturas a sincronizar
+LOAN_PAYMENT_SYNC_QUEUE = 'gt_loan_extension.loan_payment_sync'
+
+class AccountMove(models.Model):
+    _inherit = 'account.move'
+    
+    loan_installment_ids = fields.One2many(
+        'loan.installment',
+        'invoice_id',
+        string='Parcelas de Empréstimo'
+    )
+    
+    def _compute_payment_state(self):
+        """Enfileira as faturas cujo estado de pagamento foi recalculado"""
+        super()._compute_payment_state()
+        self._queue_loan_payment_sync()
+    
+    def _queue_loan_payment_sync(self):
+        """Agenda a sincronização das parcelas para o fim da transação.
+        
+        Todas as faturas alteradas na mesma transação (ex.: importação de extrato
+        conciliando centenas de faturas) são sincronizadas juntas, em uma única
+        atualização agrupada das parcelas, logo antes do commit.
+        """
+        moves = self.filtered(lambda m: m.move_type == 'out_invoice' and isinstance(m.id, int))
+        if not moves:
+            return
+        
+        precommit = self.env.cr.precommit
+        queued_ids = precommit.data.get(LOAN_PAYMENT_SYNC_QUEUE)
+        if queued_ids is None:
+            queued_ids = precommit.data[LOAN_PAYMENT_SYNC_QUEUE] = set()
+            env = self.env
+            
+            @precommit.add
+            def _sync_loan_installments():
+                move_ids = precommit.data.pop(LOAN_PAYMENT_SYNC_QUEUE, set())
+                if move_ids:
+                    env['loan.installment'].sudo()._reconcile_invoice_payments(move_ids=list(move_ids))
+                    env.flush_all()
+        
+        queued_ids.update(moves.ids)
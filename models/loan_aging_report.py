@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api, tools
+from collections import defaultdict
+
+from .loan_installment import LOAN_AGING_BUCKETS
+
+class LoanAgingReport(models.Model):
+    """Aging da carteira: saldo das parcelas abertas por faixa de atraso.
+    
+    View sobre os campos armazenados ``days_late`` e ``aging_bucket`` das
+    parcelas (atualizados pelo job noturno); a matriz de aging por cliente,
+    produto ou vendedor é um único ``read_group``.
+    """
+    _name = 'loan.aging.report'
+    _description = 'Aging da Carteira de Empréstimos'
+    _auto = False
+    _rec_name = 'installment_id'
+    _order = 'days_late desc'
+    
+    installment_id = fields.Many2one('loan.installment', string='Parcela', readonly=True)
+    sale_order_id = fields.Many2one('sale.order', string='Empréstimo', readonly=True)
+    partner_id = fields.Many2one('res.partner', string='Cliente', readonly=True)
+    product_id = fields.Many2one('product.product', string='Produto', readonly=True)
+    user_id = fields.Many2one('res.users', string='Vendedor', readonly=True)
+    company_id = fields.Many2one('res.company', string='Empresa', readonly=True)
+    currency_id = fields.Many2one('res.currency', string='Moeda', readonly=True)
+    due_date = fields.Date(string='Vencimento', readonly=True)
+    days_late = fields.Integer(string='Dias em Atraso', readonly=True, aggregator='max')
+    aging_bucket = fields.Selection(
+        [('current', 'A Vencer')] + LOAN_AGING_BUCKETS,
+        string='Faixa de Atraso',
+        readonly=True
+    )
+    balance = fields.Monetary(string='Saldo em Aberto', currency_field='currency_id', readonly=True)
+    
+    def _query(self):
+        return """
+            SELECT li.id AS id,
+                   li.id AS installment_id,
+                   li.sale_order_id,
+                   li.partner_id,
+                   loan_product.product_id,
+                   so.user_id,
+                   so.company_id,
+                   li.currency_id,
+                   li.due_date,
+                   COALESCE(li.days_late, 0) AS days_late,
+                   COALESCE(li.aging_bucket, 'current') AS aging_bucket,
+                   li.amount - COALESCE(li.amount_paid, 0) AS balance
+              FROM loan_installment li
+              JOIN sale_order so ON so.id = li.sale_order_id
+         LEFT JOIN LATERAL (
+                   SELECT sol.product_id
+                     FROM sale_order_line sol
+                     JOIN product_product pp ON pp.id = sol.product_id
+                     JOIN product_template pt ON pt.id = pp.product_tmpl_id
+                    WHERE sol.order_id = so.id
+                      AND pt.is_loan_product
+                 ORDER BY sol.id
+                    LIMIT 1
+              ) loan_product ON TRUE
+             WHERE li.status IN ('pending', 'late', 'partial')
+        """
+    
+    def init(self):
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute(f"CREATE OR REPLACE VIEW {self._table} AS ({self._query()})")
+    
+    @api.model
+    def _get_aging_matrix(self, groupby='partner_id', domain=None):
+        """Matriz {grupo: {faixa: saldo}} da carteira em uma única consulta"""
+        self.env['loan.installment'].flush_model()
+        matrix = defaultdict(dict)
+        for group, bucket, balance in self._read_group(domain or [], [groupby, 'aging_bucket'], ['balance:sum']):
+            matrix[group][bucket] = balance
+        return matrix
@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from collections import defaultdict
+import heapq
+import logging
+
+from .loan_perf_sample import add_perf_rows, instrument
+
+_logger = logging.getLogger(__name__)
+
+# Pesos da prioridade de cobrança: valor vencido ponderado pelo atraso
+# (+100% a cada N dias), mais uma fração da exposição total do cliente e um
+# acréscimo sobre o valor vencido para cada empréstimo já renegociado
+COLLECTION_SCORE_DAYS_WEIGHT = 30
+COLLECTION_SCORE_EXPOSURE_WEIGHT = 0.1
+COLLECTION_SCORE_RENEGOTIATION_WEIGHT = 0.25
+
+class LoanCollectionTask(models.Model):
+    """Fila de cobrança: um item por empréstimo com parcelas vencidas.
+    
+    Montada toda manhã a partir dos campos de aging das parcelas, já
+    agregada por empréstimo, ordenada pela prioridade e dividida entre os
+    cobradores; a tela de cada cobrador lê só os seus itens.
+    """
+    _name = 'loan.collection.task'
+    _description = 'Fila de Cobrança de Empréstimos'
+    _order = 'score desc, id'
+    _rec_name = 'sale_order_id'
+    
+    sale_order_id = fields.Many2one('sale.order', string='Empréstimo', required=True, readonly=True, ondelete='cascade')
+    partner_id = fields.Many2one('res.partner', string='Cliente', readonly=True, index=True)
+    company_id = fields.Many2one('res.company', string='Empresa', readonly=True)
+    currency_id = fields.Many2one('res.currency', string='Moeda', readonly=True)
+    collector_id = fields.Many2one('res.users', string='Cobrador', index=True)
+    
+    state = fields.Selection([
+        ('open', 'A Contatar'),
+        ('contacted', 'Contatado'),
+    ], string='Situação', default='open', required=True)
+    note = fields.Text(string='Anotações')
+    
+    overdue_amount = fields.Monetary(string='Valor Vencido', currency_field='currency_id', readonly=True)
+    overdue_count = fields.Integer(string='Parcelas Vencidas', readonly=True)
+    days_late = fields.Integer(string='Dias em Atraso', readonly=True)
+    oldest_due_date = fields.Date(string='Vencimento Mais Antigo', readonly=True)
+    partner_exposure = fields.Monetary(
+        string='Exposição do Cliente',
+        currency_field='currency_id',
+        readonly=True,
+        help='Saldo em aberto de todos os empréstimos do cliente'
+    )
+    renegotiation_count = fields.Integer(
+        string='Renegociações',
+        readonly=True,
+        help='Empréstimos do cliente com parcelas renegociadas'
+    )
+    score = fields.Float(string='Prioridade', readonly=True, index=True, digits=(16, 2))
+    
+    _sql_constraints = [
+        ('sale_order_uniq', 'unique(sale_order_id)', 'Já existe um item na fila de cobrança para este empréstimo.'),
+    ]
+    
+    # ========================================
+    # MONTAGEM DA FILA
+    # ========================================
+    
+    @api.model
+    @instrument('loan.collection.task._rebuild_worklist')
+    def _rebuild_worklist(self):
+        """Atualiza a fila de forma incremental a partir do aging das parcelas.
+        
+        Uma consulta agrega as parcelas vencidas por empréstimo e grava só os
+        itens novos ou alterados (INSERT ... ON CONFLICT); os empréstimos que
+        não têm mais parcelas vencidas saem da fila. Um item contatado volta
+        a ficar pendente quando mais uma parcela vence.
+        """
+        cr = self.env.cr
+        self.env['loan.installment'].flush_model(
+            ['sale_order_id', 'partner_id', 'status', 'amount', 'amount_paid', 'days_late', 'due_date', 'is_renegotiated']
+        )
+        self.flush_model()
+        
+        cr.execute("""
+            WITH overdue AS (
+                SELECT li.sale_order_id,
+                       MIN(li.partner_id) AS partner_id,
+                       SUM(li.amount - COALESCE(li.amount_paid, 0)) AS overdue_amount,
+                       COUNT(*) AS overdue_count,
+                       MAX(li.days_late) AS days_late,
+                       MIN(li.due_date) AS oldest_due_date
+                  FROM loan_installment li
+                 WHERE li.days_late > 0
+              GROUP BY li.sale_order_id
+            ),
+            partners AS (
+                SELECT li.partner_id,
+                       SUM(li.amount - COALESCE(li.amount_paid, 0)) FILTER (
+                           WHERE li.status IN ('pending', 'late', 'partial')
+                       ) AS exposure,
+                       COUNT(DISTINCT li.sale_order_id) FILTER (WHERE li.is_renegotiated) AS renegotiation_count
+                  FROM loan_installment li
+                 WHERE li.partner_id IN (SELECT partner_id FROM overdue)
+              GROUP BY li.partner_id
+            )
+            INSERT INTO loan_collection_task (
+                sale_order_id, partner_id, company_id, currency_id, state,
+                overdue_amount, overdue_count, days_late, oldest_due_date,
+                partner_exposure, renegotiation_count, score,
+                create_uid, create_date, write_uid, write_date
+            )
+            SELECT overdue.sale_order_id,
+                   overdue.partner_id,
+                   so.company_id,
+                   so.currency_id,
+                   'open',
+                   overdue.overdue_amount,
+                   overdue.overdue_count,
+                   overdue.days_late,
+                   overdue.oldest_due_date,
+                   COALESCE(partners.exposure, 0),
+                   COALESCE(partners.renegotiation_count, 0),
+                   overdue.overdue_amount * (1 + overdue.days_late / %(days_weight)s::numeric)
+                       + COALESCE(partners.exposure, 0) * %(exposure_weight)s
+                       + overdue.overdue_amount * COALESCE(partners.renegotiation_count, 0) * %(renegotiation_weight)s,
+                   %(uid)s, %(now)s, %(uid)s, %(now)s
+              FROM overdue
+              JOIN sale_order so ON so.id = overdue.sale_order_id
+         LEFT JOIN partners ON partners.partner_id = overdue.partner_id
+            ON CONFLICT (sale_order_id) DO UPDATE
+               SET partner_id = EXCLUDED.partner_id,
+                   state = CASE WHEN EXCLUDED.overdue_count > loan_collection_task.overdue_count
+                                THEN 'open' ELSE loan_collection_task.state END,
+                   overdue_amount = EXCLUDED.overdue_amount,
+                   overdue_count = EXCLUDED.overdue_count,
+                   days_late = EXCLUDED.days_late,
+                   oldest_due_date = EXCLUDED.oldest_due_date,
+                   partner_exposure = EXCLUDED.partner_exposure,
+                   renegotiation_count = EXCLUDED.renegotiation_count,
+                   score = EXCLUDED.score,
+                   write_uid = EXCLUDED.write_uid,
+                   write_date = EXCLUDED.write_date
+             WHERE (loan_collection_task.partner_id, loan_collection_task.overdue_amount,
+                    loan_collection_task.overdue_count, loan_collection_task.days_late,
+                    loan_collection_task.partner_exposure, loan_collection_task.renegotiation_count)
+                   IS DISTINCT FROM
+                   (EXCLUDED.partner_id, EXCLUDED.overdue_amount,
+                    EXCLUDED.overdue_count, EXCLUDED.days_late,
+                    EXCLUDED.partner_exposure, EXCLUDED.renegotiation_count)
+         RETURNING id
+        """, {
+            'days_weight': COLLECTION_SCORE_DAYS_WEIGHT,
+            'exposure_weight': COLLECTION_SCORE_EXPOSURE_WEIGHT,
+            'renegotiation_weight': COLLECTION_SCORE_RENEGOTIATION_WEIGHT,
+            'uid': self.env.uid,
+            'now': cr.now(),
+        })
+        updated_count = cr.rowcount
+        
+        cr.execute("""
+            DELETE FROM loan_collection_task task
+             WHERE NOT EXISTS (
+                   SELECT 1
+                     FROM loan_installment li
+                    WHERE li.sale_order_id = task.sale_order_id
+                      AND li.days_late > 0
+             )
+        """)
+        removed_count = cr.rowcount
+        self.invalidate_model()
+        
+        self._assign_collectors()
+        add_perf_rows(updated_count + removed_count)
+        _logger.info(
+            "Fila de cobrança atualizada: %s itens novos ou alterados, %s removidos",
+            updated_count, removed_count
+        )
+    
+    @api.model
+    def _get_collectors(self):
+        """Usuários que recebem itens da fila de cobrança"""
+        return self.env.ref('gt_loan_extension.group_loan_collector').users.filtered('active')
+    
+    @api.model
+    def _assign_collectors(self):
+        """Distribui os itens sem cobrador (ou de quem saiu do grupo) pela menor carga.
+        
+        Os itens já atribuídos ficam com o mesmo cobrador; os novos são
+        distribuídos em ordem de prioridade, sempre para o cobrador da
+        empresa com menos itens na fila.
+        """
+        collectors = self._get_collectors()
+        tasks = self.search([
+            '|', ('collector_id', '=', False), ('collector_id', 'not in', collectors.ids),
+        ])
+        if not tasks or not collectors:
+            return
+        
+        loads = {collector.id: count for collector, count in self._read_group(
+            [('collector_id', 'in', collectors.ids)], ['collector_id'], ['__count']
+        )}
+        assignments = defaultdict(list)
+        for company, company_tasks in tasks.grouped('company_id').items():
+            pool = collectors.filtered(lambda user: company in user.company_ids)
+            if not pool:
+                continue
+            heap = [(loads.get(user.id, 0), user.id) for user in pool]
+            heapq.heapify(heap)
+            for task in company_tasks:
+                load, user_id = heapq.heappop(heap)
+                assignments[user_id].append(task.id)
+                loads[user_id] = load + 1
+                heapq.heappush(heap, (load + 1, user_id))
+        
+        for user_id, task_ids in assignments.items():
+            self.browse(task_ids).write({'collector_id': user_id})
+    
+    @api.model
+    def _cron_rebuild_worklist(self):
+        self._rebuild_worklist()
+    
+    # ========================================
+    # AÇÕES
+    # ========================================
+    
+    def action_mark_contacted(self):
+        self.write({'state': 'contacted'})
+        return True
+    
+    def action_view_installments(self):
+        """Parcelas vencidas do empréstimo"""
+        self.ensure_one()
+        return {
+            'name': f'Parcelas Vencidas - {self.sale_order_id.name}',
+            'type': 'ir.actions.act_window',
+            'res_model': 'loan.installment',
+            'view_mode': 'list,form',
+            'domain': [('sale_order_id', '=', self.sale_order_id.id), ('days_late', '>', 0)],
+            'target': 'current',
+        }
+    
+    def action_view_order(self):
+        self.ensure_one()
+        return {
+            'type': 'ir.actions.act_window',
+            'res_model': 'sale.order',
+            'res_id': self.sale_order_id.id,
+            'view_mode': 'form',
+            'target': 'current',
+        }
@@ -0,0 +1,279 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from datetime import timedelta
+import logging
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Jobs executados em partições. Cada modelo implementa, para a chave do job,
+# ``_<chave>_job_chunk(job, partition, limit)`` (ids do próximo bloco da
+# partição, em ordem crescente, após o cursor), ``_<chave>_job_process(job, ids)``
+# e ``_<chave>_job_finish(job)`` (chamado uma vez, quando todas terminam)
+LOAN_CRON_JOBS = {
+    'loan_status': {
+        'label': 'Status dos Empréstimos',
+        'model': 'sale.order',
+        'workers': [
+            'gt_loan_extension.ir_cron_loan_status_worker_1',
+            'gt_loan_extension.ir_cron_loan_status_worker_2',
+        ],
+    },
+    'invoice_payments': {
+        'label': 'Pagamentos de Faturas',
+        'model': 'loan.installment',
+        'workers': [
+            'gt_loan_extension.ir_cron_invoice_payments_worker_1',
+            'gt_loan_extension.ir_cron_invoice_payments_worker_2',
+        ],
+    },
+}
+
+# Quantidade de partições de cada execução (uma partição é processada por
+# um cron por vez) e tamanho do bloco confirmado a cada commit
+LOAN_CRON_PARTITIONS_PARAM = 'gt_loan_extension.cron_partitions'
+LOAN_CRON_DEFAULT_PARTITIONS = 4
+LOAN_CRON_CHUNK_SIZE = 500
+
+# Tempo máximo de cada chamada de um cron; o restante fica para a próxima
+LOAN_CRON_TIME_LIMIT = 240
+
+# Dias de retenção das execuções concluídas
+LOAN_CRON_RETENTION_DAYS = 30
+
+
+class LoanCronJob(models.Model):
+    """Execução de um job de empréstimos dividida em partições.
+    
+    Os crons reivindicam partições com ``FOR UPDATE SKIP LOCKED`` e confirmam
+    cada bloco com o cursor da partição; uma execução interrompida continua
+    de onde parou e vários crons processam partições diferentes em paralelo.
+    """
+    _name = 'loan.cron.job'
+    _description = 'Execução de Job de Empréstimos'
+    _order = 'started desc, id desc'
+    _rec_name = 'job_key'
+    
+    job_key = fields.Selection(
+        [(key, job['label']) for key, job in LOAN_CRON_JOBS.items()],
+        string='Job',
+        required=True,
+        readonly=True
+    )
+    state = fields.Selection([
+        ('running', 'Em Andamento'),
+        ('done', 'Concluído'),
+    ], string='Situação', default='running', required=True, readonly=True, index=True)
+    since = fields.Datetime(string='Alterações Desde', readonly=True)
+    started = fields.Datetime(string='Início', default=fields.Datetime.now, required=True, readonly=True)
+    finished = fields.Datetime(string='Fim', readonly=True)
+    partition_ids = fields.One2many('loan.cron.partition', 'job_id', string='Partições', readonly=True)
+    processed_count = fields.Integer(string='Processados', compute='_compute_counts')
+    failed_count = fields.Integer(string='Falhas', compute='_compute_counts')
+    
+    def init(self):
+        # Só uma execução em andamento por job
+        self.env.cr.execute(f"""
+            CREATE UNIQUE INDEX IF NOT EXISTS {self._table}_running_uniq
+                ON {self._table} (job_key) WHERE state = 'running'
+        """)
+    
+    @api.depends('partition_ids.processed_count', 'partition_ids.failed_count')
+    def _compute_counts(self):
+        for job in self:
+            job.processed_count = sum(job.partition_ids.mapped('processed_count'))
+            job.failed_count = sum(job.partition_ids.mapped('failed_count'))
+    
+    # ========================================
+    # EXECUÇÃO
+    # ========================================
+    
+    @api.model
+    def _auto_commit(self):
+        return not getattr(threading.current_thread(), 'testing', False)
+    
+    @api.model
+    def _start(self, job_key, since=None):
+        """Abre uma execução com as partições, ou retoma a que está em andamento"""
+        job = self.search([('job_key', '=', job_key), ('state', '=', 'running')], limit=1)
+        if job:
+            _logger.info("Retomando execução %s do job %s", job.id, job_key)
+            return job
+        
+        partition_count = int(self.env['ir.config_parameter'].sudo().get_param(
+            LOAN_CRON_PARTITIONS_PARAM, LOAN_CRON_DEFAULT_PARTITIONS
+        ) or LOAN_CRON_DEFAULT_PARTITIONS)
+        try:
+            with self.env.cr.savepoint():
+                job = self.create({
+                    'job_key': job_key,
+                    'since': since,
+                    'started': self.env.cr.now(),
+                    'partition_ids': [(0, 0, {'index': index}) for index in range(max(partition_count, 1))],
+                })
+        except Exception:
+            # Outro cron abriu a execução ao mesmo tempo
+            self.env.invalidate_all()
+            return self.search([('job_key', '=', job_key), ('state', '=', 'running')], limit=1)
+        
+        if self._auto_commit():
+            self.env.cr.commit()
+        for xmlid in LOAN_CRON_JOBS[job_key]['workers']:
+            worker = self.env.ref(xmlid, raise_if_not_found=False)
+            if worker and worker.active:
+                worker._trigger()
+        return job
+    
+    @api.model
+    def _run(self, job_key, since=None):
+        """Abre (ou retoma) a execução do job e trabalha nela"""
+        self._start(job_key, since=since)
+        return self._work(job_key)
+    
+    @api.model
+    def _work(self, job_key):
+        """Processa blocos das partições livres até acabar o trabalho ou o tempo.
+        
+        Retorna a quantidade de registros processados nesta chamada.
+        """
+        job = self.search([('job_key', '=', job_key), ('state', '=', 'running')], limit=1)
+        if not job:
+            return 0
+        
+        auto_commit = self._auto_commit()
+        deadline = time.monotonic() + LOAN_CRON_TIME_LIMIT
+        done = 0
+        timed_out = False
+        while True:
+            if time.monotonic() >= deadline:
+                timed_out = True
+                break
+            partition = job._claim_partition()
+            if not partition:
+                break
+            done += partition._process_next_chunk()
+            if auto_commit:
+                # Bloco e cursor da partição confirmados juntos; libera a partição
+                self.env.cr.commit()
+        
+        remaining = job._count_pending_partitions()
+        if not remaining:
+            job._finish()
+            if auto_commit:
+                self.env.cr.commit()
+        
+        # Se parou pelo tempo, o cron é chamado de novo para continuar
+        self.env['ir.cron']._notify_progress(done=done, remaining=remaining if timed_out else 0)
+        return done
+    
+    def _claim_partition(self):
+        """Reserva uma partição pendente que nenhum outro cron esteja processando"""
+        self.ensure_one()
+        self.env['loan.cron.partition'].flush_model(['job_id', 'state'])
+        self.env.cr.execute("""
+            SELECT id
+              FROM loan_cron_partition
+             WHERE job_id = %s
+               AND state = 'pending'
+          ORDER BY id
+             LIMIT 1
+               FOR UPDATE SKIP LOCKED
+        """, [self.id])
+        row = self.env.cr.fetchone()
+        return self.env['loan.cron.partition'].browse(row[0] if row else [])
+    
+    def _count_pending_partitions(self):
+        self.ensure_one()
+        return self.env['loan.cron.partition'].search_count([('job_id', '=', self.id), ('state', '=', 'pending')])
+    
+    def _finish(self):
+        """Conclui a execução (uma única vez, mesmo com vários crons)"""
+        self.ensure_one()
+        self.flush_recordset(['state'])
+        self.env.cr.execute("""
+            SELECT id
+              FROM loan_cron_job
+             WHERE id = %s
+               AND state = 'running'
+               FOR UPDATE SKIP LOCKED
+        """, [self.id])
+        if not self.env.cr.fetchone():
+            return
+        
+        model = self.env[LOAN_CRON_JOBS[self.job_key]['model']]
+        getattr(model, f'_{self.job_key}_job_finish')(self)
+        self.write({'state': 'done', 'finished': self.env.cr.now()})
+        _logger.info(
+            "Job %s concluído: %s registros processados, %s falhas",
+            self.job_key, self.processed_count, self.failed_count
+        )
+    
+    @api.model
+    def _cron_work(self, job_key):
+        """Cron auxiliar: ajuda na execução em andamento, sem abrir uma nova"""
+        self._work(job_key)
+    
+    @api.autovacuum
+    def _gc_finished_jobs(self):
+        """Remove as execuções concluídas mais antigas que o período de retenção"""
+        limit_date = fields.Datetime.now() - timedelta(days=LOAN_CRON_RETENTION_DAYS)
+        self.search([('state', '=', 'done'), ('finished', '<', limit_date)]).unlink()
+
+
+class LoanCronPartition(models.Model):
+    """Partição de uma execução: registros com ``id % partições = índice``"""
+    _name = 'loan.cron.partition'
+    _description = 'Partição de Job de Empréstimos'
+    _order = 'job_id, index'
+    
+    job_id = fields.Many2one('loan.cron.job', string='Execução', required=True, index=True, ondelete='cascade')
+    index = fields.Integer(string='Partição', required=True)
+    state = fields.Selection([
+        ('pending', 'Pendente'),
+        ('done', 'Concluída'),
+    ], string='Situação', default='pending', required=True)
+    cursor = fields.Integer(string='Último Id Processado', default=0)
+    processed_count = fields.Integer(string='Processados', default=0)
+    failed_count = fields.Integer(string='Falhas', default=0)
+    error_log = fields.Text(string='Erros')
+    
+    def _process_next_chunk(self):
+        """Processa o próximo bloco da partição e avança o cursor.
+        
+        O bloco é aplicado em um savepoint; se falhar, é reaplicado registro a
+        registro, e os registros com erro ficam no log sem travar a partição.
+        Retorna a quantidade de registros do bloco.
+        """
+        self.ensure_one()
+        job = self.job_id
+        model = self.env[LOAN_CRON_JOBS[job.job_key]['model']]
+        ids = getattr(model, f'_{job.job_key}_job_chunk')(job, self, LOAN_CRON_CHUNK_SIZE)
+        if not ids:
+            self.state = 'done'
+            return 0
+        
+        process = getattr(model, f'_{job.job_key}_job_process')
+        failures = []
+        try:
+            with self.env.cr.savepoint():
+                process(job, ids)
+        except Exception:
+            _logger.exception("Falha no bloco da partição %s do job %s; reprocessando registro a registro",
+                              self.index, job.job_key)
+            self.env.invalidate_all()
+            for record_id in ids:
+                try:
+                    with self.env.cr.savepoint():
+                        process(job, [record_id])
+                except Exception as error:
+                    self.env.invalidate_all()
+                    failures.append(f"{model._name} {record_id}: {error}")
+        
+        self.write({
+            'cursor': ids[-1],
+            'processed_count': self.processed_count + len(ids) - len(failures),
+            'failed_count': self.failed_count + len(failures),
+            'error_log': '\n'.join(filter(None, [self.error_log] + failures)) or False,
+        })
+        return len(ids)
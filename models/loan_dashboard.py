@@ -0,0 +1,203 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api, tools
+import logging
+
+from .loan_perf_sample import instrument
+
+_logger = logging.getLogger(__name__)
+
+class LoanDashboard(models.Model):
+    """Indicadores da carteira de empréstimos, materializados por empresa.
+    
+    Os valores vêm de uma view materializada que agrega ``sale_order`` e
+    ``loan_installment`` em uma única consulta; abrir o dashboard é apenas a
+    leitura de uma linha. A view é atualizada por job agendado ou pelo botão
+    de atualização do próprio dashboard.
+    """
+    _name = 'loan.dashboard'
+    _description = 'Dashboard de Empréstimos'
+    _auto = False
+    _rec_name = 'company_id'
+    
+    company_id = fields.Many2one('res.company', string='Empresa', readonly=True)
+    currency_id = fields.Many2one('res.currency', string='Moeda', readonly=True)
+    
+    dashboard_total_month = fields.Monetary(
+        string='Total Emprestado (Mês)',
+        currency_field='currency_id',
+        readonly=True
+    )
+    dashboard_growth_percent = fields.Float(string='Crescimento (%)', readonly=True)
+    dashboard_active_count = fields.Integer(string='Empréstimos Ativos', readonly=True)
+    dashboard_new_week = fields.Integer(string='Novos na Semana', readonly=True)
+    dashboard_late_count = fields.Integer(string='Parcelas Atrasadas', readonly=True)
+    dashboard_late_amount = fields.Monetary(
+        string='Valor em Atraso',
+        currency_field='currency_id',
+        readonly=True
+    )
+    dashboard_today_count = fields.Integer(string='Vencendo Hoje', readonly=True)
+    dashboard_today_amount = fields.Monetary(
+        string='A Receber Hoje',
+        currency_field='currency_id',
+        readonly=True
+    )
+    dashboard_top_clients = fields.Text(string='Top 3 Clientes', readonly=True)
+    refresh_date = fields.Datetime(string='Atualizado em', readonly=True)
+    
+    def _query(self):
+        return """
+            WITH period AS (
+                SELECT CURRENT_DATE AS today,
+                       date_trunc('month', CURRENT_DATE) AS month_start,
+                       date_trunc('month', CURRENT_DATE) - INTERVAL '1 month' AS previous_month_start
+            ),
+            orders AS (
+                SELECT so.company_id,
+                       SUM(so.loan_released_amount) FILTER (
+                           WHERE so.date_order >= period.month_start
+                       ) AS total_month,
+                       SUM(so.loan_released_amount) FILTER (
+                           WHERE so.date_order >= period.previous_month_start
+                             AND so.date_order < period.month_start
+                       ) AS total_previous_month,
+                       COUNT(*) FILTER (WHERE so.loan_status IN ('active', 'late')) AS active_count,
+                       COUNT(*) FILTER (WHERE so.date_order >= period.today - 7) AS new_week
+                  FROM sale_order so, period
+                 WHERE so.is_loan_order
+                   AND so.state = 'sale'
+              GROUP BY so.company_id
+            ),
+            installments AS (
+                SELECT so.company_id,
+                       COUNT(*) FILTER (
+                           WHERE li.status IN ('late', 'partial') AND li.due_date < period.today
+                       ) AS late_count,
+                       SUM(li.amount - COALESCE(li.amount_paid, 0)) FILTER (
+                           WHERE li.status IN ('late', 'partial') AND li.due_date < period.today
+                       ) AS late_amount,
+                       COUNT(*) FILTER (
+                           WHERE li.due_date = period.today AND li.status != 'paid'
+                       ) AS today_count,
+                       SUM(li.amount - COALESCE(li.amount_paid, 0)) FILTER (
+                           WHERE li.due_date = period.today AND li.status != 'paid'
+                       ) AS today_amount
+                  FROM loan_installment li
+                  JOIN sale_order so ON so.id = li.sale_order_id, period
+                 WHERE li.status IN ('pending', 'late', 'partial')
+                   AND li.due_date <= period.today
+              GROUP BY so.company_id
+            ),
+            top_clients AS (
+                SELECT ranked.company_id,
+                       string_agg(
+                           ranked.position || '. ' || ranked.name || ' - '
+                               || to_char(ranked.balance, 'FM999G999G990D00'),
+                           E'\\n' ORDER BY ranked.position
+                       ) AS top_clients
+                  FROM (
+                      SELECT so.company_id,
+                             rp.name,
+                             SUM(so.loan_balance) AS balance,
+                             row_number() OVER (
+                                 PARTITION BY so.company_id ORDER BY SUM(so.loan_balance) DESC
+                             ) AS position
+                        FROM sale_order so
+                        JOIN res_partner rp ON rp.id = so.partner_id
+                       WHERE so.is_loan_order
+                         AND so.loan_status IN ('active', 'late')
+                    GROUP BY so.company_id, rp.name
+                  ) ranked
+                 WHERE ranked.position <= 3
+              GROUP BY ranked.company_id
+            )
+            SELECT company.id AS id,
+                   company.id AS company_id,
+                   company.currency_id AS currency_id,
+                   COALESCE(orders.total_month, 0) AS dashboard_total_month,
+                   CASE
+                       WHEN COALESCE(orders.total_previous_month, 0) > 0
+                       THEN (COALESCE(orders.total_month, 0) - orders.total_previous_month)
+                            / orders.total_previous_month * 100
+                       ELSE 0
+                   END AS dashboard_growth_percent,
+                   COALESCE(orders.active_count, 0) AS dashboard_active_count,
+                   COALESCE(orders.new_week, 0) AS dashboard_new_week,
+                   COALESCE(installments.late_count, 0) AS dashboard_late_count,
+                   COALESCE(installments.late_amount, 0) AS dashboard_late_amount,
+                   COALESCE(installments.today_count, 0) AS dashboard_today_count,
+                   COALESCE(installments.today_amount, 0) AS dashboard_today_amount,
+                   top_clients.top_clients AS dashboard_top_clients,
+                   (now() AT TIME ZONE 'UTC') AS refresh_date
+              FROM res_company company
+         LEFT JOIN orders ON orders.company_id = company.id
+         LEFT JOIN installments ON installments.company_id = company.id
+         LEFT JOIN top_clients ON top_clients.company_id = company.id
+        """
+    
+    def init(self):
+        self.env.cr.execute(f"DROP MATERIALIZED VIEW IF EXISTS {self._table} CASCADE")
+        tools.drop_view_if_exists(self.env.cr, self._table)
+        self.env.cr.execute(f"CREATE MATERIALIZED VIEW {self._table} AS ({self._query()})")
+        # Índice único exigido pelo REFRESH ... CONCURRENTLY
+        self.env.cr.execute(f"CREATE UNIQUE INDEX {self._table}_id_idx ON {self._table} (id)")
+    
+    @api.model
+    @instrument('loan.dashboard._refresh')
+    def _refresh(self):
+        """Recalcula a view materializada sem bloquear a leitura do dashboard"""
+        self.env.flush_all()
+        self.env.cr.execute(f"REFRESH MATERIALIZED VIEW CONCURRENTLY {self._table}")
+        self.invalidate_model()
+        _logger.info("Dashboard de empréstimos atualizado")
+    
+    @api.model
+    def _cron_refresh_dashboard(self):
+        self._refresh()
+    
+    # ===============================================
+    # AÇÕES DO DASHBOARD
+    # ===============================================
+    
+    @api.model
+    def action_open_dashboard(self):
+        """Abre o dashboard da empresa atual"""
+        return {
+            'name': 'Dashboard de Empréstimos',
+            'type': 'ir.actions.act_window',
+            'res_model': 'loan.dashboard',
+            'res_id': self.env.company.id,
+            'view_mode': 'form',
+            'views': [(self.env.ref('gt_loan_extension.loan_dashboard_form_view').id, 'form')],
+            'target': 'current',
+        }
+    
+    def action_refresh(self):
+        self._refresh()
+        return self.action_open_dashboard()
+    
+    def action_dashboard_late_installments(self):
+        return self.env['ir.actions.act_window']._for_xml_id(
+            'gt_loan_extension.action_loan_installments_late'
+        )
+    
+    def action_dashboard_today_collections(self):
+        return self.env['ir.actions.act_window']._for_xml_id(
+            'gt_loan_extension.action_loan_installments_today'
+        )
+    
+    def action_dashboard_generate_report(self):
+        """Abre a análise dos empréstimos do mês corrente"""
+        month_start = fields.Date.today().replace(day=1)
+        return {
+            'name': 'Relatório Mensal de Empréstimos',
+            'type': 'ir.actions.act_window',
+            'res_model': 'sale.order',
+            'view_mode': 'pivot,list,form',
+            'domain': [
+                ('is_loan_order', '=', True),
+                ('date_order', '>=', fields.Datetime.to_string(month_start)),
+            ],
+            'context': {'pivot_row_groupby': ['partner_id'], 'pivot_column_groupby': ['loan_status']},
+            'target': 'current',
+        }
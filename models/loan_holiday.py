@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api, tools
+
+import numpy as np
+
+# Segunda a sexta são dias úteis
+BUSINESS_WEEKMASK = '1111100'
+
+class LoanHoliday(models.Model):
+    """Feriados considerados no cálculo dos vencimentos das parcelas.
+    
+    Feriados sem empresa valem para todas as empresas; feriados com estado
+    (feriados estaduais/municipais) valem só para empresas daquele estado.
+    Os feriados são compilados em um calendário de dias úteis do NumPy,
+    mantido em cache no registro sob uma versão da tabela de feriados, de
+    modo que alterar um feriado não invalida o cache do registro inteiro.
+    """
+    _name = 'loan.holiday'
+    _description = 'Feriado para Vencimento de Parcelas'
+    _order = 'date desc'
+    
+    name = fields.Char(string='Descrição', required=True)
+    
+    date = fields.Date(string='Data', required=True, index=True)
+    
+    company_id = fields.Many2one(
+        'res.company',
+        string='Empresa',
+        help='Deixe vazio para aplicar a todas as empresas'
+    )
+    
+    state_id = fields.Many2one(
+        'res.country.state',
+        string='Estado',
+        help='Para feriados estaduais ou municipais; deixe vazio para feriados nacionais'
+    )
+    
+    @api.model
+    def _get_holidays_version(self):
+        """Versão dos feriados: muda a cada inclusão, alteração ou exclusão"""
+        self.flush_model()
+        self.env.cr.execute(f"SELECT COUNT(*), MAX(id), MAX(write_date) FROM {self._table}")
+        return self.env.cr.fetchone()
+    
+    @api.model
+    @tools.ormcache('company_id', 'state_id', 'version')
+    def _get_business_calendar(self, company_id, state_id, version):
+        """Calendário de dias úteis (NumPy) da empresa/estado, em cache no registro"""
+        holidays = self.sudo().search_read([
+            ('company_id', 'in', [company_id, False]),
+            ('state_id', 'in', [state_id, False]),
+        ], ['date'])
+        dates = np.array(sorted({holiday['date'] for holiday in holidays}), dtype='datetime64[D]')
+        return np.busdaycalendar(weekmask=BUSINESS_WEEKMASK, holidays=dates)
+    
+    @api.model
+    def _get_company_calendar(self, company=None):
+        company = company or self.env.company
+        return self._get_business_calendar(company.id, company.state_id.id, self._get_holidays_version())
+    
+    @api.model
+    def _next_business_days(self, dates, company=None):
+        """Primeiro dia útil em ou após cada data (vetorizado)"""
+        calendar = self._get_company_calendar(company)
+        rolled = np.busday_offset(np.asarray(dates, dtype='datetime64[D]'), 0, roll='forward', busdaycal=calendar)
+        return rolled.astype(object).tolist()
+    
+    @api.model
+    def _weekly_due_dates(self, start_dates, counts, company=None):
+        """Vencimentos semanais (início + 7 dias, + 14 dias, ...) ajustados para dias úteis.
+        
+        Calcula os cronogramas de vários empréstimos de uma vez e retorna, para
+        cada data de início, a lista com ``counts[i]`` datas de vencimento.
+        """
+        counts = [max(int(count), 0) for count in counts]
+        if not counts:
+            return []
+        
+        calendar = self._get_company_calendar(company)
+        width = max(counts)
+        starts = np.asarray(start_dates, dtype='datetime64[D]')[:, np.newaxis]
+        nominal = starts + 7 * np.arange(1, width + 1)
+        due_dates = np.busday_offset(nominal, 0, roll='forward', busdaycal=calendar).astype(object)
+        return [due_dates[index, :count].tolist() for index, count in enumerate(counts)]
@@ -1,10 +1,61 @@
 # -*- coding: utf-8 -*-
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
+from odoo.tools import split_every, str2bool
 from odoo.exceptions import UserError, ValidationError
+from collections import defaultdict
+from datetime import timedelta
 import logging
 
+from .loan_installment_event import LOAN_INSTALLMENT_EVENT_TYPES
+from .loan_perf_sample import add_perf_rows, instrument
+from .sale_order import LOAN_OPEN_INSTALLMENT_STATES
+from ..tools.loan_allocation import OpenInstallment, allocate_waterfall
+
 _logger = logging.getLogger(__name__)
 
+# Cursor (write_date das faturas) da última sincronização de pagamentos
+INVOICE_PAYMENT_CURSOR_PARAM = 'gt_loan_extension.invoice_payment_cursor'
+INVOICE_PAYMENT_CURSOR_OVERLAP = timedelta(minutes=10)
+
+# Quantidade de faturas criadas por chamada no faturamento semanal
+INVOICE_BATCH_SIZE = 500
+
+# Parâmetro do sistema que ativa o faturamento consolidado por cliente
+CONSOLIDATED_INVOICING_PARAM = 'gt_loan_extension.consolidated_invoicing'
+
+# Onde as ações nas parcelas são registradas, além do histórico de eventos
+LOAN_AUDIT_MODES = [
+    ('installment', 'Uma mensagem por parcela'),
+    ('order', 'Uma mensagem por empréstimo a cada ação'),
+    ('events', 'Somente histórico de eventos'),
+]
+LOAN_AUDIT_MODE_PARAM = 'gt_loan_extension.audit_mode'
+
+# Parâmetro do sistema que evita criar seguidores nas parcelas
+SKIP_INSTALLMENT_FOLLOWERS_PARAM = 'gt_loan_extension.skip_installment_followers'
+
+# Faixas de atraso (aging): limite superior em dias de cada faixa
+LOAN_AGING_BUCKETS = [
+    ('1_7', '1-7 dias'),
+    ('8_30', '8-30 dias'),
+    ('31_60', '31-60 dias'),
+    ('61_90', '61-90 dias'),
+    ('90_plus', 'Mais de 90 dias'),
+]
+LOAN_AGING_BUCKET_LIMITS = [(7, '1_7'), (30, '8_30'), (60, '31_60'), (90, '61_90')]
+LOAN_AGING_LAST_BUCKET = '90_plus'
+
+
+def get_aging_bucket(days_late):
+    """Faixa de aging para os dias de atraso (False se não está atrasada)"""
+    if days_late <= 0:
+        return False
+    for limit, bucket in LOAN_AGING_BUCKET_LIMITS:
+        if days_late <= limit:
+            return bucket
+    return LOAN_AGING_LAST_BUCKET
+
+
 class LoanInstallment(models.Model):
     _name = 'loan.installment'
     _description = 'Parcela de Empréstimo'
@@ -47,23 +98,60 @@ class LoanInstallment(models.Model):
         required=True
     )
     
+    principal_amount = fields.Monetary(
+        string='Amortização',
+        currency_field='currency_id',
+        help='Parte da parcela que amortiza o valor liberado'
+    )
+    
+    interest_amount = fields.Monetary(
+        string='Juros',
+        currency_field='currency_id',
+        help='Parte da parcela referente aos juros'
+    )
+    
     amount_paid = fields.Monetary(
         string='Valor Pago',
         currency_field='currency_id',
-        default=0.0
+        compute='_compute_amount_paid',
+        inverse='_inverse_amount_paid',
+        store=True,
+        help='Soma dos pagamentos lançados no razão da parcela'
+    )
+    
+    payment_ids = fields.One2many(
+        'loan.payment',
+        'installment_id',
+        string='Pagamentos',
+        readonly=True
     )
     
     payment_date = fields.Date(
         string='Data de Pagamento'
     )
     
+    event_ids = fields.One2many(
+        'loan.installment.event',
+        'installment_id',
+        string='Histórico',
+        readonly=True
+    )
+    
     status = fields.Selection([
         ('pending', 'Pendente'),
         ('paid', 'Pago'),
         ('late', 'Atrasado'),
-        ('partial', 'Parcialmente Pago')
+        ('partial', 'Parcialmente Pago'),
+        ('renegotiated', 'Renegociada')
     ], string='Status', default='pending', compute='_compute_status', store=True)
     
+    is_renegotiated = fields.Boolean(
+        string='Renegociada',
+        readonly=True,
+        copy=False,
+        help='Parcela substituída por um novo cronograma em uma renegociação'
+    )
+    
     currency_id = fields.Many2one(
         'res.currency',
         related='sale_order_id.currency_id',
@@ -71,17 +159,45 @@ class LoanInstallment(models.Model):
         store=True
     )
     
+    # Retrato do atraso: recalculado nas alterações da parcela e, para a
+    # carteira toda, pelo job noturno (a data de hoje muda sem nenhuma escrita)
     days_late = fields.Integer(
         string='Dias em Atraso',
-        compute='_compute_days_late'
+        compute='_compute_days_late',
+        store=True
+    )
+    
+    aging_bucket = fields.Selection(
+        LOAN_AGING_BUCKETS,
+        string='Faixa de Atraso',
+        compute='_compute_days_late',
+        store=True,
+        index='btree_not_null'
     )
     
     # CAMPOS PARA FATURAMENTO INDIVIDUAL
     invoice_id = fields.Many2one(
         'account.move', 
-        string='Fatura Individual', 
+        string='Fatura', 
         readonly=True,
-        help='Fatura específica desta parcela'
+        index='btree_not_null',
+        help='Fatura desta parcela (individual ou consolidada por cliente)'
+    )
+    
+    invoice_amount = fields.Monetary(
+        string='Valor Faturado',
+        currency_field='currency_id',
+        readonly=True,
+        copy=False,
+        help='Valor desta parcela incluído na fatura'
+    )
+    
+    invoice_amount_paid = fields.Monetary(
+        string='Valor Pago via Fatura',
+        currency_field='currency_id',
+        readonly=True,
+        copy=False,
+        help='Valor já creditado na parcela pelo pagamento da fatura'
     )
     
     invoice_state = fields.Selection(
@@ -94,6 +210,18 @@ class LoanInstallment(models.Model):
         compute='_compute_can_generate_invoice'
     )
     
+    def init(self):
+        # Índice composto usado pela atualização agregada de status dos empréstimos
+        tools.create_index(
+            self._cr, 'loan_installment_order_status_due_idx',
+            self._table, ['sale_order_id', 'status', 'due_date'],
+        )
+        # Índice parcial para a varredura noturna de parcelas pendentes vencidas
+        tools.create_index(
+            self._cr, 'loan_installment_pending_due_idx',
+            self._table, ['due_date'], where="status = 'pending'",
+        )
+    
     @api.depends('sale_order_id.name', 'number')
     def _compute_display_name(self):
         for rec in self:
@@ -102,11 +230,181 @@ class LoanInstallment(models.Model):
             else:
                 rec.display_name = f"Parcela {rec.number}"
     
-    @api.depends('due_date', 'amount', 'amount_paid')
+    # ========================================
+    # RAZÃO DE PAGAMENTOS
+    # ========================================
+    
+    def _get_ledger_totals(self):
+        """Soma dos lançamentos do razão por parcela, em uma única consulta"""
+        installment_ids = tuple(self._origin.ids)
+        if not installment_ids:
+            return {}
+        self.env['loan.payment'].flush_model(['installment_id', 'amount'])
+        self.env.cr.execute("""
+            SELECT installment_id, SUM(amount)
+              FROM loan_payment
+             WHERE installment_id IN %s
+          GROUP BY installment_id
+        """, [installment_ids])
+        return dict(self.env.cr.fetchall())
+    
+    @api.depends('payment_ids.amount')
+    def _compute_amount_paid(self):
+        """Valor pago = soma dos lançamentos do razão (agregada no banco)"""
+        totals = self._get_ledger_totals()
+        for installment in self:
+            if installment.id:
+                installment.amount_paid = totals.get(installment.id, 0.0)
+            else:
+                installment.amount_paid = sum(installment.payment_ids.mapped('amount'))
+    
+    def _inverse_amount_paid(self):
+        """Edição manual do valor pago vira um lançamento de ajuste pela diferença"""
+        totals = self._get_ledger_totals()
+        self._create_payments({
+            installment.id: installment.amount_paid - totals.get(installment.id, 0.0)
+            for installment in self
+        }, 'adjustment')
+    
+    def _create_payments(self, amounts, payment_type, date=None, invoices=None, memo=None):
+        """Lança os pagamentos no razão em um único create.
+        
+        ``amounts`` mapeia o id da parcela para o valor recebido (lançamentos
+        zerados são ignorados). Parcelas que ficam quitadas recebem a data de
+        pagamento. Retorna os lançamentos criados.
+        """
+        date = date or fields.Date.context_today(self)
+        invoices = invoices or {}
+        installments = self.browse([
+            installment_id for installment_id, amount in amounts.items() if round(amount, 2)
+        ])
+        if not installments:
+            return self.env['loan.payment']
+        
+        return self._post_payments([
+            installment._prepare_payment_vals(
+                amounts[installment.id], payment_type, date,
+                invoice=invoices.get(installment.id), memo=memo,
+            )
+            for installment in installments
+        ])
+    
+    def _prepare_payment_vals(self, amount, payment_type, date, invoice=None, memo=None):
+        """Valores de um lançamento do razão para a parcela"""
+        self.ensure_one()
+        return {
+            'installment_id': self.id,
+            'sale_order_id': self.sale_order_id.id,
+            'partner_id': self.partner_id.id,
+            'date': date,
+            'amount': amount,
+            'currency_id': self.currency_id.id,
+            'payment_type': payment_type,
+            'invoice_id': invoice.id if invoice else False,
+            'memo': memo,
+        }
+    
+    @api.model
+    def _post_payments(self, vals_list):
+        """Cria os lançamentos em um único create e data as parcelas quitadas"""
+        payments = self.env['loan.payment'].sudo().create(vals_list)
+        
+        last_dates = {}
+        for payment in payments:
+            installment_id = payment.installment_id.id
+            last_dates[installment_id] = max(payment.date, last_dates.get(installment_id, payment.date))
+        
+        # Recalcula o valor pago de todas as parcelas com uma única agregação
+        installments = payments.installment_id.with_env(self.env)
+        settled = installments.filtered(lambda i: i.amount_paid >= i.amount)
+        settled._write_grouped({
+            installment.id: {'payment_date': last_dates[installment.id]} for installment in settled
+        })
+        return payments
+    
+    # ========================================
+    # ALOCAÇÃO DE RECEBIMENTOS EM CASCATA
+    # ========================================
+    
+    @api.model
+    def _get_open_installments_by_partner(self, partner_ids):
+        """Saldos das parcelas abertas por cliente, da mais antiga para a mais nova (uma consulta)"""
+        if not partner_ids:
+            return {}
+        self.flush_model(['partner_id', 'sale_order_id', 'status', 'due_date', 'number', 'amount', 'amount_paid'])
+        self.env.cr.execute("""
+            SELECT id, partner_id, sale_order_id, amount - COALESCE(amount_paid, 0)
+              FROM loan_installment
+             WHERE partner_id IN %s
+               AND status IN ('pending', 'late', 'partial')
+               AND amount - COALESCE(amount_paid, 0) > 0
+          ORDER BY partner_id, due_date, number, id
+        """, [tuple(partner_ids)])
+        open_installments = defaultdict(list)
+        for installment_id, partner_id, order_id, balance in self.env.cr.fetchall():
+            open_installments[partner_id].append(OpenInstallment(installment_id, order_id, balance))
+        return open_installments
+    
+    @api.model
+    def _prepare_payment_allocation(self, receipts):
+        """Calcula em memória a divisão dos recebimentos, sem gravar nada.
+        
+        Cada recebimento é um dicionário com ``partner_id``, ``amount`` e,
+        opcionalmente, ``order_ids``, ``date`` e ``memo``. Retorna (alocações,
+        sobras), como ``allocate_waterfall``.
+        """
+        open_installments = self._get_open_installments_by_partner({receipt['partner_id'] for receipt in receipts})
+        return allocate_waterfall(open_installments, receipts)
+    
+    @api.model
+    @instrument('loan.installment._allocate_payments')
+    def _allocate_payments(self, receipts, payment_type='manual', payment_vals=None):
+        """Aloca os recebimentos nas parcelas abertas (mais antiga primeiro) e lança no razão.
+        
+        Aceita milhares de recebimentos de uma vez: uma consulta para os saldos,
+        um create no razão e uma escrita agrupada nas parcelas. ``payment_vals``
+        é gravado em todos os lançamentos. Retorna (alocações, sobras, lançamentos).
+        """
+        allocations, leftovers = self._prepare_payment_allocation(receipts)
+        if not allocations:
+            return allocations, leftovers, self.env['loan.payment']
+        
+        today = fields.Date.context_today(self)
+        installments = self.browse([installment_id for _index, installment_id, _amount in allocations])
+        vals_list = [
+            dict(installment._prepare_payment_vals(
+                amount, payment_type, receipts[index].get('date') or today, memo=receipts[index].get('memo'),
+            ), **(payment_vals or {}))
+            for (index, _installment_id, amount), installment in zip(allocations, installments)
+        ]
+        payments = self._post_payments(vals_list)
+        
+        amounts = defaultdict(float)
+        for _index, installment_id, amount in allocations:
+            amounts[installment_id] += amount
+        self.browse(list(amounts))._log_events('payment', amounts=amounts, notify=False)
+        
+        _logger.info("Alocados %s recebimento(s) em %s parcela(s)", len(receipts), len(amounts))
+        add_perf_rows(len(payments))
+        return allocations, leftovers, payments
+    
+    @api.model_create_multi
+    def create(self, vals_list):
+        if str2bool(self.env['ir.config_parameter'].sudo().get_param(SKIP_INSTALLMENT_FOLLOWERS_PARAM, 'False')):
+            # Sem seguidores nem mensagem de criação em cada parcela
+            installments = super(LoanInstallment, self.with_context(
+                mail_create_nosubscribe=True, mail_create_nolog=True
+            )).create(vals_list)
+            return installments.with_env(self.env)
+        return super().create(vals_list)
+    
+    @api.depends('due_date', 'amount', 'amount_paid', 'is_renegotiated')
     def _compute_status(self):
         today = fields.Date.today()
         for rec in self:
-            if rec.amount_paid >= rec.amount:
+            if rec.is_renegotiated:
+                rec.status = 'renegotiated'
+            elif rec.amount_paid >= rec.amount:
                 rec.status = 'paid'
             elif rec.amount_paid > 0:
                 rec.status = 'partial'
@@ -119,121 +417,304 @@ class LoanInstallment(models.Model):
     def _compute_days_late(self):
         today = fields.Date.today()
         for rec in self:
-            if rec.status in ['late', 'partial'] and rec.due_date:
+            if rec.status in ['late', 'partial'] and rec.due_date and rec.due_date < today:
                 rec.days_late = (today - rec.due_date).days
             else:
                 rec.days_late = 0
+            rec.aging_bucket = get_aging_bucket(rec.days_late)
     
     @api.depends('status', 'invoice_id')
     def _compute_can_generate_invoice(self):
         """Determina se pode gerar fatura individual"""
         for installment in self:
             installment.can_generate_invoice = (
-                installment.status in ['pending', 'late', 'partial'] and 
+                installment.status in LOAN_OPEN_INSTALLMENT_STATES and 
                 not installment.invoice_id
             )
     
+    # ========================================
+    # HISTÓRICO E CHATTER
+    # ========================================
+    
+    @api.model
+    def _get_audit_mode(self):
+        return self.env['ir.config_parameter'].sudo().get_param(LOAN_AUDIT_MODE_PARAM, 'installment')
+    
+    def _log_events(self, event_type, amounts=None, invoices=None, bodies=None, notify=True):
+        """Registra um evento por parcela e a mensagem no chatter conforme o modo de auditoria.
+        
+        Os eventos são gravados em um único create. ``amounts`` e ``invoices``
+        mapeiam o id da parcela para o valor e a fatura do evento; ``bodies`` traz
+        a mensagem de cada parcela, usada no modo de uma mensagem por parcela.
+        Com ``notify=False`` só o histórico de eventos é gravado.
+        """
+        if not self:
+            return
+        amounts = amounts or {}
+        invoices = invoices or {}
+        
+        self.env['loan.installment.event'].sudo().create([{
+            'installment_id': installment.id,
+            'sale_order_id': installment.sale_order_id.id,
+            'event_type': event_type,
+            'amount': amounts.get(installment.id, 0.0),
+            'currency_id': installment.currency_id.id,
+            'invoice_id': invoices[installment.id].id if installment.id in invoices else False,
+        } for installment in self])
+        
+        if not notify:
+            return
+        
+        # As mensagens são gravadas de uma vez, qualquer que seja o tamanho do lote
+        mode = self._get_audit_mode()
+        if mode == 'installment' and bodies:
+            self._message_log_batch(bodies={installment.id: bodies[installment.id] for installment in self})
+        
+        elif mode == 'order':
+            # Uma mensagem por empréstimo, com uma linha por parcela
+            label = dict(LOAN_INSTALLMENT_EVENT_TYPES)[event_type]
+            order_bodies = {}
+            for order, installments in self.grouped('sale_order_id').items():
+                lines = []
+                for installment in installments:
+                    line = f"Parcela {installment.number}: {installment.currency_id.symbol} {amounts.get(installment.id, 0.0):,.2f}"
+                    if installment.id in invoices:
+                        line += f" ({invoices[installment.id].name})"
+                    lines.append(line)
+                order_bodies[order.id] = f"📋 {label} em {len(installments)} parcela(s)<br/>" + "<br/>".join(lines)
+            self.sale_order_id._message_log_batch(bodies=order_bodies)
+    
+    @instrument('loan.installment.action_register_payment')
     def action_register_payment(self):
         """Registra pagamento total da parcela (MÉTODO ORIGINAL MANTIDO)"""
-        for rec in self:
-            rec.write({
-                'amount_paid': rec.amount,
-                'payment_date': fields.Date.today(),
-            })
-            
-            # Log do pagamento
-            rec.message_post(
-                body=f"💰 Pagamento integral registrado: {rec.currency_id.symbol} {rec.amount:,.2f}"
-            )
+        amounts = {rec.id: rec.amount - rec.amount_paid for rec in self}
+        add_perf_rows(len(self._create_payments(amounts, 'manual')))
+        
+        # Log do pagamento
+        self._log_events('payment', amounts=amounts, bodies={
+            rec.id: f"💰 Pagamento integral registrado: {rec.currency_id.symbol} {rec.amount:,.2f}"
+            for rec in self
+        })
         return True
     
     # ========================================
     # FUNCIONALIDADE CORRIGIDA: FATURAMENTO INDIVIDUAL
     # ========================================
     
-    def action_generate_invoice(self):
-        """Gera fatura individual para a parcela COM VALOR CORRETO DA PARCELA"""
+    def _prepare_invoice_line_vals(self, loan_product, tax_ids):
+        """Monta a linha de fatura da parcela COM VALOR CORRETO DA PARCELA"""
+        self.ensure_one()
+        return {
+            'product_id': loan_product.id,
+            'name': f"Empréstimo - Parcela {self.number}/{self.sale_order_id.loan_weeks} - Venc: {self.due_date.strftime('%d/%m/%Y')}",
+            'quantity': 1,
+            # Valor a faturar = valor da parcela - valor já pago (não o total!)
+            'price_unit': self.amount - self.amount_paid,
+            'tax_ids': [(6, 0, tax_ids)],
+        }
+    
+    def _prepare_invoice_vals(self, loan_product, tax_ids):
+        """Monta os valores da fatura individual da parcela"""
+        self.ensure_one()
+        return {
+            'move_type': 'out_invoice',
+            'partner_id': self.partner_id.id,
+            'invoice_date': fields.Date.today(),
+            'invoice_date_due': self.due_date,
+            'currency_id': self.currency_id.id,
+            'invoice_origin': f"{self.sale_order_id.name} - Parcela {self.number}",
+            'ref': f"Parcela {self.number}/{self.sale_order_id.loan_weeks}",
+            'invoice_line_ids': [(0, 0, self._prepare_invoice_line_vals(loan_product, tax_ids))],
+        }
+    
+    def _prepare_consolidated_invoice_vals(self, loan_product, tax_ids):
+        """Monta uma fatura única para parcelas do mesmo cliente e moeda (uma linha por parcela)"""
+        installments = self.sorted(lambda i: (i.due_date, i.sale_order_id.id, i.number))
+        first = installments[0]
+        return {
+            'move_type': 'out_invoice',
+            'partner_id': first.partner_id.id,
+            'invoice_date': fields.Date.today(),
+            'invoice_date_due': first.due_date,
+            'currency_id': first.currency_id.id,
+            'invoice_origin': ', '.join(installments.sale_order_id.mapped('name')),
+            'ref': f"Parcelas consolidadas ({len(installments)})",
+            'invoice_line_ids': [
+                (0, 0, installment._prepare_invoice_line_vals(loan_product, tax_ids))
+                for installment in installments
+            ],
+        }
+    
+    @instrument('loan.installment._generate_invoices')
+    def _generate_invoices(self, post=False, consolidate=False):
+        """Gera as faturas de todas as parcelas do recordset em lote.
+        
+        O produto de empréstimo e seus impostos são resolvidos uma única vez e
+        todas as faturas são criadas com um único ``create``. No modo consolidado
+        é gerada uma fatura por cliente e moeda, com uma linha por parcela.
+        Retorna as faturas.
+        """
         for installment in self:
             if installment.invoice_id:
                 raise UserError(f"Parcela {installment.number} já possui fatura gerada!")
             
-            if installment.status == 'paid':
-                raise UserError(f"Não é possível gerar fatura para parcela já paga!")
-            
-            _logger.info(f"Gerando fatura individual para parcela {installment.number} do pedido {installment.sale_order_id.name}")
-            
-            # Busca o produto de empréstimo
-            loan_products = self.env['product.product'].search([
-                ('is_loan_product', '=', True)
-            ], limit=1)
-            
-            if not loan_products:
-                raise UserError("Nenhum produto de empréstimo encontrado! Configure um produto com 'É Produto de Empréstimo' marcado.")
-            
-            loan_product = loan_products[0]
-            
-            # ============================================
-            # CORREÇÃO: VALOR DA PARCELA, NÃO DO TOTAL
-            # ============================================
-            
-            # Valor a faturar = valor da parcela - valor já pago
-            amount_to_invoice = installment.amount - installment.amount_paid
+            if installment.status not in LOAN_OPEN_INSTALLMENT_STATES:
+                raise UserError(
+                    f"Parcela {installment.number} de {installment.sale_order_id.name} não está em aberto "
+                    f"({dict(installment._fields['status'].selection)[installment.status]})!"
+                )
             
-            if amount_to_invoice <= 0:
+            if installment.amount - installment.amount_paid <= 0:
                 raise UserError("Não há valor pendente para faturar nesta parcela!")
-            
-            _logger.info(f"Faturando parcela {installment.number}: Valor da parcela = ${installment.amount:.2f}, Já pago = ${installment.amount_paid:.2f}, A faturar = ${amount_to_invoice:.2f}")
-            
-            # Dados da fatura individual
-            invoice_vals = {
-                'move_type': 'out_invoice',
-                'partner_id': installment.partner_id.id,
-                'invoice_date': fields.Date.today(),
-                'invoice_date_due': installment.due_date,
-                'currency_id': installment.currency_id.id,
-                'invoice_origin': f"{installment.sale_order_id.name} - Parcela {installment.number}",
-                'ref': f"Parcela {installment.number}/{installment.sale_order_id.loan_weeks}",
-                'invoice_line_ids': [(0, 0, {
-                    'product_id': loan_product.id,
-                    'name': f"Empréstimo - Parcela {installment.number}/{installment.sale_order_id.loan_weeks} - Venc: {installment.due_date.strftime('%d/%m/%Y')}",
-                    'quantity': 1,
-                    # ===========================
-                    # CORREÇÃO PRINCIPAL AQUI:
-                    # ===========================
-                    'price_unit': amount_to_invoice,  # Valor da parcela, não do total!
-                    'tax_ids': [(6, 0, loan_product.taxes_id.ids)],
-                })],
-            }
-            
-            # Cria a fatura
-            invoice = self.env['account.move'].create(invoice_vals)
-            
-            # Vincula a fatura à parcela
-            installment.write({
+        
+        # Produto de empréstimo e impostos de cada empresa (cache do registro)
+        loan_products = {}
+        for company in self.sale_order_id.company_id:
+            loan_product, tax_ids = self.env['product.product']._get_loan_product(company)
+            if not loan_product:
+                raise UserError("Nenhum produto de empréstimo encontrado! Configure um produto com 'É Produto de Empréstimo' marcado.")
+            loan_products[company.id] = (loan_product, tax_ids)
+        
+        # Parcelas de cada fatura, na mesma ordem dos valores criados
+        if consolidate:
+            groups = self.grouped(lambda i: (i.partner_id, i.currency_id, i.sale_order_id.company_id))
+            invoice_groups = list(groups.values())
+            vals_list = [
+                group._prepare_consolidated_invoice_vals(*loan_products[group.sale_order_id.company_id.id])
+                for group in invoice_groups
+            ]
+        else:
+            invoice_groups = list(self)
+            vals_list = [
+                installment._prepare_invoice_vals(*loan_products[installment.sale_order_id.company_id.id])
+                for installment in self
+            ]
+        
+        _logger.info("Gerando %s faturas para %s parcelas", len(vals_list), len(self))
+        
+        invoices = self.env['account.move'].create(vals_list)
+        
+        # Vincula as faturas às parcelas (várias parcelas podem apontar para a mesma fatura)
+        self._write_grouped({
+            installment.id: {
                 'invoice_id': invoice.id,
-            })
-            
-            # Log da criação
-            installment.message_post(
-                body=f"📄 Fatura individual gerada: {invoice.name}<br/>"
-                     f"💰 Valor faturado: {installment.currency_id.symbol} {amount_to_invoice:,.2f}<br/>"
-                     f"📅 Vencimento: {installment.due_date.strftime('%d/%m/%Y')}<br/>"
-                     f"📋 Parcela {installment.number} de {installment.sale_order_id.loan_weeks}"
-            )
-            
-            _logger.info(f"Fatura individual {invoice.name} criada com sucesso para parcela {installment.number} - Valor: ${amount_to_invoice:.2f}")
-            
-            # Retorna ação para abrir a fatura
+                'invoice_amount': installment.amount - installment.amount_paid,
+            }
+            for group, invoice in zip(invoice_groups, invoices)
+            for installment in group
+        })
+        
+        if post:
+            invoices.action_post()
+        
+        # Log da criação
+        invoice_by_installment = {
+            installment.id: invoice
+            for group, invoice in zip(invoice_groups, invoices)
+            for installment in group
+        }
+        self._log_events(
+            'invoice',
+            amounts={installment.id: installment.invoice_amount for installment in self},
+            invoices=invoice_by_installment,
+            bodies={
+                installment.id: f"📄 Fatura {'consolidada' if consolidate else 'individual'} gerada: "
+                                f"{invoice_by_installment[installment.id].name}<br/>"
+                                f"💰 Valor faturado: {installment.currency_id.symbol} {installment.invoice_amount:,.2f}<br/>"
+                                f"📅 Vencimento: {installment.due_date.strftime('%d/%m/%Y')}<br/>"
+                                f"📋 Parcela {installment.number} de {installment.sale_order_id.loan_weeks}"
+                for installment in self
+            },
+        )
+        add_perf_rows(len(invoices))
+        
+        return invoices
+    
+    def _action_open_invoices(self, invoices):
+        """Abre a fatura gerada (ou a lista, quando houver várias)"""
+        if len(invoices) == 1:
             return {
-                'name': f'Fatura - Parcela {installment.number}',
+                'name': f'Fatura - {invoices.ref or invoices.name}',
                 'type': 'ir.actions.act_window',
                 'res_model': 'account.move',
-                'res_id': invoice.id,
+                'res_id': invoices.id,
                 'view_mode': 'form',
                 'target': 'current',
             }
         
-        return True
+        return {
+            'name': 'Faturas de Parcelas',
+            'type': 'ir.actions.act_window',
+            'res_model': 'account.move',
+            'view_mode': 'list,form',
+            'domain': [('id', 'in', invoices.ids)],
+            'target': 'current',
+        }
+    
+    def action_generate_invoice(self):
+        """Gera fatura individual para cada parcela selecionada"""
+        invoices = self._generate_invoices(post=self.env.context.get('loan_post_invoices', False))
+        return self._action_open_invoices(invoices)
+    
+    def action_generate_consolidated_invoice(self):
+        """Gera uma fatura por cliente e moeda agrupando as parcelas selecionadas"""
+        invoices = self._generate_invoices(
+            post=self.env.context.get('loan_post_invoices', False),
+            consolidate=True,
+        )
+        return self._action_open_invoices(invoices)
+    
+    @api.model
+    def _generate_invoices_for_window(self, date_from, date_to, consolidate=None, post=False):
+        """Fatura, em lotes, as parcelas em aberto que vencem na janela de datas.
+        
+        Se ``consolidate`` não for informado, usa a configuração de faturamento
+        consolidado. Retorna as faturas geradas.
+        """
+        if consolidate is None:
+            consolidate = self._is_consolidated_invoicing()
+        
+        domain = [
+            ('invoice_id', '=', False),
+            ('status', 'in', ['pending', 'late', 'partial']),
+            ('due_date', '<=', date_to),
+        ]
+        if date_from:
+            domain.append(('due_date', '>=', date_from))
+        
+        installments = self.search(domain, order='partner_id, currency_id, due_date, id')
+        installments = installments.filtered(lambda i: i.amount - i.amount_paid > 0)
+        
+        invoices = self.env['account.move']
+        if consolidate:
+            # Os lotes respeitam os grupos cliente/moeda para não dividir uma fatura
+            batch = self.browse()
+            for group in installments.grouped(lambda i: (i.partner_id, i.currency_id, i.sale_order_id.company_id)).values():
+                if batch and len(batch) + len(group) > INVOICE_BATCH_SIZE:
+                    invoices |= batch._generate_invoices(post=post, consolidate=True)
+                    batch = self.browse()
+                batch |= group
+            if batch:
+                invoices |= batch._generate_invoices(post=post, consolidate=True)
+        else:
+            for batch in split_every(INVOICE_BATCH_SIZE, installments.ids, self.browse):
+                invoices |= batch._generate_invoices(post=post)
+        
+        return invoices
+    
+    @api.model
+    def _is_consolidated_invoicing(self):
+        return str2bool(self.env['ir.config_parameter'].sudo().get_param(
+            CONSOLIDATED_INVOICING_PARAM, 'False'
+        ))
+    
+    @api.model
+    @instrument('loan.installment._cron_generate_weekly_invoices')
+    def _cron_generate_weekly_invoices(self):
+        """Fatura todas as parcelas em aberto que vencem nos próximos 7 dias"""
+        today = fields.Date.today()
+        invoices = self._generate_invoices_for_window(None, today + timedelta(days=7), post=True)
+        _logger.info("Faturamento semanal concluído: %s faturas geradas", len(invoices))
 
     def action_view_invoice(self):
         """Abre a fatura da parcela"""
@@ -271,6 +752,7 @@ class LoanInstallment(models.Model):
             }
         }
 
+    @instrument('loan.installment.action_cancel_invoice')
     def action_cancel_invoice(self):
         """Cancela a fatura da parcela"""
         self.ensure_one()
@@ -280,25 +762,42 @@ class LoanInstallment(models.Model):
         if self.invoice_id.state == 'posted' and self.invoice_id.payment_state == 'paid':
             raise UserError("Não é possível cancelar fatura já paga!")
         
-        invoice_name = self.invoice_id.name
-        invoice_amount = self.invoice_id.amount_total
-        
-        # Cancela a fatura
-        if self.invoice_id.state == 'posted':
-            self.invoice_id.button_cancel()
+        invoice = self.invoice_id
+        invoice_name = invoice.name
+        invoice_amount = invoice.amount_total
         
-        self.invoice_id.button_draft()
-        self.invoice_id.unlink()
+        # Histórico gravado antes da exclusão, enquanto a fatura ainda existe
+        installments = invoice.loan_installment_ids
+        installments._log_events(
+            'invoice_cancel',
+            amounts={installment.id: installment.invoice_amount for installment in installments},
+            notify=False,
+        )
         
-        self.write({
-            'invoice_id': False
+        # Desvincula todas as parcelas da fatura (pode ser consolidada)
+        installments.write({
+            'invoice_id': False,
+            'invoice_amount': 0.0,
         })
         
-        # Log do cancelamento
-        self.message_post(
-            body=f"❌ Fatura {invoice_name} cancelada e removida da parcela {self.number}<br/>"
-                 f"💰 Valor cancelado: {self.currency_id.symbol} {invoice_amount:,.2f}"
-        )
+        # Cancela a fatura
+        if invoice.state == 'posted':
+            invoice.button_cancel()
+        
+        invoice.button_draft()
+        invoice.unlink()
+        
+        # Log do cancelamento (a fatura não existe mais, então só no chatter)
+        if self._get_audit_mode() == 'installment':
+            self.message_post(
+                body=f"❌ Fatura {invoice_name} cancelada e removida da parcela {self.number}<br/>"
+                     f"💰 Valor cancelado: {self.currency_id.symbol} {invoice_amount:,.2f}"
+            )
+        elif self._get_audit_mode() == 'order':
+            self.sale_order_id.message_post(
+                body=f"❌ Fatura {invoice_name} cancelada ({len(installments)} parcela(s))<br/>"
+                     f"💰 Valor cancelado: {self.currency_id.symbol} {invoice_amount:,.2f}"
+            )
         
         return True
     
@@ -306,48 +805,211 @@ class LoanInstallment(models.Model):
     # AUTOMAÇÃO DE PAGAMENTOS VIA FATURAS
     # ========================================
     
+    def _write_grouped(self, vals_by_id):
+        """Aplica valores diferentes por registro com uma escrita por grupo de valores iguais"""
+        groups = defaultdict(list)
+        for record_id, vals in vals_by_id.items():
+            groups[tuple(sorted(vals.items()))].append(record_id)
+        for vals, record_ids in groups.items():
+            self.browse(record_ids).write(dict(vals))
+    
     @api.model
-    def _check_invoice_payments(self):
-        """Verifica faturas pagas e atualiza status das parcelas automaticamente"""
-        paid_invoices = self.env['account.move'].search([
-            ('state', '=', 'posted'),
-            ('payment_state', 'in', ['paid', 'in_payment']),
-            ('move_type', '=', 'out_invoice'),
-            ('invoice_origin', 'like', '%Parcela%')
-        ])
+    def _reconcile_invoice_payments(self, since=None, move_ids=None, installment_ids=None):
+        """Sincroniza o valor pago das parcelas com o pagamento das suas faturas.
         
-        updated_count = 0
-        for invoice in paid_invoices:
-            installments = self.search([
-                ('invoice_id', '=', invoice.id),
-                ('status', '!=', 'paid')
-            ])
+        Faturas e parcelas são ligadas por ``invoice_id`` em uma única consulta,
+        filtrando apenas as faturas alteradas desde ``since`` (ou as informadas
+        em ``move_ids``); ``installment_ids`` restringe a um bloco de parcelas.
+        A diferença é lançada no razão de pagamentos e o valor já creditado por
+        cada fatura fica guardado em ``invoice_amount_paid``, então executar
+        duas vezes não duplica o valor.
+        
+        Retorna as parcelas atualizadas.
+        """
+        self.flush_model(['invoice_id', 'amount', 'amount_paid', 'invoice_amount_paid'])
+        self.env['account.move'].flush_model(['state', 'payment_state', 'move_type', 'amount_total'])
+        
+        conditions = ["am.move_type = 'out_invoice'"]
+        if since:
+            conditions.append("am.write_date >= %(since)s")
+        if move_ids:
+            conditions.append("am.id IN %(move_ids)s")
+        if installment_ids:
+            conditions.append("li.id IN %(installment_ids)s")
+        
+        self.env.cr.execute(f"""
+            SELECT sync.id, sync.invoice_paid
+              FROM (
+                  SELECT li.id,
+                         li.invoice_amount_paid,
+                         CASE
+                             WHEN am.state = 'posted' AND am.payment_state IN ('paid', 'in_payment')
+                             THEN COALESCE(NULLIF(li.invoice_amount, 0), am.amount_total)
+                             ELSE 0
+                         END AS invoice_paid
+                    FROM loan_installment li
+                    JOIN account_move am ON am.id = li.invoice_id
+                   WHERE {' AND '.join(conditions)}
+              ) sync
+             WHERE sync.invoice_paid != COALESCE(sync.invoice_amount_paid, 0)
+        """, {'since': since, 'move_ids': tuple(move_ids or ()), 'installment_ids': tuple(installment_ids or ())})
+        invoice_paid_by_id = dict(self.env.cr.fetchall())
+        
+        installments = self.browse(invoice_paid_by_id)
+        amounts = {}
+        for installment in installments:
+            delta = invoice_paid_by_id[installment.id] - installment.invoice_amount_paid
             
-            for installment in installments:
-                # Valor pago é o valor da fatura paga
-                paid_amount = invoice.amount_total
-                total_paid = installment.amount_paid + paid_amount
-                
-                # Não pode pagar mais que o valor da parcela
-                final_paid = min(total_paid, installment.amount)
-                
-                installment.write({
-                    'amount_paid': final_paid,
-                    'payment_date': fields.Date.today() if final_paid >= installment.amount else installment.payment_date
-                })
-                
-                # Log da atualização automática
-                installment.message_post(
-                    body=f"🔄 Status atualizado automaticamente via fatura {invoice.name}<br/>"
-                         f"💰 Valor pago: {installment.currency_id.symbol} {paid_amount:,.2f}<br/>"
-                         f"📊 Total pago na parcela: {installment.currency_id.symbol} {final_paid:,.2f}"
-                )
-                
-                updated_count += 1
-                _logger.info(f"Parcela {installment.number} atualizada automaticamente via fatura {invoice.name} - Valor: ${paid_amount:.2f}")
+            # Não pode pagar mais que o valor da parcela nem ficar negativo
+            final_paid = max(0.0, min(installment.amount_paid + delta, installment.amount))
+            amounts[installment.id] = final_paid - installment.amount_paid
+        
+        # Um lançamento no razão por parcela (estorno quando a fatura deixa de estar paga)
+        installments._create_payments(
+            amounts, 'invoice',
+            invoices={installment.id: installment.invoice_id for installment in installments},
+        )
+        installments._write_grouped({
+            installment.id: {'invoice_amount_paid': invoice_paid_by_id[installment.id]}
+            for installment in installments
+        })
         
-        if updated_count > 0:
-            _logger.info(f"Automação de pagamentos concluída: {updated_count} parcelas atualizadas")
+        # Log da atualização automática
+        installments._log_events(
+            'payment_sync',
+            amounts=amounts,
+            invoices={installment.id: installment.invoice_id for installment in installments},
+            bodies={
+                installment.id: f"🔄 Status atualizado automaticamente via fatura {installment.invoice_id.name}<br/>"
+                                f"💰 Valor pago: {installment.currency_id.symbol} {installment.invoice_amount_paid:,.2f}<br/>"
+                                f"📊 Total pago na parcela: {installment.currency_id.symbol} {installment.amount_paid:,.2f}"
+                for installment in installments
+            },
+        )
+        
+        return installments
+    
+    @api.model
+    @instrument('loan.installment._check_invoice_payments')
+    def _check_invoice_payments(self):
+        """Verifica faturas alteradas desde o último cursor e atualiza as parcelas.
+        
+        As mudanças de pagamento já são propagadas pelas próprias faturas ao fim de
+        cada transação (ver ``account.move``); esta rotina é a rede de segurança.
+        Executada em partições e blocos confirmados um a um (``loan.cron.job``).
+        """
+        since = self.env['ir.config_parameter'].sudo().get_param(INVOICE_PAYMENT_CURSOR_PARAM)
+        if since:
+            # Margem para transações que gravaram antes do cursor e confirmaram depois;
+            # reprocessar é seguro porque a sincronização é idempotente
+            since = fields.Datetime.to_datetime(since) - INVOICE_PAYMENT_CURSOR_OVERLAP
+        
+        self.env['loan.cron.job']._run('invoice_payments', since=since)
+    
+    @api.model
+    def _invoice_payments_job_chunk(self, job, partition, limit):
+        """Próximo bloco de parcelas da partição com faturas alteradas"""
+        self.flush_model(['invoice_id'])
+        self.env['account.move'].flush_model(['move_type', 'write_date'])
+        since_clause = "AND am.write_date >= %(since)s" if job.since else ''
+        self.env.cr.execute(f"""
+            SELECT li.id
+              FROM loan_installment li
+              JOIN account_move am ON am.id = li.invoice_id
+             WHERE am.move_type = 'out_invoice'
+               AND li.id > %(cursor)s
+               AND MOD(li.id, %(partitions)s) = %(index)s
+               {since_clause}
+          ORDER BY li.id
+             LIMIT %(limit)s
+        """, {
+            'since': job.since,
+            'cursor': partition.cursor,
+            'partitions': len(job.partition_ids),
+            'index': partition.index,
+            'limit': limit,
+        })
+        return [row[0] for row in self.env.cr.fetchall()]
+    
+    @api.model
+    def _invoice_payments_job_process(self, job, installment_ids):
+        installments = self._reconcile_invoice_payments(since=job.since, installment_ids=installment_ids)
+        add_perf_rows(len(installments))
+        if installments:
+            _logger.info("Automação de pagamentos: %s parcelas atualizadas", len(installments))
+    
+    @api.model
+    def _invoice_payments_job_finish(self, job):
+        self.env['ir.config_parameter'].sudo().set_param(
+            INVOICE_PAYMENT_CURSOR_PARAM, fields.Datetime.to_string(job.started)
+        )
+    
+    # ========================================
+    # ATUALIZAÇÃO NOTURNA DE STATUS POR DATA
+    # ========================================
+    
+    @api.model
+    @instrument('loan.installment._cron_refresh_late_status')
+    def _cron_refresh_late_status(self):
+        """Marca como atrasadas, em massa, as parcelas pendentes já vencidas.
+        
+        O status é um campo computado armazenado que depende da data de hoje,
+        então precisa ser atualizado quando a data muda, sem nenhuma escrita.
+        Pelo mesmo motivo, o aging da carteira é atualizado em seguida.
+        """
+        self.flush_model(['status', 'due_date', 'amount', 'amount_paid'])
+        self.env.cr.execute("""
+            UPDATE loan_installment
+               SET status = 'late',
+                   write_uid = %s,
+                   write_date = %s
+             WHERE status = 'pending'
+               AND due_date < %s
+               AND amount > 0
+               AND COALESCE(amount_paid, 0) = 0
+         RETURNING id
+        """, [self.env.uid, self.env.cr.now(), fields.Date.today()])
+        installments = self.browse(row[0] for row in self.env.cr.fetchall())
+        
+        if installments:
+            # Invalida o cache e dispara os recomputes dependentes só das ordens afetadas
+            installments.invalidate_recordset(['status', 'write_uid', 'write_date'])
+            installments.modified(['status'])
+            add_perf_rows(len(installments))
+            _logger.info("%s parcelas pendentes marcadas como atrasadas", len(installments))
+        
+        self._refresh_aging()
+    
+    @api.model
+    def _refresh_aging(self):
+        """Atualiza dias de atraso e faixa de aging de toda a carteira em um único UPDATE"""
+        self.flush_model(['status', 'due_date', 'days_late', 'aging_bucket'])
+        bucket_cases = ' '.join(
+            f"WHEN aging.days <= {limit} THEN '{bucket}'" for limit, bucket in LOAN_AGING_BUCKET_LIMITS
+        )
+        self.env.cr.execute(f"""
+            UPDATE loan_installment li
+               SET days_late = aging.days,
+                   aging_bucket = CASE WHEN aging.days <= 0 THEN NULL
+                                       {bucket_cases}
+                                       ELSE '{LOAN_AGING_LAST_BUCKET}' END
+              FROM (
+                  SELECT id,
+                         CASE WHEN status IN ('late', 'partial') AND due_date < %(today)s
+                              THEN %(today)s - due_date
+                              ELSE 0 END AS days
+                    FROM loan_installment
+                   WHERE status IN ('late', 'partial')
+                      OR days_late != 0
+              ) aging
+             WHERE aging.id = li.id
+               AND li.days_late IS DISTINCT FROM aging.days
+         RETURNING li.id
+        """, {'today': fields.Date.today()})
+        installments = self.browse(row[0] for row in self.env.cr.fetchall())
+        installments.invalidate_recordset(['days_late', 'aging_bucket'])
+        add_perf_rows(len(installments))
+        _logger.info("Aging atualizado em %s parcelas", len(installments))
     
     # ========================================
     # VALIDAÇÕES E CONSTRAINTS
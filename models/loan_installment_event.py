@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields
+from odoo.exceptions import UserError
+
+# Tipos de evento registrados nas parcelas
+LOAN_INSTALLMENT_EVENT_TYPES = [
+    ('payment', 'Pagamento Registrado'),
+    ('payment_sync', 'Pagamento Sincronizado via Fatura'),
+    ('invoice', 'Fatura Gerada'),
+    ('invoice_cancel', 'Fatura Cancelada'),
+    ('renegotiation', 'Parcela Renegociada'),
+]
+
+class LoanInstallmentEvent(models.Model):
+    """Histórico compacto das parcelas (somente inclusão).
+    
+    Substitui as mensagens do chatter por parcela: uma linha com colunas
+    tipadas por evento, sem HTML nem seguidores, gravada em lote.
+    """
+    _name = 'loan.installment.event'
+    _description = 'Evento de Parcela de Empréstimo'
+    _order = 'date desc, id desc'
+    _log_access = False
+    
+    installment_id = fields.Many2one(
+        'loan.installment',
+        string='Parcela',
+        required=True,
+        index=True,
+        ondelete='cascade',
+        readonly=True
+    )
+    
+    sale_order_id = fields.Many2one(
+        'sale.order',
+        string='Empréstimo',
+        required=True,
+        index=True,
+        ondelete='cascade',
+        readonly=True
+    )
+    
+    event_type = fields.Selection(
+        LOAN_INSTALLMENT_EVENT_TYPES,
+        string='Evento',
+        required=True,
+        readonly=True
+    )
+    
+    date = fields.Datetime(
+        string='Data',
+        required=True,
+        default=fields.Datetime.now,
+        readonly=True
+    )
+    
+    user_id = fields.Many2one(
+        'res.users',
+        string='Usuário',
+        default=lambda self: self.env.uid,
+        readonly=True
+    )
+    
+    amount = fields.Monetary(
+        string='Valor',
+        currency_field='currency_id',
+        readonly=True
+    )
+    
+    currency_id = fields.Many2one(
+        'res.currency',
+        string='Moeda',
+        readonly=True
+    )
+    
+    invoice_id = fields.Many2one(
+        'account.move',
+        string='Fatura',
+        ondelete='set null',
+        readonly=True
+    )
+    
+    def write(self, vals):
+        raise UserError("O histórico de eventos das parcelas não pode ser alterado!")
+    
+    def unlink(self):
+        if not self.env.su:
+            raise UserError("O histórico de eventos das parcelas não pode ser excluído!")
+        return super().unlink()
@@ -0,0 +1,166 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api, tools
+from odoo.exceptions import UserError
+
+# Origem de cada lançamento do razão de pagamentos
+LOAN_PAYMENT_TYPES = [
+    ('manual', 'Pagamento Manual'),
+    ('invoice', 'Pagamento via Fatura'),
+    ('import', 'Importação de Extrato'),
+    ('adjustment', 'Ajuste de Valor Pago'),
+    ('renegotiation', 'Quitação por Renegociação'),
+    ('opening', 'Saldo Inicial'),
+    ('reversal', 'Estorno'),
+]
+
+# Lançamentos que não representam dinheiro recebido (fora dos relatórios de caixa)
+LOAN_NON_CASH_PAYMENT_TYPES = ('renegotiation', 'opening')
+
+class LoanPayment(models.Model):
+    """Razão de pagamentos das parcelas (somente inclusão).
+    
+    Cada recebimento é uma linha; estornos são lançamentos negativos que
+    apontam para o lançamento original. O valor pago da parcela é a soma
+    dos seus lançamentos.
+    """
+    _name = 'loan.payment'
+    _description = 'Pagamento de Parcela de Empréstimo'
+    _order = 'date desc, id desc'
+    
+    installment_id = fields.Many2one(
+        'loan.installment',
+        string='Parcela',
+        required=True,
+        index=True,
+        ondelete='cascade',
+        readonly=True
+    )
+    
+    sale_order_id = fields.Many2one(
+        'sale.order',
+        string='Empréstimo',
+        required=True,
+        ondelete='cascade',
+        readonly=True
+    )
+    
+    partner_id = fields.Many2one(
+        'res.partner',
+        string='Cliente',
+        required=True,
+        readonly=True
+    )
+    
+    date = fields.Date(
+        string='Data do Pagamento',
+        required=True,
+        default=fields.Date.context_today,
+        index=True,
+        readonly=True
+    )
+    
+    amount = fields.Monetary(
+        string='Valor',
+        currency_field='currency_id',
+        required=True,
+        readonly=True,
+        help='Valor recebido (negativo nos estornos)'
+    )
+    
+    currency_id = fields.Many2one(
+        'res.currency',
+        string='Moeda',
+        readonly=True
+    )
+    
+    payment_type = fields.Selection(
+        LOAN_PAYMENT_TYPES,
+        string='Origem',
+        required=True,
+        default='manual',
+        readonly=True
+    )
+    
+    invoice_id = fields.Many2one(
+        'account.move',
+        string='Fatura',
+        ondelete='set null',
+        readonly=True
+    )
+    
+    reversed_payment_id = fields.Many2one(
+        'loan.payment',
+        string='Estorno de',
+        index='btree_not_null',
+        ondelete='restrict',
+        readonly=True
+    )
+    
+    memo = fields.Char(
+        string='Referência',
+        readonly=True
+    )
+    
+    import_id = fields.Many2one(
+        'loan.payment.import',
+        string='Importação',
+        index='btree_not_null',
+        ondelete='restrict',
+        readonly=True
+    )
+    
+    @api.depends('installment_id', 'date')
+    def _compute_display_name(self):
+        for payment in self:
+            payment.display_name = f"{payment.installment_id.display_name} - {payment.date.strftime('%d/%m/%Y') if payment.date else ''}"
+    
+    def init(self):
+        # Relatórios de caixa e extratos por empréstimo/cliente são varreduras por período
+        tools.create_index(
+            self.env.cr, 'loan_payment_order_date_idx',
+            self._table, ['sale_order_id', 'date'],
+        )
+        tools.create_index(
+            self.env.cr, 'loan_payment_partner_date_idx',
+            self._table, ['partner_id', 'date'],
+        )
+    
+    def write(self, vals):
+        raise UserError("Pagamentos não podem ser alterados; registre um estorno.")
+    
+    def unlink(self):
+        if not self.env.su:
+            raise UserError("Pagamentos não podem ser excluídos; registre um estorno.")
+        return super().unlink()
+    
+    def action_reverse(self):
+        """Estorna os pagamentos com lançamentos negativos"""
+        if self.filtered(lambda p: p.payment_type == 'reversal'):
+            raise UserError("Não é possível estornar um estorno!")
+        
+        already_reversed = self.search([('reversed_payment_id', 'in', self.ids)]).reversed_payment_id
+        if already_reversed:
+            raise UserError(f"Pagamentos já estornados: {', '.join(already_reversed.mapped('display_name'))}")
+        
+        reversals = self.create([{
+            'installment_id': payment.installment_id.id,
+            'sale_order_id': payment.sale_order_id.id,
+            'partner_id': payment.partner_id.id,
+            'amount': -payment.amount,
+            'currency_id': payment.currency_id.id,
+            'payment_type': 'reversal',
+            'invoice_id': payment.invoice_id.id,
+            'reversed_payment_id': payment.id,
+            'import_id': payment.import_id.id,
+            'memo': f"Estorno de {payment.memo or payment.display_name}",
+        } for payment in self])
+        
+        installments = self.installment_id
+        installments.filtered(lambda i: i.amount_paid < i.amount).write({'payment_date': False})
+        installments._log_events('payment', amounts={
+            installment.id: sum(reversals.filtered(lambda r: r.installment_id == installment).mapped('amount'))
+            for installment in installments
+        }, bodies={
+            installment.id: "↩️ Pagamento estornado" for installment in installments
+        })
+        return True
@@ -0,0 +1,302 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+from odoo.tools import split_every
+import hashlib
+import logging
+import os
+
+from .loan_perf_sample import add_perf_rows, instrument
+from ..tools.loan_statement import STATEMENT_FORMATS, build_match_index, iter_statement_records, match_record
+
+_logger = logging.getLogger(__name__)
+
+# Recebimentos aplicados (e confirmados no banco) por bloco
+PAYMENT_IMPORT_CHUNK_SIZE = 2000
+
+# Diretório do servidor de onde os arquivos podem ser importados
+PAYMENT_IMPORT_DIR_PARAM = 'gt_loan_extension.payment_import_dir'
+
+class LoanPaymentImport(models.Model):
+    """Importação de extratos/retornos bancários com baixa das parcelas.
+    
+    O arquivo é lido em fluxo e processado em blocos pelo job agendado: cada
+    bloco é conciliado, alocado nas parcelas e confirmado no banco junto com
+    a linha do arquivo já processada, de onde a importação continua se for
+    interrompida.
+    """
+    _name = 'loan.payment.import'
+    _description = 'Importação de Recebimentos'
+    _order = 'id desc'
+    
+    name = fields.Char(
+        string='Descrição',
+        required=True,
+        default=lambda self: f"Importação {fields.Date.context_today(self).strftime('%d/%m/%Y')}"
+    )
+    
+    file_path = fields.Char(
+        string='Arquivo',
+        required=True,
+        help='Caminho do arquivo, relativo ao diretório de importação configurado'
+    )
+    
+    file_checksum = fields.Char(
+        string='Hash do Arquivo',
+        index=True,
+        readonly=True,
+        copy=False
+    )
+    
+    file_format = fields.Selection(
+        STATEMENT_FORMATS,
+        string='Formato',
+        required=True,
+        default='csv'
+    )
+    
+    state = fields.Selection([
+        ('draft', 'Rascunho'),
+        ('queued', 'Na Fila'),
+        ('running', 'Processando'),
+        ('done', 'Concluída'),
+        ('failed', 'Falhou')
+    ], string='Situação', default='draft', required=True, readonly=True)
+    
+    chunk_size = fields.Integer(
+        string='Registros por Bloco',
+        default=PAYMENT_IMPORT_CHUNK_SIZE
+    )
+    
+    checkpoint_line = fields.Integer(
+        string='Última Linha Processada',
+        readonly=True,
+        copy=False
+    )
+    
+    record_count = fields.Integer(string='Registros Lidos', readonly=True, copy=False)
+    
+    matched_count = fields.Integer(string='Conciliados', readonly=True, copy=False)
+    
+    unmatched_count = fields.Integer(string='Não Conciliados', readonly=True, copy=False)
+    
+    currency_id = fields.Many2one(
+        'res.currency',
+        string='Moeda',
+        default=lambda self: self.env.company.currency_id,
+        readonly=True
+    )
+    
+    matched_amount = fields.Monetary(
+        string='Valor Baixado',
+        currency_field='currency_id',
+        readonly=True,
+        copy=False
+    )
+    
+    unmatched_amount = fields.Monetary(
+        string='Valor sem Parcela',
+        currency_field='currency_id',
+        readonly=True,
+        copy=False
+    )
+    
+    unmatched_log = fields.Text(
+        string='Registros Não Conciliados',
+        readonly=True,
+        copy=False
+    )
+    
+    error_message = fields.Text(
+        string='Erro',
+        readonly=True,
+        copy=False
+    )
+    
+    # ========================================
+    # AÇÕES
+    # ========================================
+    
+    def action_import(self):
+        """Coloca a importação na fila do job agendado"""
+        for payment_import in self:
+            checksum = payment_import._compute_file_checksum()
+            duplicate = self.search([
+                ('id', '!=', payment_import.id),
+                ('file_checksum', '=', checksum),
+                ('state', '!=', 'draft'),
+            ], limit=1)
+            if duplicate:
+                raise UserError(f"Este arquivo já foi importado em {duplicate.name}!")
+            payment_import.file_checksum = checksum
+        self.write({'state': 'queued', 'error_message': False})
+        self.env.ref('gt_loan_extension.ir_cron_process_payment_imports')._trigger()
+        return True
+    
+    def action_reset(self):
+        """Estorna os recebimentos lançados e volta para rascunho, do início do arquivo"""
+        if self.filtered(lambda i: i.state in ('queued', 'running')):
+            raise UserError("Não é possível reiniciar uma importação em andamento!")
+        payments = self.env['loan.payment'].search([
+            ('import_id', 'in', self.ids),
+            ('payment_type', '=', 'import'),
+        ])
+        reversed_payments = self.env['loan.payment'].search([('reversed_payment_id', 'in', payments.ids)])
+        (payments - reversed_payments.reversed_payment_id).action_reverse()
+        self.write({
+            'state': 'draft',
+            'checkpoint_line': 0,
+            'record_count': 0,
+            'matched_count': 0,
+            'unmatched_count': 0,
+            'matched_amount': 0.0,
+            'unmatched_amount': 0.0,
+            'unmatched_log': False,
+            'error_message': False,
+        })
+        return True
+    
+    # ========================================
+    # PROCESSAMENTO
+    # ========================================
+    
+    def _get_file_path(self):
+        """Caminho absoluto do arquivo, que precisa estar no diretório de importação"""
+        self.ensure_one()
+        import_dir = self.env['ir.config_parameter'].sudo().get_param(PAYMENT_IMPORT_DIR_PARAM)
+        if not import_dir:
+            raise UserError("Configure o diretório de importação de recebimentos nas configurações de Vendas!")
+        import_dir = os.path.realpath(import_dir)
+        path = os.path.realpath(os.path.join(import_dir, self.file_path))
+        if os.path.commonpath([import_dir, path]) != import_dir or not os.path.isfile(path):
+            raise UserError(f"Arquivo não encontrado no diretório de importação: {self.file_path}")
+        return path
+    
+    def _compute_file_checksum(self):
+        """SHA-1 do conteúdo do arquivo (lido em blocos)"""
+        digest = hashlib.sha1()
+        with open(self._get_file_path(), 'rb') as statement:
+            for block in iter(lambda: statement.read(1024 * 1024), b''):
+                digest.update(block)
+        return digest.hexdigest()
+    
+    @api.model
+    def _get_posted_memos(self, records):
+        """(referência, data) dos registros que já têm recebimento importado e não estornado"""
+        memos = {record.memo for record in records if record.memo}
+        if not memos:
+            return set()
+        self.env['loan.payment'].flush_model(['memo', 'date', 'payment_type', 'reversed_payment_id'])
+        self.env.cr.execute("""
+            SELECT lp.memo, lp.date
+              FROM loan_payment lp
+             WHERE lp.payment_type = 'import'
+               AND lp.memo IN %s
+               AND NOT EXISTS (
+                   SELECT 1 FROM loan_payment rev WHERE rev.reversed_payment_id = lp.id
+               )
+        """, [tuple(memos)])
+        return set(self.env.cr.fetchall())
+    
+    @api.model
+    def _build_match_index(self):
+        """Índice em memória das parcelas abertas (uma consulta)"""
+        self.env['loan.installment'].flush_model(['partner_id', 'sale_order_id', 'status', 'amount', 'amount_paid'])
+        self.env['res.partner'].flush_model(['cpf_digits', 'cnpj_digits'])
+        self.env.cr.execute("""
+            SELECT li.partner_id,
+                   li.sale_order_id,
+                   so.name,
+                   rp.cpf_digits,
+                   rp.cnpj_digits,
+                   li.amount - COALESCE(li.amount_paid, 0)
+              FROM loan_installment li
+              JOIN sale_order so ON so.id = li.sale_order_id
+              JOIN res_partner rp ON rp.id = li.partner_id
+             WHERE li.status IN ('pending', 'late', 'partial')
+               AND li.amount - COALESCE(li.amount_paid, 0) > 0
+        """)
+        return build_match_index(self.env.cr.fetchall())
+    
+    @instrument('loan.payment.import._process_chunk')
+    def _process_chunk(self, index, records):
+        """Concilia e aplica um bloco de registros; atualiza o checkpoint"""
+        self.ensure_one()
+        receipts = []
+        unmatched = []
+        duplicates = []
+        today = fields.Date.context_today(self)
+        posted = self._get_posted_memos(records)
+        for record in records:
+            key = (record.memo, record.date or today)
+            if record.memo and key in posted:
+                duplicates.append(record)
+                continue
+            if record.memo:
+                # Repetido dentro do próprio arquivo
+                posted.add(key)
+            receipt = match_record(index, record)
+            if receipt:
+                receipts.append(receipt)
+            else:
+                unmatched.append(record)
+        
+        add_perf_rows(len(records))
+        _allocations, leftovers, payments = self.env['loan.installment']._allocate_payments(
+            receipts, payment_type='import', payment_vals={'import_id': self.id}
+        )
+        
+        log_lines = [
+            f"Linha {record.line_number}: {record.document or '-'} / {record.reference or '-'} / {record.amount:,.2f}"
+            for record in unmatched
+        ]
+        log_lines += [
+            f"Linha {record.line_number}: {record.memo} já lançado, ignorado"
+            for record in duplicates
+        ]
+        log_lines += [
+            f"{receipt['memo'] or '-'}: sobra de {leftover:,.2f} sem parcela aberta"
+            for receipt, leftover in zip(receipts, leftovers) if leftover > 0
+        ]
+        
+        self.write({
+            'checkpoint_line': records[-1].line_number,
+            'record_count': self.record_count + len(records),
+            'matched_count': self.matched_count + len(receipts),
+            'unmatched_count': self.unmatched_count + len(unmatched),
+            'matched_amount': self.matched_amount + sum(payments.mapped('amount')),
+            'unmatched_amount': self.unmatched_amount + sum(record.amount for record in unmatched) + sum(leftovers),
+            'unmatched_log': '\n'.join(filter(None, [self.unmatched_log] + log_lines)) or False,
+        })
+    
+    def _process(self, commit=False):
+        """Lê o arquivo a partir do checkpoint e aplica os recebimentos em blocos"""
+        self.ensure_one()
+        index = self._build_match_index()
+        records = iter_statement_records(self._get_file_path(), self.file_format, start_line=self.checkpoint_line)
+        
+        for chunk in split_every(self.chunk_size or PAYMENT_IMPORT_CHUNK_SIZE, records, list):
+            self._process_chunk(index, chunk)
+            if commit:
+                # Pagamentos do bloco e checkpoint confirmados juntos
+                self.env.cr.commit()
+            _logger.info("Importação %s: %s registros processados (linha %s)",
+                         self.id, self.record_count, self.checkpoint_line)
+        
+        self.state = 'done'
+    
+    @api.model
+    @instrument('loan.payment.import._cron_process_imports')
+    def _cron_process_imports(self):
+        """Processa as importações na fila, confirmando cada bloco no banco"""
+        for payment_import in self.search([('state', 'in', ('queued', 'running'))], order='id'):
+            payment_import.state = 'running'
+            self.env.cr.commit()
+            try:
+                payment_import._process(commit=True)
+                self.env.cr.commit()
+            except Exception as error:
+                self.env.cr.rollback()
+                _logger.exception("Falha na importação de recebimentos %s", payment_import.id)
+                payment_import.write({'state': 'failed', 'error_message': str(error)})
+                self.env.cr.commit()
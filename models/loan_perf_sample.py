@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+import functools
+import logging
+import random
+import threading
+import time
+
+_logger = logging.getLogger(__name__)
+
+# Fração das chamadas gravadas (0 desativa a amostragem) e limite, em
+# segundos, a partir do qual toda chamada é gravada (0 desativa)
+PERF_SAMPLE_RATE_PARAM = 'gt_loan_extension.perf_sample_rate'
+PERF_SLOW_THRESHOLD_PARAM = 'gt_loan_extension.perf_slow_threshold'
+
+# Dias de retenção das amostras (limpeza pelo autovacuum)
+PERF_SAMPLE_RETENTION_DAYS = 30
+
+# Quantidade de ids guardados por amostra, para localizar o empréstimo lento
+PERF_SAMPLE_MAX_IDS = 20
+
+_current_sample = ContextVar('loan_perf_sample', default=None)
+
+
+def add_perf_rows(count):
+    """Soma linhas afetadas à medição em andamento (se houver)"""
+    sample = _current_sample.get()
+    if sample is not None:
+        sample['rows'] += count
+
+
+@contextmanager
+def perf_sample(records, operation):
+    """Mede tempo, consultas SQL e linhas afetadas do bloco.
+    
+    A amostra só é gravada quando o bloco termina sem erro, conforme a
+    amostragem configurada ou se a chamada passou do limite de lentidão.
+    """
+    cr = records.env.cr
+    thread = threading.current_thread()
+    if not hasattr(thread, 'query_time'):
+        # O cursor só acumula o tempo das consultas nas threads que têm os contadores
+        thread.query_count = 0
+        thread.query_time = 0
+    
+    sample = {'rows': 0}
+    token = _current_sample.set(sample)
+    query_count = cr.sql_log_count
+    query_time = thread.query_time
+    started = time.perf_counter()
+    try:
+        yield sample
+    finally:
+        _current_sample.reset(token)
+    
+    records.env['loan.perf.sample']._record(
+        operation, records,
+        duration=time.perf_counter() - started,
+        query_count=cr.sql_log_count - query_count,
+        query_time=thread.query_time - query_time,
+        rows=sample['rows'],
+    )
+
+
+def instrument(operation):
+    """Decorador de métodos: mede cada chamada com ``perf_sample``"""
+    def decorator(method):
+        @functools.wraps(method)
+        def wrapper(self, *args, **kwargs):
+            with perf_sample(self, operation):
+                return method(self, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+class LoanPerfSample(models.Model):
+    """Amostras de desempenho das ações e jobs dos empréstimos"""
+    _name = 'loan.perf.sample'
+    _description = 'Amostra de Desempenho de Empréstimos'
+    _order = 'date desc, id desc'
+    _rec_name = 'operation'
+    _log_access = False
+    
+    operation = fields.Char(string='Operação', required=True, index=True, readonly=True)
+    date = fields.Datetime(string='Data', required=True, default=fields.Datetime.now, index=True, readonly=True)
+    user_id = fields.Many2one('res.users', string='Usuário', readonly=True)
+    res_model = fields.Char(string='Modelo', readonly=True)
+    res_id = fields.Integer(string='Primeiro Registro', readonly=True)
+    res_ids = fields.Char(string='Registros', readonly=True, help=f'Até {PERF_SAMPLE_MAX_IDS} ids do lote')
+    batch_size = fields.Integer(string='Tamanho do Lote', readonly=True, aggregator='avg')
+    rows = fields.Integer(string='Linhas Afetadas', readonly=True, aggregator='avg')
+    duration = fields.Float(string='Duração (s)', digits=(16, 4), readonly=True, aggregator='avg')
+    query_count = fields.Integer(string='Consultas SQL', readonly=True, aggregator='avg')
+    query_time = fields.Float(string='Tempo SQL (s)', digits=(16, 4), readonly=True, aggregator='avg')
+    slow = fields.Boolean(string='Lenta', readonly=True)
+    
+    @api.model
+    def _record(self, operation, records, duration, query_count, query_time, rows):
+        """Grava a medição se ela for amostrada ou lenta"""
+        ICP = self.env['ir.config_parameter'].sudo()
+        sample_rate = float(ICP.get_param(PERF_SAMPLE_RATE_PARAM) or 0.0)
+        slow_threshold = float(ICP.get_param(PERF_SLOW_THRESHOLD_PARAM) or 0.0)
+        slow = bool(slow_threshold) and duration >= slow_threshold
+        
+        if _logger.isEnabledFor(logging.DEBUG):
+            _logger.debug(
+                "%s: %s registro(s), %s linha(s), %.4fs, %s consultas (%.4fs)",
+                operation, len(records), rows, duration, query_count, query_time
+            )
+        
+        if not slow and (sample_rate <= 0 or random.random() >= sample_rate):
+            return
+        
+        self.sudo().create({
+            'operation': operation,
+            'user_id': self.env.uid,
+            'res_model': records._name,
+            'res_id': records.ids[0] if records.ids else 0,
+            'res_ids': ','.join(map(str, records.ids[:PERF_SAMPLE_MAX_IDS])),
+            'batch_size': len(records),
+            'rows': rows,
+            'duration': duration,
+            'query_count': query_count,
+            'query_time': query_time,
+            'slow': slow,
+        })
+        if slow:
+            _logger.warning(
+                "Operação lenta %s: %.3fs, %s consultas, %s registro(s) de %s (%s)",
+                operation, duration, query_count, len(records), records._name, records.ids[:PERF_SAMPLE_MAX_IDS]
+            )
+    
+    @api.autovacuum
+    def _gc_perf_samples(self):
+        """Remove as amostras mais antigas que o período de retenção"""
+        limit_date = fields.Datetime.now() - timedelta(days=PERF_SAMPLE_RETENTION_DAYS)
+        self.env.cr.execute("DELETE FROM loan_perf_sample WHERE date < %s", [limit_date])
+    
+    def action_open_records(self):
+        """Abre os registros medidos pela amostra"""
+        self.ensure_one()
+        ids = [int(res_id) for res_id in (self.res_ids or '').split(',') if res_id]
+        return {
+            'name': self.operation,
+            'type': 'ir.actions.act_window',
+            'res_model': self.res_model,
+            'view_mode': 'list,form',
+            'domain': [('id', 'in', ids)],
+            'target': 'current',
+        }
@@ -1,5 +1,8 @@
 # -*- coding: utf-8 -*-
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
+
+# Campos cuja alteração invalida o cache de produtos de empréstimo
+LOAN_PRODUCT_CACHE_FIELDS = {'is_loan_product', 'taxes_id', 'company_id', 'active'}
 
 class ProductTemplate(models.Model):
     _inherit = 'product.template'
@@ -27,3 +30,79 @@ class ProductTemplate(models.Model):
         if self.is_loan_product:
             self.type = 'service'
             self.invoice_policy = 'order'
+    
+    @api.model_create_multi
+    def create(self, vals_list):
+        templates = super().create(vals_list)
+        if any(vals.get('is_loan_product') for vals in vals_list):
+            self.env.registry.clear_cache()
+        return templates
+    
+    def write(self, vals):
+        # Só invalida o cache quando algum produto de empréstimo é afetado
+        touches_cache = bool(LOAN_PRODUCT_CACHE_FIELDS.intersection(vals))
+        had_loan_products = touches_cache and any(self.mapped('is_loan_product'))
+        res = super().write(vals)
+        if touches_cache and (had_loan_products or any(self.mapped('is_loan_product'))):
+            self.env.registry.clear_cache()
+        return res
+    
+    def unlink(self):
+        has_loan_products = any(self.mapped('is_loan_product'))
+        res = super().unlink()
+        if has_loan_products:
+            self.env.registry.clear_cache()
+        return res
+
+class ProductProduct(models.Model):
+    _inherit = 'product.product'
+    
+    @api.model
+    @tools.ormcache()
+    def _get_loan_product_ids(self):
+        """Ids de todos os produtos de empréstimo, inclusive arquivados (cache do registro).
+        
+        Classifica as linhas das ordens existentes, que continuam sendo de
+        empréstimo depois que o produto é arquivado.
+        """
+        return frozenset(self.sudo().with_context(active_test=False).search([('is_loan_product', '=', True)]).ids)
+    
+    @api.model
+    @tools.ormcache('company_id')
+    def _get_loan_product_data(self, company_id):
+        """Produto de empréstimo padrão da empresa e seus impostos (cache do registro).
+        
+        Um produto da própria empresa tem prioridade sobre um produto compartilhado.
+        """
+        products = self.sudo().browse(self._get_loan_product_ids()).filtered(
+            lambda p: p.active and p.company_id.id in (company_id, False)
+        )
+        if not products:
+            return False, ()
+        
+        product = min(products, key=lambda p: (p.company_id.id != company_id, p.id))
+        taxes = product.taxes_id._filter_taxes_by_company(self.env['res.company'].browse(company_id))
+        return product.id, tuple(taxes.ids)
+    
+    @api.model
+    def _get_loan_product(self, company=None):
+        """Retorna (produto de empréstimo, ids dos impostos) da empresa informada ou atual"""
+        company = company or self.env.company
+        product_id, tax_ids = self._get_loan_product_data(company.id)
+        return self.browse(product_id), list(tax_ids)
+    
+    @api.model_create_multi
+    def create(self, vals_list):
+        products = super().create(vals_list)
+        if any(products.mapped('is_loan_product')):
+            self.env.registry.clear_cache()
+        return products
+    
+    def write(self, vals):
+        # Só invalida o cache quando algum produto de empréstimo é afetado
+        touches_cache = bool(LOAN_PRODUCT_CACHE_FIELDS.intersection(vals))
+        had_loan_products = touches_cache and any(self.mapped('is_loan_product'))
+        res = super().write(vals)
+        if touches_cache and (had_loan_products or any(self.mapped('is_loan_product'))):
+            self.env.registry.clear_cache()
+        return res
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields
+
+from .loan_installment import LOAN_AUDIT_MODES
+from .loan_cron_job import LOAN_CRON_DEFAULT_PARTITIONS, LOAN_CRON_PARTITIONS_PARAM
+from .loan_payment_import import PAYMENT_IMPORT_DIR_PARAM
+from .loan_perf_sample import PERF_SAMPLE_RATE_PARAM, PERF_SLOW_THRESHOLD_PARAM
+
+class ResConfigSettings(models.TransientModel):
+    _inherit = 'res.config.settings'
+    
+    loan_consolidated_invoicing = fields.Boolean(
+        string='Faturamento Consolidado de Parcelas',
+        config_parameter='gt_loan_extension.consolidated_invoicing',
+        help='No faturamento semanal, gera uma única fatura por cliente e moeda '
+             'com uma linha por parcela, em vez de uma fatura por parcela'
+    )
+    
+    loan_audit_mode = fields.Selection(
+        LOAN_AUDIT_MODES,
+        string='Registro das Ações nas Parcelas',
+        default='installment',
+        config_parameter='gt_loan_extension.audit_mode',
+        help='As ações sempre ficam no histórico de eventos das parcelas; aqui se escolhe '
+             'se também geram mensagens no chatter, por parcela ou uma por empréstimo'
+    )
+    
+    loan_skip_installment_followers = fields.Boolean(
+        string='Parcelas sem Seguidores',
+        config_parameter='gt_loan_extension.skip_installment_followers',
+        help='Não inscreve seguidores nem registra mensagem de criação nas novas parcelas'
+    )
+    
+    loan_perf_sample_rate = fields.Float(
+        string='Amostragem de Desempenho',
+        config_parameter=PERF_SAMPLE_RATE_PARAM,
+        help='Fração das chamadas das ações e jobs de empréstimos gravadas nas amostras '
+             'de desempenho (0 desativa, 1 grava todas)'
+    )
+    
+    loan_perf_slow_threshold = fields.Float(
+        string='Limite de Operação Lenta (s)',
+        config_parameter=PERF_SLOW_THRESHOLD_PARAM,
+        help='Chamadas que demoram pelo menos este tempo são sempre gravadas e registradas '
+             'no log (0 desativa)'
+    )
+    
+    loan_payment_import_dir = fields.Char(
+        string='Diretório de Importação de Recebimentos',
+        config_parameter=PAYMENT_IMPORT_DIR_PARAM,
+        help='Diretório do servidor de onde os extratos e retornos bancários são lidos; '
+             'arquivos fora dele são recusados'
+    )
+    
+    loan_cron_partitions = fields.Integer(
+        string='Partições dos Jobs',
+        default=LOAN_CRON_DEFAULT_PARTITIONS,
+        config_parameter=LOAN_CRON_PARTITIONS_PARAM,
+        help='Em quantas partições as rotinas de status dos empréstimos e de pagamentos de '
+             'faturas são divididas; cada partição é processada por um cron por vez'
+    )
@@ -1,7 +1,15 @@
 # -*- coding: utf-8 -*-
-from odoo import models, fields, api
+from odoo import models, fields, api, tools
 from odoo.exceptions import ValidationError
-import re
+from odoo.osv import expression
+import logging
+
+from ..tools.br_document import CPF_LENGTH, CNPJ_LENGTH, clean_document, validate_cpfs, validate_cnpjs
+
+_logger = logging.getLogger(__name__)
+
+# Operadores de busca por CPF/CNPJ redirecionados para a coluna só de dígitos
+DOCUMENT_SEARCH_OPERATORS = ('=', 'like', 'ilike')
 
 class ResPartner(models.Model):
     _inherit = 'res.partner'
@@ -10,12 +18,14 @@ class ResPartner(models.Model):
     cpf = fields.Char(
         string='CPF',
         size=14,
+        copy=False,
         help='CPF do contato'
     )
     
     cnpj = fields.Char(
         string='CNPJ', 
         size=18,
+        copy=False,
         help='CNPJ do contato'
     )
     
@@ -32,101 +42,159 @@ class ResPartner(models.Model):
         store=True
     )
     
+    # Documentos só com dígitos: usados nas buscas e na conciliação de extratos
+    cpf_digits = fields.Char(
+        string='CPF (Dígitos)',
+        compute='_compute_cpf_digits',
+        store=True
+    )
+    
+    cnpj_digits = fields.Char(
+        string='CNPJ (Dígitos)',
+        compute='_compute_cnpj_digits',
+        store=True
+    )
+    
+    # ========================================
+    # INSTALAÇÃO
+    # ========================================
+    
+    def _auto_init(self):
+        """Cria e preenche em SQL as colunas derivadas dos documentos.
+        
+        Com as colunas já existentes, o ORM não recalcula os campos
+        computados registro a registro sobre toda a tabela de contatos.
+        """
+        cr = self.env.cr
+        for document, validator in (('cpf', validate_cpfs), ('cnpj', validate_cnpjs)):
+            digits_column, valid_column = f'{document}_digits', f'{document}_valid'
+            if tools.column_exists(cr, self._table, digits_column):
+                continue
+            
+            tools.create_column(cr, self._table, digits_column, 'varchar')
+            if not tools.column_exists(cr, self._table, valid_column):
+                tools.create_column(cr, self._table, valid_column, 'boolean')
+            if not tools.column_exists(cr, self._table, document):
+                continue
+            
+            cr.execute(f"""
+                UPDATE {self._table}
+                   SET {digits_column} = NULLIF(regexp_replace({document}, '[^0-9]', '', 'g'), '')
+                 WHERE {document} IS NOT NULL
+             RETURNING id, {digits_column}
+            """)
+            rows = cr.fetchall()
+            valid = validator([digits for _id, digits in rows])
+            cr.execute(
+                f"UPDATE {self._table} SET {valid_column} = (id = ANY(%s)) WHERE {document} IS NOT NULL",
+                [[partner_id for (partner_id, _digits), is_valid in zip(rows, valid) if is_valid]]
+            )
+            _logger.info("%s: %s documentos normalizados e validados em lote", document.upper(), len(rows))
+        return super()._auto_init()
+    
+    def init(self):
+        super().init()
+        for column in ('cpf_digits', 'cnpj_digits'):
+            self._create_document_index(column)
+    
+    def _create_document_index(self, column):
+        """Índice único parcial na coluna de dígitos (comum se já houver duplicados)"""
+        cr = self.env.cr
+        unique_index = f'{self._table}_{column}_uniq'
+        plain_index = f'{self._table}_{column}_index'
+        if tools.index_exists(cr, unique_index) or tools.index_exists(cr, plain_index):
+            return
+        
+        cr.execute(f"""
+            SELECT {column}
+              FROM {self._table}
+             WHERE {column} IS NOT NULL
+          GROUP BY {column}
+            HAVING COUNT(*) > 1
+             LIMIT 1
+        """)
+        if cr.fetchone():
+            _logger.warning(
+                "Há contatos com %s duplicado; criando índice não único em %s.%s",
+                column, self._table, column
+            )
+            tools.create_index(cr, plain_index, self._table, [column], where=f'{column} IS NOT NULL')
+        else:
+            cr.execute(f"CREATE UNIQUE INDEX {unique_index} ON {self._table} ({column}) WHERE {column} IS NOT NULL")
+    
+    # ========================================
+    # CAMPOS COMPUTADOS
+    # ========================================
+    
     @api.depends('cpf')
-    def _compute_cpf_valid(self):
+    def _compute_cpf_digits(self):
         for partner in self:
-            partner.cpf_valid = self._validate_cpf(partner.cpf) if partner.cpf else False
+            partner.cpf_digits = clean_document(partner.cpf) or False
     
     @api.depends('cnpj')
-    def _compute_cnpj_valid(self):
+    def _compute_cnpj_digits(self):
         for partner in self:
-            partner.cnpj_valid = self._validate_cnpj(partner.cnpj) if partner.cnpj else False
+            partner.cnpj_digits = clean_document(partner.cnpj) or False
+    
+    @api.depends('cpf')
+    def _compute_cpf_valid(self):
+        for partner, valid in zip(self, validate_cpfs(self.mapped('cpf'))):
+            partner.cpf_valid = bool(valid)
+    
+    @api.depends('cnpj')
+    def _compute_cnpj_valid(self):
+        for partner, valid in zip(self, validate_cnpjs(self.mapped('cnpj'))):
+            partner.cnpj_valid = bool(valid)
     
     def _clean_document(self, document):
         """Remove caracteres especiais do documento"""
-        if not document:
-            return ''
-        return re.sub(r'[^0-9]', '', document)
+        return clean_document(document)
     
     def _validate_cpf(self, cpf):
         """Valida CPF usando algoritmo oficial"""
-        if not cpf:
-            return False
-            
-        # Remove caracteres especiais
-        cpf = self._clean_document(cpf)
-        
-        # Verifica se tem 11 dígitos
-        if len(cpf) != 11:
-            return False
-        
-        # Verifica se não são todos iguais
-        if cpf == cpf[0] * 11:
-            return False
-        
-        # Cálculo do primeiro dígito verificador
-        soma = 0
-        for i in range(9):
-            soma += int(cpf[i]) * (10 - i)
-        
-        primeiro_digito = 11 - (soma % 11)
-        if primeiro_digito >= 10:
-            primeiro_digito = 0
-        
-        if int(cpf[9]) != primeiro_digito:
-            return False
-        
-        # Cálculo do segundo dígito verificador
-        soma = 0
-        for i in range(10):
-            soma += int(cpf[i]) * (11 - i)
-        
-        segundo_digito = 11 - (soma % 11)
-        if segundo_digito >= 10:
-            segundo_digito = 0
-        
-        return int(cpf[10]) == segundo_digito
+        return bool(validate_cpfs([cpf])[0])
     
     def _validate_cnpj(self, cnpj):
         """Valida CNPJ usando algoritmo oficial"""
-        if not cnpj:
-            return False
-            
-        # Remove caracteres especiais
-        cnpj = self._clean_document(cnpj)
-        
-        # Verifica se tem 14 dígitos
-        if len(cnpj) != 14:
-            return False
-        
-        # Verifica se não são todos iguais
-        if cnpj == cnpj[0] * 14:
-            return False
-        
-        # Cálculo do primeiro dígito verificador
-        multiplicadores1 = [5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
-        soma = 0
-        for i in range(12):
-            soma += int(cnpj[i]) * multiplicadores1[i]
-        
-        primeiro_digito = 11 - (soma % 11)
-        if primeiro_digito >= 10:
-            primeiro_digito = 0
-        
-        if int(cnpj[12]) != primeiro_digito:
-            return False
-        
-        # Cálculo do segundo dígito verificador
-        multiplicadores2 = [6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]
-        soma = 0
-        for i in range(13):
-            soma += int(cnpj[i]) * multiplicadores2[i]
-        
-        segundo_digito = 11 - (soma % 11)
-        if segundo_digito >= 10:
-            segundo_digito = 0
-        
-        return int(cnpj[13]) == segundo_digito
+        return bool(validate_cnpjs([cnpj])[0])
+    
+    # ========================================
+    # BUSCA
+    # ========================================
+    
+    @api.model
+    def _normalize_document_domain(self, domain):
+        """Troca buscas por CPF/CNPJ (com qualquer formatação) pela coluna de dígitos indexada"""
+        if not domain:
+            return domain
+        normalized = []
+        for leaf in domain:
+            if (isinstance(leaf, (list, tuple)) and len(leaf) == 3 and leaf[0] in ('cpf', 'cnpj')
+                    and leaf[1] in DOCUMENT_SEARCH_OPERATORS and isinstance(leaf[2], str)):
+                digits = clean_document(leaf[2])
+                if digits:
+                    length = CPF_LENGTH if leaf[0] == 'cpf' else CNPJ_LENGTH
+                    exact = leaf[1] == '=' or len(digits) == length
+                    leaf = (f'{leaf[0]}_digits', '=' if exact else 'like', digits)
+            normalized.append(leaf)
+        return normalized
+    
+    @api.model
+    def _search(self, domain, *args, **kwargs):
+        return super()._search(self._normalize_document_domain(domain), *args, **kwargs)
+    
+    @api.model
+    def _search_display_name(self, operator, value):
+        """Permite achar o contato digitando o CPF/CNPJ nos campos de seleção"""
+        domain = super()._search_display_name(operator, value)
+        digits = clean_document(value) if isinstance(value, str) else ''
+        if operator in ('ilike', '=', '=ilike') and len(digits) in (CPF_LENGTH, CNPJ_LENGTH):
+            domain = expression.OR([domain, [('cpf_digits', '=', digits)], [('cnpj_digits', '=', digits)]])
+        return domain
+    
+    # ========================================
+    # FORMATAÇÃO E VALIDAÇÃO
+    # ========================================
     
     @api.onchange('cpf')
     def _onchange_cpf(self):
@@ -168,16 +236,39 @@ class ResPartner(models.Model):
                     }
                 }
     
+    def _check_document_duplicates(self, document):
+        """Mensagem amigável antes do índice único recusar um documento repetido"""
+        digits_field = f'{document}_digits'
+        partners = self.filtered(digits_field)
+        if not partners:
+            return
+        seen = {}
+        for partner in partners:
+            seen.setdefault(partner[digits_field], partner)
+        # Mesmo escopo do índice único: arquivados e contatos de outras empresas
+        duplicate = self.with_context(active_test=False).sudo().search([
+            (digits_field, 'in', list(seen)),
+            ('id', 'not in', partners.ids),
+        ], limit=1)
+        if duplicate or len(seen) < len(partners):
+            raise ValidationError('%s já cadastrado em outro contato: %s' % (
+                document.upper(), duplicate[document] if duplicate else partners[0][document]
+            ))
+    
     @api.constrains('cpf')
     def _check_cpf(self):
         """Validação obrigatória no salvamento"""
-        for partner in self:
-            if partner.cpf and not self._validate_cpf(partner.cpf):
+        partners = self.filtered('cpf')
+        for partner, valid in zip(partners, validate_cpfs(partners.mapped('cpf'))):
+            if not valid:
                 raise ValidationError('CPF inválido: %s' % partner.cpf)
+        partners._check_document_duplicates('cpf')
     
     @api.constrains('cnpj')
     def _check_cnpj(self):
         """Validação obrigatória no salvamento"""
-        for partner in self:
-            if partner.cnpj and not self._validate_cnpj(partner.cnpj):
+        partners = self.filtered('cnpj')
+        for partner, valid in zip(partners, validate_cnpjs(partners.mapped('cnpj'))):
+            if not valid:
                 raise ValidationError('CNPJ inválido: %s' % partner.cnpj)
+        partners._check_document_duplicates('cnpj')
@@ -1,10 +1,31 @@
 from odoo import models, fields, api
 from datetime import datetime, timedelta
 from odoo.exceptions import UserError, ValidationError
+from odoo.tools import split_every
+from collections import defaultdict
 import logging
 
+from .loan_perf_sample import add_perf_rows, instrument
+from ..tools.loan_schedule import AMORTIZATION_METHODS, compute_schedules, schedule_rows
+
 _logger = logging.getLogger(__name__)
 
+# Quantidade máxima de parcelas gravadas por chamada de create()
+LOAN_INSTALLMENT_BATCH_SIZE = 1000
+
+# Contexto para criação em massa: sem seguidores, log de criação nem tracking
+LOAN_BULK_CREATE_CONTEXT = {
+    'mail_create_nosubscribe': True,
+    'mail_create_nolog': True,
+    'tracking_disable': True,
+}
+
+# Status de parcela que ainda representam saldo em aberto
+LOAN_OPEN_INSTALLMENT_STATES = ('pending', 'late', 'partial')
+
+# Parâmetro do sistema com a marca d'água da última atualização de status
+LOAN_STATUS_WATERMARK_PARAM = 'gt_loan_extension.loan_status_last_run'
+
 class SaleOrder(models.Model):
     _inherit = 'sale.order'
     
@@ -41,6 +62,16 @@ class SaleOrder(models.Model):
         default=4
     )
     
+    loan_amortization_method = fields.Selection(
+        AMORTIZATION_METHODS,
+        string='Sistema de Amortização',
+        default='flat',
+        required=True,
+        help='Parcelas Iguais: juros compostos sobre o prazo total divididos igualmente; '
+             'Tabela Price: parcelas iguais com amortização crescente; '
+             'SAC: amortização constante com parcelas decrescentes'
+    )
+    
     loan_total_amount = fields.Monetary(
         string='Total a Pagar',
         compute='_compute_loan_amounts',
@@ -77,11 +108,32 @@ class SaleOrder(models.Model):
     
     loan_balance = fields.Monetary(
         string='Saldo Devedor',
-        compute='_compute_loan_balance',
+        compute='_compute_loan_installment_totals',
+        store=True,
+        currency_field='currency_id'
+    )
+    
+    loan_total_due = fields.Monetary(
+        string='Total das Parcelas',
+        compute='_compute_loan_installment_totals',
         store=True,
         currency_field='currency_id'
     )
     
+    loan_total_paid = fields.Monetary(
+        string='Total Pago',
+        compute='_compute_loan_installment_totals',
+        store=True,
+        currency_field='currency_id'
+    )
+    
+    loan_next_due_date = fields.Date(
+        string='Próximo Vencimento',
+        compute='_compute_loan_installment_totals',
+        store=True,
+        help='Vencimento mais antigo entre as parcelas em aberto'
+    )
+    
     is_loan_renegotiation = fields.Boolean(
         string='É Renegociação',
         default=False
@@ -96,7 +148,8 @@ class SaleOrder(models.Model):
     # NOVOS CAMPOS PARA CONTROLE DE PARCELAS
     installments_count = fields.Integer(
         string='Número de Parcelas', 
-        compute='_compute_installments_count'
+        compute='_compute_loan_installment_totals',
+        store=True
     )
     
     installments_generated = fields.Boolean(
@@ -110,129 +163,213 @@ class SaleOrder(models.Model):
     # ===============================================
     overdue_installments_count = fields.Integer(
         string='Parcelas Atrasadas',
-        compute='_compute_installment_stats'
+        compute='_compute_loan_installment_totals',
+        store=True
     )
     
     @api.depends('order_line.product_id.is_loan_product')
     def _compute_is_loan_order(self):
+        loan_product_ids = self.env['product.product']._get_loan_product_ids()
         for order in self:
-            order.is_loan_order = any(line.product_id.is_loan_product for line in order.order_line)
+            order.is_loan_order = any(product_id in loan_product_ids for product_id in order.order_line.product_id.ids)
     
-    @api.depends('loan_released_amount', 'loan_interest_rate', 'loan_weeks', 'loan_interest_period')
-    def _compute_loan_amounts(self):
-        for order in self:
-            if order.is_loan_order and order.loan_released_amount and order.loan_weeks:
-                # Calcula juros compostos
-                total_days = order.loan_weeks * 7
-                interest_periods = total_days / (order.loan_interest_period or 7)
-                
-                order.loan_total_amount = order.loan_released_amount * (
-                    (1 + order.loan_interest_rate / 100) ** interest_periods
-                )
-                
-                order.loan_installment_amount = order.loan_total_amount / order.loan_weeks if order.loan_weeks else 0
-                
-                # Atualiza o valor da linha do pedido
-                loan_lines = order.order_line.filtered(lambda l: l.product_id.is_loan_product)
-                for line in loan_lines:
-                    line.price_unit = order.loan_total_amount
-                    
-            else:
-                order.loan_total_amount = 0
-                order.loan_installment_amount = 0
+    def _compute_loan_schedules(self):
+        """Cronogramas de todas as ordens do recordset em uma única operação vetorizada"""
+        return compute_schedules(
+            principals=[order.loan_released_amount for order in self],
+            rates=[order.loan_interest_rate for order in self],
+            interest_periods=[order.loan_interest_period for order in self],
+            counts=[order.loan_weeks for order in self],
+            methods=[order.loan_amortization_method or 'flat' for order in self],
+        )
     
-    @api.depends('loan_installment_ids')
-    def _compute_installments_count(self):
-        for order in self:
-            order.installments_count = len(order.loan_installment_ids)
+    @api.depends('is_loan_order', 'loan_released_amount', 'loan_interest_rate', 'loan_weeks',
+                 'loan_interest_period', 'loan_amortization_method')
+    def _compute_loan_amounts(self):
+        loans = self.filtered(lambda o: o.is_loan_order and o.loan_released_amount and o.loan_weeks)
+        (self - loans).loan_total_amount = 0
+        (self - loans).loan_installment_amount = 0
+        if not loans:
+            return
+        
+        schedules = loans._compute_loan_schedules()
+        for index, order in enumerate(loans):
+            order.loan_total_amount = float(schedules.total[index])
+            # Valor da primeira parcela (no SAC as parcelas seguintes são menores)
+            order.loan_installment_amount = float(schedules.amount[index, 0])
     
     @api.depends('loan_installment_ids')
     def _compute_installments_generated(self):
         for order in self:
             order.installments_generated = bool(order.loan_installment_ids)
     
-    @api.depends('loan_installment_ids.amount_paid')
-    def _compute_loan_balance(self):
-        for order in self:
-            total_due = sum(order.loan_installment_ids.mapped('amount'))
-            total_paid = sum(order.loan_installment_ids.mapped('amount_paid'))
-            order.loan_balance = total_due - total_paid
+    def _get_loan_installment_totals(self):
+        """Totais das parcelas por ordem, em uma única consulta agregada.
+        
+        Só as ordens realmente alteradas chegam aqui (o ORM acompanha as
+        dependências), então o custo é uma leitura indexada por ``sale_order_id``
+        em vez de carregar o cronograma inteiro de cada ordem.
+        """
+        order_ids = tuple(self._origin.ids)
+        if not order_ids:
+            return {}
+        
+        self.env['loan.installment'].flush_model(['sale_order_id', 'amount', 'amount_paid', 'status', 'due_date'])
+        self.env.cr.execute("""
+            SELECT sale_order_id,
+                   SUM(CASE WHEN status = 'renegotiated' THEN COALESCE(amount_paid, 0) ELSE amount END),
+                   SUM(COALESCE(amount_paid, 0)),
+                   COUNT(*),
+                   COUNT(*) FILTER (WHERE status IN ('late', 'partial')),
+                   MIN(due_date) FILTER (WHERE status IN %s)
+              FROM loan_installment
+             WHERE sale_order_id IN %s
+          GROUP BY sale_order_id
+        """, [LOAN_OPEN_INSTALLMENT_STATES, order_ids])
+        return {row[0]: row[1:] for row in self.env.cr.fetchall()}
+    
+    def _get_loan_renegotiation_situation(self):
+        """Situação das parcelas abertas por ordem, em uma única consulta.
+        
+        Retorna {id da ordem: (saldo devedor, parcelas abertas, parcelas atrasadas,
+        vencimento da parcela atrasada mais antiga)}.
+        """
+        if not self.ids:
+            return {}
+        
+        self.env['loan.installment'].flush_model(['sale_order_id', 'amount', 'amount_paid', 'status', 'due_date'])
+        self.env.cr.execute("""
+            SELECT sale_order_id,
+                   SUM(amount - COALESCE(amount_paid, 0)),
+                   COUNT(*),
+                   COUNT(*) FILTER (WHERE status IN ('late', 'partial')),
+                   MIN(due_date) FILTER (WHERE status IN ('late', 'partial'))
+              FROM loan_installment
+             WHERE sale_order_id IN %s
+               AND status IN %s
+          GROUP BY sale_order_id
+        """, [tuple(self.ids), LOAN_OPEN_INSTALLMENT_STATES])
+        return {row[0]: row[1:] for row in self.env.cr.fetchall()}
     
     # ===============================================
-    # NOVO MÉTODO COMPUTE PARA RENEGOCIAÇÃO
+    # TOTAIS DAS PARCELAS (SALDO, CONTAGENS E VENCIMENTO)
     # ===============================================
-    @api.depends('loan_installment_ids.status')
-    def _compute_installment_stats(self):
-        """Calcula estatísticas das parcelas"""
+    @api.depends('is_loan_order', 'loan_installment_ids.amount', 'loan_installment_ids.amount_paid',
+                 'loan_installment_ids.status', 'loan_installment_ids.due_date')
+    def _compute_loan_installment_totals(self):
+        """Calcula os totais armazenados das parcelas de cada ordem"""
+        totals = self._get_loan_installment_totals()
         for order in self:
-            if order.is_loan_order:
-                overdue_count = len(order.loan_installment_ids.filtered(
-                    lambda i: i.status in ['late', 'partial']
-                ))
-                order.overdue_installments_count = overdue_count
+            if order.id:
+                total_due, total_paid, count, overdue_count, next_due_date = totals.get(
+                    order.id, (0.0, 0.0, 0, 0, False)
+                )
             else:
-                order.overdue_installments_count = 0
+                # Registro novo (onchange): soma as parcelas em memória
+                installments = order.loan_installment_ids
+                open_installments = installments.filtered(lambda i: i.status in LOAN_OPEN_INSTALLMENT_STATES)
+                # Parcelas renegociadas só contam pelo que já foi pago
+                total_due = sum(
+                    i.amount_paid if i.status == 'renegotiated' else i.amount for i in installments
+                )
+                total_paid = sum(installments.mapped('amount_paid'))
+                count = len(installments)
+                overdue_count = len(installments.filtered(lambda i: i.status in ['late', 'partial']))
+                next_due_date = min(open_installments.mapped('due_date'), default=False)
+            
+            order.loan_total_due = total_due
+            order.loan_total_paid = total_paid
+            order.loan_balance = total_due - total_paid
+            order.installments_count = count
+            order.overdue_installments_count = overdue_count if order.is_loan_order else 0
+            order.loan_next_due_date = next_due_date
     
     def _get_next_business_day(self, date):
-        """Retorna o próximo dia útil (pula fins de semana)"""
-        while date.weekday() in [5, 6]:  # Sábado = 5, Domingo = 6
-            date += timedelta(days=1)
-        return date
+        """Retorna o próximo dia útil (pula fins de semana e feriados da empresa)"""
+        company = self.company_id if len(self) == 1 else self.env.company
+        return self.env['loan.holiday']._next_business_days([date], company)[0]
     
-    def action_generate_loan_installments(self):
-        """Gera as parcelas do empréstimo - VERSÃO MELHORADA"""
-        self.ensure_one()
-        
-        if not self.is_loan_order:
-            raise UserError('Esta não é uma ordem de empréstimo!')
-        
-        if not self.loan_released_amount or not self.loan_weeks:
-            raise UserError('Defina o valor liberado e número de semanas!')
-        
-        _logger.info(f"Gerando parcelas para empréstimo {self.name}")
-        
-        # Remove parcelas existentes
-        if self.loan_installment_ids:
-            _logger.info(f"Removendo {len(self.loan_installment_ids)} parcelas existentes")
-            self.loan_installment_ids.unlink()
+    def _get_loan_due_dates(self):
+        """Datas de vencimento semanais de cada ordem, calculadas em lote por empresa"""
+        holiday_obj = self.env['loan.holiday']
+        due_dates = {}
+        for company, orders in self.grouped('company_id').items():
+            dates = holiday_obj._weekly_due_dates(
+                orders.mapped('loan_start_date'), orders.mapped('loan_weeks'), company)
+            due_dates.update(zip(orders.ids, dates))
+        return due_dates
+    
+    def _prepare_loan_installment_vals(self, schedule, due_dates=None):
+        """Monta em memória os valores das parcelas da ordem (sem gravar).
         
-        # Calcula primeira data de vencimento (próxima semana)
-        due_date = self.loan_start_date + timedelta(days=7)
-        due_date = self._get_next_business_day(due_date)
+        ``schedule`` é a lista de (valor, amortização, juros) de cada parcela e
+        ``due_dates`` a lista de vencimentos (calculada se não informada).
+        """
+        self.ensure_one()
+        vals_list = []
         
-        # Cria as parcelas
-        installment_obj = self.env['loan.installment']
-        installments_created = []
+        if due_dates is None:
+            due_dates = self.env['loan.holiday']._weekly_due_dates(
+                [self.loan_start_date], [len(schedule)], self.company_id)[0]
         
-        for i in range(self.loan_weeks):
-            installment_data = {
+        for i, ((amount, principal, interest), due_date) in enumerate(zip(schedule, due_dates)):
+            vals_list.append({
                 'sale_order_id': self.id,
                 'number': i + 1,
                 'due_date': due_date,
-                'amount': self.loan_installment_amount,
+                'amount': amount,
+                'principal_amount': principal,
+                'interest_amount': interest,
                 'partner_id': self.partner_id.id,
-            }
-            
-            installment = installment_obj.create(installment_data)
-            installments_created.append(installment.id)
-            
-            _logger.info(f"Criando parcela {i + 1}: R$ {self.loan_installment_amount:.2f} - Vencimento: {due_date}")
+            })
+        
+        return vals_list
+    
+    @instrument('sale.order.action_generate_loan_installments')
+    def action_generate_loan_installments(self):
+        """Gera as parcelas dos empréstimos em lote (aceita várias ordens)"""
+        for order in self:
+            if not order.is_loan_order:
+                raise UserError(f'A ordem {order.name} não é uma ordem de empréstimo!')
             
-            # Próxima data (adiciona 7 dias)
-            due_date = due_date + timedelta(days=7)
-            due_date = self._get_next_business_day(due_date)
+            if not order.loan_released_amount or not order.loan_weeks:
+                raise UserError(f'Defina o valor liberado e número de semanas na ordem {order.name}!')
+        
+        _logger.info("Gerando parcelas para %s empréstimo(s)", len(self))
+        
+        # Remove parcelas existentes de todas as ordens de uma vez
+        existing_installments = self.loan_installment_ids
+        if existing_installments:
+            _logger.info("Removendo %s parcelas existentes", len(existing_installments))
+            existing_installments.unlink()
+        
+        # Monta o cronograma completo em memória (valores calculados de uma vez)
+        schedules = self._compute_loan_schedules()
+        due_dates = self._get_loan_due_dates()
+        vals_list = []
+        for index, order in enumerate(self):
+            vals_list.extend(order._prepare_loan_installment_vals(
+                schedule_rows(schedules, index), due_dates[order.id]))
+        
+        # Grava em lotes, sem seguidores nem mensagens automáticas por parcela
+        installment_obj = self.env['loan.installment'].with_context(**LOAN_BULK_CREATE_CONTEXT)
+        for batch in split_every(LOAN_INSTALLMENT_BATCH_SIZE, vals_list, list):
+            installment_obj.create(batch)
         
         # Atualiza status
-        self.loan_status = 'active'
+        self.write({'loan_status': 'active'})
         
-        # Adiciona mensagem no chatter
-        self.message_post(
-            body=f"✅ Parcelas geradas com sucesso: {self.loan_weeks} parcelas de "
-                 f"{self.currency_id.symbol} {self.loan_installment_amount:,.2f} cada. "
-                 f"Total: {self.currency_id.symbol} {self.loan_total_amount:,.2f}"
-        )
+        # Adiciona mensagem no chatter (uma por ordem, gravadas de uma vez)
+        self._message_log_batch(bodies={
+            order.id: f"✅ Parcelas geradas com sucesso: {order.loan_weeks} parcelas "
+                      f"({dict(AMORTIZATION_METHODS)[order.loan_amortization_method]}), a primeira de "
+                      f"{order.currency_id.symbol} {order.loan_installment_amount:,.2f}. "
+                      f"Total: {order.currency_id.symbol} {order.loan_total_amount:,.2f}"
+            for order in self
+        })
         
-        _logger.info(f"Parcelas criadas com sucesso: {installments_created}")
+        add_perf_rows(len(vals_list))
+        _logger.info("Parcelas criadas com sucesso: %s parcelas", len(vals_list))
         
         return True
     
@@ -306,48 +443,156 @@ class SaleOrder(models.Model):
             }
         }
     
+    @instrument('sale.order.action_confirm')
     def action_confirm(self):
         """Override para configurar linha de empréstimo ao confirmar"""
         # Primeiro confirma o pedido
         res = super(SaleOrder, self).action_confirm()
         
-        # Para pedidos de empréstimo, gera parcelas automaticamente se configurado
-        for order in self.filtered('is_loan_order'):
-            if order.loan_released_amount and order.loan_weeks and not order.loan_installment_ids:
-                # Só gera automaticamente se não houver parcelas
-                order.action_generate_loan_installments()
+        # Para pedidos de empréstimo, gera parcelas automaticamente (todas as ordens em lote)
+        # Só gera automaticamente se não houver parcelas
+        loan_orders = self.filtered(
+            lambda o: o.is_loan_order and o.loan_released_amount and o.loan_weeks and not o.loan_installment_ids
+        )
+        if loan_orders:
+            loan_orders.action_generate_loan_installments()
         
         return res
     
+    # TRANSIÇÕES DE STATUS DOS EMPRÉSTIMOS
+    @api.model
+    def _get_loan_status_transitions(self, since=None, order_ids=None):
+        """Calcula, em uma única consulta agregada, as ordens cujo status muda.
+        
+        Retorna um dicionário {status_destino: [ids das ordens]}. Se ``since``
+        for informado, considera apenas ordens com parcelas alteradas depois dele;
+        ``order_ids`` restringe a consulta a um bloco de ordens.
+        """
+        self.env['loan.installment'].flush_model(['sale_order_id', 'status', 'due_date'])
+        self.flush_model(['is_loan_order', 'loan_status'])
+        
+        params = {
+            'open_states': LOAN_OPEN_INSTALLMENT_STATES,
+            'today': fields.Date.today(),
+            'since': since,
+            'order_ids': tuple(order_ids or ()),
+        }
+        filter_clause = ''
+        if order_ids:
+            filter_clause += """
+               AND so.id IN %(order_ids)s"""
+        if since:
+            filter_clause += """
+               AND so.id IN (
+                   SELECT changed.sale_order_id
+                     FROM loan_installment changed
+                    WHERE changed.write_date >= %(since)s
+               )"""
+        
+        self.env.cr.execute(f"""
+            SELECT transition.id, transition.target
+              FROM (
+                  SELECT so.id,
+                         so.loan_status,
+                         CASE
+                             WHEN bool_and(li.status NOT IN %(open_states)s) THEN 'paid'
+                             WHEN bool_or(li.status IN %(open_states)s AND li.due_date < %(today)s) THEN 'late'
+                             ELSE 'active'
+                         END AS target
+                    FROM sale_order so
+                    JOIN loan_installment li ON li.sale_order_id = so.id
+                   WHERE so.is_loan_order
+                     AND so.loan_status IN ('active', 'late'){filter_clause}
+                GROUP BY so.id, so.loan_status
+              ) transition
+             WHERE transition.target != transition.loan_status
+        """, params)
+        
+        transitions = defaultdict(list)
+        for order_id, target in self.env.cr.fetchall():
+            transitions[target].append(order_id)
+        return transitions
+    
     # MÉTODOS PARA AUTOMAÇÃO E CONTROLE
     @api.model
+    @instrument('sale.order._cron_update_loan_status')
     def _cron_update_loan_status(self):
-        """Atualiza status dos empréstimos automaticamente"""
-        today = fields.Date.today()
-        
-        # Busca empréstimos ativos com parcelas vencidas
-        active_loans = self.search([
-            ('is_loan_order', '=', True),
-            ('loan_status', '=', 'active')
-        ])
-        
-        for loan in active_loans:
-            overdue_installments = loan.loan_installment_ids.filtered(
-                lambda i: i.due_date < today and i.status in ['pending', 'partial']
-            )
-            
-            if overdue_installments:
-                loan.loan_status = 'late'
-                _logger.info(f"Empréstimo {loan.name} marcado como atrasado")
-            
-            # Verifica se está quitado
-            if all(i.status == 'paid' for i in loan.loan_installment_ids):
-                loan.loan_status = 'paid'
-                _logger.info(f"Empréstimo {loan.name} quitado")
+        """Atualiza status dos empréstimos automaticamente (active/late/paid).
+        
+        Executado em partições e blocos confirmados um a um (``loan.cron.job``);
+        os crons auxiliares processam as demais partições em paralelo.
+        """
+        ICP = self.env['ir.config_parameter'].sudo()
+        
+        # Na mesma data, só ordens com parcelas alteradas desde a última execução
+        # podem mudar de status; em um novo dia, reavalia a carteira inteira
+        since = None
+        last_run = ICP.get_param(LOAN_STATUS_WATERMARK_PARAM)
+        if last_run:
+            last_run = fields.Datetime.to_datetime(last_run)
+            if last_run.date() == self.env.cr.now().date():
+                since = last_run
+        
+        self.env['loan.cron.job']._run('loan_status', since=since)
+    
+    @api.model
+    def _loan_status_job_chunk(self, job, partition, limit):
+        """Próximo bloco de empréstimos da partição que podem mudar de status"""
+        self.env['loan.installment'].flush_model(['sale_order_id', 'write_date'])
+        self.flush_model(['is_loan_order', 'loan_status'])
+        since_clause = ''
+        if job.since:
+            since_clause = """
+               AND so.id IN (
+                   SELECT changed.sale_order_id
+                     FROM loan_installment changed
+                    WHERE changed.write_date >= %(since)s
+               )"""
+        self.env.cr.execute(f"""
+            SELECT so.id
+              FROM sale_order so
+             WHERE so.is_loan_order
+               AND so.loan_status IN ('active', 'late')
+               AND so.id > %(cursor)s
+               AND MOD(so.id, %(partitions)s) = %(index)s{since_clause}
+          ORDER BY so.id
+             LIMIT %(limit)s
+        """, {
+            'since': job.since,
+            'cursor': partition.cursor,
+            'partitions': len(job.partition_ids),
+            'index': partition.index,
+            'limit': limit,
+        })
+        return [row[0] for row in self.env.cr.fetchall()]
+    
+    @api.model
+    def _loan_status_job_process(self, job, order_ids):
+        """Aplica as mudanças de status de um bloco (uma escrita por status)"""
+        transitions = self._get_loan_status_transitions(since=job.since, order_ids=order_ids)
+        for target, target_order_ids in transitions.items():
+            self.browse(target_order_ids).write({'loan_status': target})
+            add_perf_rows(len(target_order_ids))
+            _logger.info("%s empréstimo(s) marcados como '%s'", len(target_order_ids), target)
+    
+    @api.model
+    def _loan_status_job_finish(self, job):
+        self.env['ir.config_parameter'].sudo().set_param(
+            LOAN_STATUS_WATERMARK_PARAM, fields.Datetime.to_string(job.started)
+        )
 
 class SaleOrderLine(models.Model):
     _inherit = 'sale.order.line'
     
+    @api.depends('order_id.loan_total_amount')
+    def _compute_price_unit(self):
+        """A linha do produto de empréstimo vale o total a pagar do empréstimo"""
+        loan_product_ids = self.env['product.product']._get_loan_product_ids()
+        loan_lines = self.filtered(lambda l: l.product_id.id in loan_product_ids and l.order_id.is_loan_order)
+        super(SaleOrderLine, self - loan_lines)._compute_price_unit()
+        for line in loan_lines:
+            line.price_unit = line.order_id.loan_total_amount
+    
     @api.onchange('product_id')
     def _onchange_product_id_loan(self):
         """Configura valores padrão para produtos de empréstimo"""
@@ -0,0 +1,4 @@
+# -*- coding: utf-8 -*-
+from . import test_loan_benchmark
+from . import test_loan_query_count
+from . import test_res_partner_document
@@ -0,0 +1,253 @@
+# -*- coding: utf-8 -*-
+"""Carteira sintética de empréstimos para benchmarks e testes.
+
+Gera, de forma reprodutível (semente fixa), clientes com CPF/CNPJ válidos,
+produtos de empréstimo e empréstimos em status variados, com histórico de
+pagamentos coerente com as datas das parcelas.
+"""
+from contextlib import contextmanager
+from datetime import timedelta
+import random
+import time
+
+from odoo import fields
+from odoo.tests.common import TransactionCase
+from odoo.tools import split_every
+
+from ..tools.br_document import CPF_WEIGHTS, CNPJ_WEIGHTS
+
+# Distribuição dos status dos empréstimos gerados
+LOAN_STATUS_MIX = [
+    ('draft', 0.10),
+    ('active', 0.45),
+    ('late', 0.25),
+    ('paid', 0.15),
+    ('renegotiated', 0.05),
+]
+
+# Quantidade de registros criados por chamada na geração da carteira
+PORTFOLIO_BATCH_SIZE = 1000
+
+
+def _check_digit(digits, weights):
+    digit = 11 - sum(digit * weight for digit, weight in zip(digits, weights)) % 11
+    return 0 if digit >= 10 else digit
+
+
+def _generate_document(rng, base_length, weights):
+    while True:
+        digits = [rng.randrange(10) for _ in range(base_length)]
+        if len(set(digits)) > 1:
+            break
+    for position_weights in weights:
+        digits.append(_check_digit(digits, position_weights.tolist()))
+    return ''.join(map(str, digits))
+
+
+def generate_cpf(rng):
+    """CPF válido e formatado (000.000.000-00)"""
+    cpf = _generate_document(rng, 9, CPF_WEIGHTS)
+    return f"{cpf[:3]}.{cpf[3:6]}.{cpf[6:9]}-{cpf[9:]}"
+
+
+def generate_cnpj(rng):
+    """CNPJ válido e formatado (00.000.000/0000-00)"""
+    cnpj = _generate_document(rng, 12, CNPJ_WEIGHTS)
+    return f"{cnpj[:2]}.{cnpj[2:5]}.{cnpj[5:8]}/{cnpj[8:12]}-{cnpj[12:]}"
+
+
+class LoanPortfolioCase(TransactionCase):
+    """Base com produtos de empréstimo e o gerador de carteira sintética"""
+    
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.env = cls.env(context=dict(
+            cls.env.context, tracking_disable=True, mail_create_nolog=True, mail_notrack=True,
+        ))
+        cls.loan_products = cls.env['product.product'].create([{
+            'name': name,
+            'type': 'service',
+            'is_loan_product': True,
+            'loan_interest_rate': rate,
+            'loan_interest_period': 7,
+            'invoice_policy': 'order',
+            'list_price': 0.0,
+            'taxes_id': [(6, 0, [])],
+        } for name, rate in (('Empréstimo Pessoal (Teste)', 10.0), ('Empréstimo Empresarial (Teste)', 6.0))])
+    
+    # ========================================
+    # GERAÇÃO DA CARTEIRA
+    # ========================================
+    
+    @classmethod
+    def _generate_partners(cls, count, rng):
+        """Clientes com CPF válido (80%) ou CNPJ válido (20%)"""
+        vals_list = []
+        documents = set()
+        for index in range(count):
+            is_company = rng.random() >= 0.8
+            document = generate_cnpj(rng) if is_company else generate_cpf(rng)
+            while document in documents:   # os documentos são únicos por contato
+                document = generate_cnpj(rng) if is_company else generate_cpf(rng)
+            documents.add(document)
+            if is_company:
+                vals_list.append({'name': f'Empresa {index}', 'is_company': True, 'cnpj': document})
+            else:
+                vals_list.append({'name': f'Cliente {index}', 'cpf': document})
+        
+        partners = cls.env['res.partner']
+        for batch in split_every(PORTFOLIO_BATCH_SIZE, vals_list, list):
+            partners |= partners.create(batch)
+        return partners
+    
+    @classmethod
+    def _generate_portfolio(cls, loan_count, partner_count=None, seed=42):
+        """Gera ``loan_count`` empréstimos com status misturados.
+        
+        Retorna um dicionário {status: ordens}. As ordens em rascunho não são
+        confirmadas; as demais têm as parcelas geradas pela confirmação e os
+        pagamentos lançados no razão conforme o status desejado.
+        """
+        rng = random.Random(seed)
+        today = fields.Date.today()
+        partners = cls._generate_partners(partner_count or max(loan_count // 2, 1), rng)
+        
+        statuses = rng.choices(
+            [status for status, _weight in LOAN_STATUS_MIX],
+            weights=[weight for _status, weight in LOAN_STATUS_MIX],
+            k=loan_count,
+        )
+        
+        vals_list = []
+        for status in statuses:
+            weeks = rng.randint(4, 12)
+            if status == 'draft':
+                weeks_ago = 0
+            elif status == 'active':
+                weeks_ago = rng.randint(0, weeks - 1)
+            elif status == 'paid':
+                weeks_ago = weeks + rng.randint(1, 8)
+            else:
+                weeks_ago = rng.randint(3, weeks + 4)
+            amount = round(rng.uniform(500, 5000), 2)
+            product = rng.choice(cls.loan_products)
+            vals_list.append({
+                'partner_id': rng.choice(partners).id,
+                'loan_requested_amount': amount,
+                'loan_released_amount': amount,
+                'loan_interest_rate': product.loan_interest_rate,
+                'loan_weeks': weeks,
+                'loan_amortization_method': rng.choice(['flat', 'price', 'sac']),
+                'loan_start_date': today - timedelta(weeks=weeks_ago),
+                'order_line': [(0, 0, {
+                    'product_id': product.id,
+                    'name': f'Empréstimo {weeks} semanas',
+                    'product_uom_qty': 1,
+                })],
+            })
+        
+        orders = cls.env['sale.order']
+        for batch in split_every(PORTFOLIO_BATCH_SIZE, vals_list, list):
+            orders |= orders.create(batch)
+        
+        orders_by_status = {status: orders.browse() for status, _weight in LOAN_STATUS_MIX}
+        for order, status in zip(orders, statuses):
+            orders_by_status[status] |= order
+        
+        confirmed = orders - orders_by_status['draft']
+        for batch in split_every(PORTFOLIO_BATCH_SIZE, confirmed.ids, orders.browse):
+            batch.action_confirm()
+        
+        cls._generate_payment_history(orders_by_status, rng)
+        return orders_by_status
+    
+    @classmethod
+    def _generate_payment_history(cls, orders_by_status, rng):
+        """Lança no razão os pagamentos de cada empréstimo conforme o status"""
+        today = fields.Date.today()
+        payments = {}
+        renegotiations = {}
+        for status, orders in orders_by_status.items():
+            for order in orders:
+                installments = order.loan_installment_ids.sorted('due_date')
+                if status == 'paid':
+                    paid = installments
+                elif status == 'active':
+                    paid = installments.filtered(lambda i: i.due_date < today)
+                elif status in ('late', 'renegotiated'):
+                    due = installments.filtered(lambda i: i.due_date < today)
+                    paid = due[:rng.randint(0, max(len(due) - 1, 0))]
+                    # Uma parcela vencida paga pela metade
+                    if len(due) > len(paid) + 1 and rng.random() < 0.5:
+                        partial = due[len(paid)]
+                        payments[partial.id] = round(partial.amount / 2, 2)
+                else:
+                    paid = installments.browse()
+                payments.update({installment.id: installment.amount for installment in paid})
+                if status == 'renegotiated':
+                    renegotiations.update({
+                        installment.id: installment.amount - payments.get(installment.id, 0.0)
+                        for installment in installments - paid
+                    })
+        
+        installment_obj = cls.env['loan.installment']
+        for batch in split_every(PORTFOLIO_BATCH_SIZE, list(payments.items()), dict):
+            installment_obj._create_payments(batch, 'manual')
+        for batch in split_every(PORTFOLIO_BATCH_SIZE, list(renegotiations.items()), dict):
+            installment_obj._create_payments(batch, 'renegotiation')
+        
+        for status in ('paid', 'late', 'renegotiated'):
+            if orders_by_status[status]:
+                orders_by_status[status].write({'loan_status': status})
+        installment_obj._cron_refresh_late_status()
+        cls.env.flush_all()
+    
+    @classmethod
+    def _create_loan_orders(cls, partner, count, weeks=4, weeks_ago=0, confirm=True):
+        """Empréstimos iguais do cliente; confirmados, já com as parcelas geradas"""
+        product = cls.loan_products[0]
+        orders = cls.env['sale.order'].create([{
+            'partner_id': partner.id,
+            'loan_requested_amount': 1000.0,
+            'loan_released_amount': 1000.0,
+            'loan_interest_rate': product.loan_interest_rate,
+            'loan_weeks': weeks,
+            'loan_start_date': fields.Date.today() - timedelta(weeks=weeks_ago),
+            'order_line': [(0, 0, {
+                'product_id': product.id,
+                'name': f'Empréstimo {weeks} semanas',
+                'product_uom_qty': 1,
+            })],
+        } for _index in range(count)])
+        if confirm:
+            orders.action_confirm()
+        return orders
+    
+    # ========================================
+    # MEDIÇÃO
+    # ========================================
+    
+    @contextmanager
+    def measure(self):
+        """Mede tempo e consultas SQL do bloco (inclui a gravação pendente no fim)"""
+        result = {}
+        self.env.flush_all()
+        queries = self.env.cr.sql_log_count
+        started = time.perf_counter()
+        yield result
+        self.env.flush_all()
+        result['seconds'] = round(time.perf_counter() - started, 4)
+        result['queries'] = self.env.cr.sql_log_count - queries
+    
+    @contextmanager
+    def isolated(self):
+        """Executa o bloco em um savepoint desfeito no final"""
+        self.env.flush_all()
+        savepoint = self.env.cr.savepoint()
+        try:
+            yield
+        finally:
+            self.env.invalidate_all()
+            savepoint.close(rollback=True)
+            self.env.registry.clear_cache()
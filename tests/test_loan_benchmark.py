@@ -0,0 +1,135 @@
+# -*- coding: utf-8 -*-
+"""Benchmark dos caminhos críticos dos empréstimos.
+
+Fora da suíte padrão; para executar contra um banco local::
+
+    LOAN_BENCHMARK_SIZES=1000,10000,100000 \\
+    LOAN_BENCHMARK_OUTPUT=/tmp/loan_benchmark.json \\
+    odoo-bin -d <banco> -i gt_loan_extension --test-tags loan_benchmark --stop-after-init
+
+Cada operação é medida (tempo e consultas SQL) para cada tamanho de
+carteira; o resultado é gravado em JSON para comparação entre versões.
+"""
+import json
+import logging
+import os
+
+from odoo import fields
+from odoo.modules.module import get_manifest
+from odoo.tests import tagged
+
+from .common import LoanPortfolioCase
+
+_logger = logging.getLogger(__name__)
+
+# Tamanhos de carteira (quantidade de empréstimos) e arquivo de saída
+BENCHMARK_SIZES_ENV = 'LOAN_BENCHMARK_SIZES'
+BENCHMARK_OUTPUT_ENV = 'LOAN_BENCHMARK_OUTPUT'
+DEFAULT_BENCHMARK_SIZES = '1000'
+
+# Os wizards de renegociação individuais são medidos em uma amostra de empréstimos
+RENEGOTIATION_SAMPLE_SIZE = 50
+
+
+@tagged('post_install', '-at_install', '-standard', 'loan_benchmark')
+class TestLoanBenchmark(LoanPortfolioCase):
+    
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.sizes = [int(size) for size in os.environ.get(BENCHMARK_SIZES_ENV, DEFAULT_BENCHMARK_SIZES).split(',') if size.strip()]
+        cls.results = []
+    
+    @classmethod
+    def tearDownClass(cls):
+        report = {
+            'module': 'gt_loan_extension',
+            'version': get_manifest('gt_loan_extension').get('version'),
+            'date': fields.Datetime.to_string(fields.Datetime.now()),
+            'results': cls.results,
+        }
+        output = os.environ.get(BENCHMARK_OUTPUT_ENV)
+        if output:
+            with open(output, 'w', encoding='utf-8') as report_file:
+                json.dump(report, report_file, indent=2)
+        _logger.info("Benchmark de empréstimos: %s", json.dumps(report))
+        super().tearDownClass()
+    
+    def _record(self, operation, size, records, measure):
+        self.results.append(dict(measure, operation=operation, size=size, records=records))
+        _logger.info(
+            "%s (%s empréstimos, %s registros): %.3fs, %s consultas",
+            operation, size, records, measure['seconds'], measure['queries']
+        )
+    
+    def _late_orders(self, portfolio):
+        return portfolio['late'].filtered(lambda order: order.overdue_installments_count)
+    
+    def test_loan_hot_paths(self):
+        for size in self.sizes:
+            with self.subTest(size=size), self.isolated():
+                self._run_benchmarks(size)
+    
+    def _run_benchmarks(self, size):
+        portfolio = self._generate_portfolio(size)
+        confirmed = portfolio['active'] | portfolio['late'] | portfolio['paid']
+        installment_obj = self.env['loan.installment']
+        
+        with self.isolated(), self.measure() as measure:
+            portfolio['draft'].action_confirm()
+        self._record('sale.order.action_confirm', size, len(portfolio['draft']), measure)
+        
+        with self.isolated(), self.measure() as measure:
+            portfolio['active'].action_generate_loan_installments()
+        self._record('sale.order.action_generate_loan_installments', size, len(portfolio['active']), measure)
+        
+        with self.isolated(), self.measure() as measure:
+            self.env['sale.order']._cron_update_loan_status()
+        self._record('sale.order._cron_update_loan_status', size, len(confirmed), measure)
+        
+        # Próxima parcela em aberto de cada empréstimo
+        open_installments = installment_obj.search([
+            ('sale_order_id', 'in', confirmed.ids),
+            ('status', 'in', ['pending', 'late', 'partial']),
+            ('invoice_id', '=', False),
+        ]).grouped('sale_order_id')
+        next_installments = installment_obj.union(*(
+            installments.sorted('due_date')[:1] for installments in open_installments.values()
+        ))
+        with self.isolated(), self.measure() as measure:
+            next_installments.action_generate_invoice()
+        self._record('loan.installment.action_generate_invoice', size, len(next_installments), measure)
+        
+        with self.isolated():
+            next_installments.with_context(loan_post_invoices=True).action_generate_invoice()
+            with self.measure() as measure:
+                installment_obj._check_invoice_payments()
+        self._record('loan.installment._check_invoice_payments', size, len(next_installments), measure)
+        
+        late_orders = self._late_orders(portfolio)
+        with self.isolated(), self.measure() as measure:
+            self.env['loan.installment.renegotiation.batch.wizard'].create({
+                'sale_order_ids': [(6, 0, late_orders.ids)],
+                'renegotiation_type': 'extend',
+            }).action_confirm_renegotiation()
+        self._record('loan.installment.renegotiation.batch.wizard', size, len(late_orders), measure)
+        
+        sample = late_orders[:RENEGOTIATION_SAMPLE_SIZE]
+        with self.isolated(), self.measure() as measure:
+            for order in sample:
+                self.env['loan.installment.renegotiation.wizard'].create({
+                    'sale_order_id': order.id,
+                    'renegotiation_type': 'extend',
+                }).action_confirm_renegotiation()
+        self._record('loan.installment.renegotiation.wizard', size, len(sample), measure)
+        
+        sample = (portfolio['active'] | late_orders)[:RENEGOTIATION_SAMPLE_SIZE]
+        with self.isolated(), self.measure() as measure:
+            for order in sample:
+                self.env['loan.renegotiation.wizard'].create({
+                    'original_order_id': order.id,
+                    'partner_id': order.partner_id.id,
+                    'balance_due': order.loan_balance,
+                    'new_loan_amount': order.loan_balance + 500.0,
+                }).action_confirm_renegotiation()
+        self._record('loan.renegotiation.wizard', size, len(sample), measure)
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+import logging
+import random
+
+from odoo.tests import tagged
+
+from .common import LoanPortfolioCase, generate_cpf
+
+_logger = logging.getLogger(__name__)
+
+# Tamanhos comparados: a quantidade de consultas deve ser a mesma
+QUERY_COUNT_SIZES = (3, 12)
+
+
+@tagged('post_install', '-at_install')
+class TestLoanQueryCount(LoanPortfolioCase):
+    """As ações em lote não podem fazer consultas por parcela ou por ordem.
+    
+    Nas ações que criam ou excluem faturas, o custo do módulo de contabilidade
+    (que não é O(1)) é medido na mesma execução, com a mesma operação feita
+    diretamente em ``account.move``, e descontado; o que sobra é o custo do
+    próprio módulo, que também precisa ser constante.
+    """
+    
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.partner = cls.env['res.partner'].create({
+            'name': 'Cliente Consultas',
+            'cpf': generate_cpf(random.Random(7)),
+        })
+    
+    def _count_queries(self, prepare, action, sizes):
+        """Consultas de ``action(prepare(size))`` por tamanho.
+        
+        A primeira execução aquece os caches e é descartada; cada execução
+        começa com o cache do ORM vazio e é desfeita no final.
+        """
+        counts = []
+        for size in (sizes[0],) + tuple(sizes):
+            with self.isolated():
+                records = prepare(size)
+                self.env.invalidate_all()
+                with self.measure() as measure:
+                    action(records)
+                counts.append(measure['queries'])
+        return dict(zip(sizes, counts[1:]))
+    
+    def assertQueryCountConstant(self, name, prepare, action, baseline=None, sizes=QUERY_COUNT_SIZES):
+        """A quantidade de consultas não pode variar com o tamanho do lote.
+        
+        ``baseline`` é a parte da ação feita pelo módulo de contabilidade,
+        medida à parte sobre os mesmos dados e descontada das contagens.
+        As contagens observadas vão para o log.
+        """
+        counts = self._count_queries(prepare, action, sizes)
+        if baseline:
+            accounting = self._count_queries(prepare, baseline, sizes)
+            _logger.info("Consultas de %s por tamanho do lote: %s (contabilidade: %s)", name, counts, accounting)
+            counts = {size: counts[size] - accounting[size] for size in sizes}
+        else:
+            _logger.info("Consultas de %s por tamanho do lote: %s", name, counts)
+        self.assertEqual(
+            len(set(counts.values())), 1,
+            f"{name}: a quantidade de consultas varia com o tamanho do lote: {counts}"
+        )
+    
+    def test_generate_loan_installments(self):
+        self.assertQueryCountConstant(
+            'generate_loan_installments',
+            lambda size: self._create_loan_orders(self.partner, size, confirm=False),
+            lambda orders: orders.action_generate_loan_installments(),
+        )
+    
+    def test_register_payment(self):
+        self.assertQueryCountConstant(
+            'register_payment',
+            lambda size: self._create_loan_orders(self.partner, size).loan_installment_ids,
+            lambda installments: installments.action_register_payment(),
+        )
+    
+    def test_generate_invoice(self):
+        def create_invoices(installments):
+            loan_product, tax_ids = self.env['product.product']._get_loan_product()
+            self.env['account.move'].create([
+                installment._prepare_invoice_vals(loan_product, tax_ids) for installment in installments
+            ])
+        
+        self.assertQueryCountConstant(
+            'generate_invoice',
+            lambda size: self._create_loan_orders(self.partner, size).loan_installment_ids.filtered(
+                lambda installment: installment.number == 1
+            ),
+            lambda installments: installments.action_generate_invoice(),
+            baseline=create_invoices,
+        )
+    
+    def test_cancel_invoice(self):
+        def prepare(size):
+            installments = self._create_loan_orders(self.partner, 1, weeks=size).loan_installment_ids
+            installments.action_generate_consolidated_invoice()
+            return installments[:1]
+        
+        def delete_invoice(installment):
+            invoice = installment.invoice_id
+            invoice.button_draft()
+            invoice.unlink()
+        
+        self.assertQueryCountConstant(
+            'cancel_invoice', prepare, lambda installment: installment.action_cancel_invoice(),
+            baseline=delete_invoice,
+        )
+    
+    def test_installment_renegotiation_wizard(self):
+        def prepare(size):
+            order = self._create_loan_orders(self.partner, 1, weeks=size, weeks_ago=size + 1)
+            return self.env['loan.installment.renegotiation.wizard'].create({
+                'sale_order_id': order.id,
+                'renegotiation_type': 'extend',
+            })
+        
+        self.assertQueryCountConstant(
+            'installment_renegotiation_wizard', prepare, lambda wizard: wizard.action_confirm_renegotiation()
+        )
+    
+    def test_loan_renegotiation_wizard(self):
+        def prepare(size):
+            order = self._create_loan_orders(self.partner, 1, weeks=size, weeks_ago=size + 1)
+            return self.env['loan.renegotiation.wizard'].create({
+                'original_order_id': order.id,
+                'partner_id': order.partner_id.id,
+                'balance_due': order.loan_balance,
+                'new_loan_amount': order.loan_balance + 500.0,
+            })
+        
+        self.assertQueryCountConstant(
+            'loan_renegotiation_wizard', prepare, lambda wizard: wizard.action_confirm_renegotiation()
+        )
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+import random
+
+from odoo.exceptions import ValidationError
+from odoo.tests import TransactionCase, tagged
+
+from .common import generate_cnpj, generate_cpf
+
+
+@tagged('post_install', '-at_install')
+class TestResPartnerDocument(TransactionCase):
+    """CPF/CNPJ únicos entre os contatos, sem impedir a duplicação do contato"""
+    
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        rng = random.Random(19)
+        cls.partner = cls.env['res.partner'].create({
+            'name': 'Cliente Documento',
+            'cpf': generate_cpf(rng),
+            'cnpj': generate_cnpj(rng),
+        })
+    
+    def test_copy_partner_with_documents(self):
+        copy = self.partner.copy()
+        self.assertFalse(copy.cpf)
+        self.assertFalse(copy.cnpj)
+        self.assertFalse(copy.cpf_digits)
+        self.assertFalse(copy.cnpj_digits)
+    
+    def test_duplicate_document_on_archived_partner(self):
+        self.partner.active = False
+        with self.assertRaises(ValidationError):
+            self.env['res.partner'].create({'name': 'Outro Cliente', 'cpf': self.partner.cpf})
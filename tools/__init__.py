@@ -0,0 +1,6 @@
+# -*- coding: utf-8 -*-
+from . import loan_schedule
+from . import loan_renegotiation
+from . import loan_allocation
+from . import loan_statement
+from . import br_document
@@ -0,0 +1,60 @@
+# -*- coding: utf-8 -*-
+"""Normalização e validação em lote de CPF e CNPJ (vetorizada com NumPy).
+
+Os dígitos de todos os documentos viram uma matriz (documentos x dígitos) e
+os dígitos verificadores são calculados de uma vez com produtos matriciais,
+em vez de um laço por dígito para cada cadastro.
+"""
+import re
+
+import numpy as np
+
+CPF_LENGTH = 11
+CNPJ_LENGTH = 14
+
+# Pesos dos dígitos verificadores
+CPF_WEIGHTS = (np.arange(10, 1, -1), np.arange(11, 1, -1))
+CNPJ_WEIGHTS = (
+    np.array([5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]),
+    np.array([6, 5, 4, 3, 2, 9, 8, 7, 6, 5, 4, 3, 2]),
+)
+
+_NON_DIGITS = re.compile(r'[^0-9]')
+
+
+def clean_document(document):
+    """Só os dígitos do documento ('' se vazio)"""
+    return _NON_DIGITS.sub('', document or '')
+
+
+def _validate(documents, length, weights):
+    digits = [clean_document(document) for document in documents]
+    valid = np.zeros(len(digits), dtype=bool)
+    candidates = np.array([len(document) == length for document in digits], dtype=bool)
+    if not candidates.any():
+        return valid
+    
+    matrix = np.frombuffer(
+        ''.join(document for document, candidate in zip(digits, candidates) if candidate).encode('ascii'),
+        dtype=np.uint8,
+    ).reshape(-1, length).astype(np.int64) - ord('0')
+    
+    ok = ~(matrix == matrix[:, :1]).all(axis=1)   # todos os dígitos iguais não vale
+    for position_weights in weights:
+        position = len(position_weights)
+        check_digit = 11 - (matrix[:, :position] @ position_weights) % 11
+        check_digit[check_digit >= 10] = 0
+        ok &= check_digit == matrix[:, position]
+    
+    valid[candidates] = ok
+    return valid
+
+
+def validate_cpfs(documents):
+    """Array booleano com a validade de cada CPF (formatado ou não)"""
+    return _validate(documents, CPF_LENGTH, CPF_WEIGHTS)
+
+
+def validate_cnpjs(documents):
+    """Array booleano com a validade de cada CNPJ (formatado ou não)"""
+    return _validate(documents, CNPJ_LENGTH, CNPJ_WEIGHTS)
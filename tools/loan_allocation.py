@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+"""Alocação de recebimentos em cascata (parcela mais antiga primeiro).
+
+Função pura: recebe os saldos das parcelas abertas já ordenados por
+vencimento e os recebimentos, e devolve a divisão de cada recebimento entre
+as parcelas, sem acessar o banco. Recebimentos do mesmo cliente consomem os
+saldos em sequência, então um lote com milhares de recebimentos é alocado
+em uma única passada.
+"""
+from collections import namedtuple
+
+# Parcela em aberto: id, ordem de venda e saldo a receber
+OpenInstallment = namedtuple('OpenInstallment', ['id', 'order_id', 'balance'])
+
+
+def allocate_waterfall(open_installments, receipts, precision=2):
+    """Aloca cada recebimento nas parcelas abertas do cliente, da mais antiga para a mais nova.
+    
+    :param open_installments: {cliente: [OpenInstallment, ...]} em ordem de vencimento
+    :param receipts: lista de dicionários com ``partner_id``, ``amount`` e,
+        opcionalmente, ``order_ids`` (restringe a alocação a esses empréstimos)
+    :return: (alocações, sobras) — alocações é a lista de
+        (índice do recebimento, id da parcela, valor) e sobras é a lista, na
+        ordem dos recebimentos, do valor que não coube em nenhuma parcela
+    """
+    remaining = {
+        installment.id: round(installment.balance, precision)
+        for installments in open_installments.values()
+        for installment in installments
+    }
+    # Posição da primeira parcela ainda aberta de cada cliente (evita revarrer as quitadas)
+    first_open = dict.fromkeys(open_installments, 0)
+    
+    allocations = []
+    leftovers = []
+    for index, receipt in enumerate(receipts):
+        partner_id = receipt['partner_id']
+        amount = round(float(receipt['amount']), precision)
+        order_ids = receipt.get('order_ids')
+        installments = open_installments.get(partner_id, [])
+        
+        position = first_open.get(partner_id, 0)
+        while position < len(installments) and remaining[installments[position].id] <= 0:
+            position += 1
+        first_open[partner_id] = position
+        
+        for installment in installments[position:]:
+            if amount <= 0:
+                break
+            if order_ids and installment.order_id not in order_ids:
+                continue
+            balance = remaining[installment.id]
+            if balance <= 0:
+                continue
+            allocated = min(balance, amount)
+            remaining[installment.id] = round(balance - allocated, precision)
+            amount = round(amount - allocated, precision)
+            allocations.append((index, installment.id, allocated))
+        
+        leftovers.append(max(amount, 0.0))
+    
+    return allocations, leftovers
@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Simulador de renegociação de parcelas (sem efeitos colaterais).
+
+Trabalha só com o retrato da situação do empréstimo (saldo devedor e
+quantidade de parcelas abertas) e com os termos de cada cenário, sem acessar
+o banco. Vários cenários são calculados em uma única chamada, com os
+cronogramas gerados de uma vez pelo motor vetorizado.
+"""
+from .loan_schedule import schedule_rows, split_evenly
+
+RENEGOTIATION_TYPES = [
+    ('extend', 'Estender Prazo'),
+    ('discount', 'Aplicar Desconto'),
+    ('new_terms', 'Novos Termos Completos'),
+]
+
+
+def renegotiated_terms(current_balance, pending_count, terms):
+    """Retorna (novo saldo, total de semanas) de um cenário.
+    
+    ``terms`` é um dicionário com ``renegotiation_type`` e os parâmetros do
+    tipo (``extension_weeks``, ``discount_type``, ``discount_percentage``,
+    ``discount_amount``, ``new_interest_rate``, ``new_weeks``).
+    """
+    renegotiation_type = terms.get('renegotiation_type')
+    new_balance = current_balance
+    new_total_weeks = 0
+    
+    if renegotiation_type == 'extend':
+        # Extensão de prazo - mantém saldo, redistribui
+        new_total_weeks = pending_count + (terms.get('extension_weeks') or 0)
+        
+    elif renegotiation_type == 'discount':
+        # Aplicar desconto
+        if terms.get('discount_type') == 'fixed':
+            discount = terms.get('discount_amount') or 0.0
+        else:
+            discount = current_balance * ((terms.get('discount_percentage') or 0.0) / 100)
+        
+        new_balance = max(0, current_balance - discount)
+        new_total_weeks = pending_count
+        
+    elif renegotiation_type == 'new_terms':
+        # Novos termos completos
+        new_interest_rate = terms.get('new_interest_rate')
+        new_weeks = terms.get('new_weeks')
+        if new_interest_rate and new_weeks:
+            # Aplica juros no saldo atual
+            new_balance = current_balance * (1 + new_interest_rate / 100)
+            new_total_weeks = new_weeks
+        else:
+            new_total_weeks = new_weeks or pending_count
+    
+    return new_balance, max(int(new_total_weeks), 0)
+
+
+def simulate_renegotiation(current_balance, pending_count, scenarios):
+    """Simula vários cenários de renegociação de um empréstimo de uma vez.
+    
+    :param current_balance: saldo devedor das parcelas abertas
+    :param pending_count: quantidade de parcelas abertas
+    :param scenarios: lista de dicionários de termos (ver ``renegotiated_terms``)
+    :return: lista, na ordem dos cenários, de dicionários com ``new_balance``,
+        ``new_total_weeks``, ``new_installment_amount`` e ``schedule`` (lista
+        de (valor, amortização, juros) de cada nova parcela)
+    """
+    if not scenarios:
+        return []
+    
+    terms = [renegotiated_terms(current_balance, pending_count, scenario) for scenario in scenarios]
+    balances = [new_balance for new_balance, _weeks in terms]
+    schedules = split_evenly(
+        balances,
+        [weeks for _balance, weeks in terms],
+        principals=[min(current_balance, new_balance) for new_balance in balances],
+    )
+    
+    results = []
+    for index, (new_balance, new_total_weeks) in enumerate(terms):
+        schedule = schedule_rows(schedules, index)
+        results.append({
+            'new_balance': new_balance,
+            'new_total_weeks': new_total_weeks,
+            'new_installment_amount': schedule[0][0] if schedule else 0.0,
+            'schedule': schedule,
+        })
+    return results
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""Motor de cronogramas de empréstimos (vetorizado com NumPy).
+
+Calcula de uma só vez os cronogramas completos de muitos empréstimos, com a
+divisão de cada parcela entre amortização e juros. Métodos suportados:
+
+- ``flat``: juros compostos sobre o prazo total, divididos em parcelas iguais
+  (regra original do módulo);
+- ``price``: Tabela Price (sistema francês, parcelas iguais);
+- ``sac``: Sistema de Amortização Constante.
+
+Os valores são arredondados ao centavo e a diferença do arredondamento vai
+para a última parcela, de modo que a soma das parcelas bate exatamente com o
+total do empréstimo.
+"""
+from collections import namedtuple
+
+import numpy as np
+
+AMORTIZATION_METHODS = [
+    ('flat', 'Parcelas Iguais (Juros Compostos)'),
+    ('price', 'Tabela Price'),
+    ('sac', 'SAC'),
+]
+
+# Intervalo, em dias, entre duas parcelas
+INSTALLMENT_INTERVAL_DAYS = 7
+
+LoanSchedules = namedtuple('LoanSchedules', [
+    'amount',       # (n, m) valor de cada parcela
+    'principal',    # (n, m) amortização de cada parcela
+    'interest',     # (n, m) juros de cada parcela
+    'mask',         # (n, m) True nas posições que existem (k < quantidade)
+    'total',        # (n,) total a pagar
+    'counts',       # (n,) quantidade de parcelas
+])
+
+
+def installment_rates(rates, interest_periods, interval_days=INSTALLMENT_INTERVAL_DAYS):
+    """Converte a taxa (%) por período de juros em taxa decimal por parcela"""
+    rates = np.asarray(rates, dtype=float) / 100.0
+    periods = np.asarray(interest_periods, dtype=float)
+    periods = np.where(periods > 0, periods, interval_days)
+    return (1.0 + rates) ** (interval_days / periods) - 1.0
+
+
+def _distribute_cents(values, totals, mask, counts):
+    """Arredonda ao centavo e coloca a diferença para ``totals`` na última parcela"""
+    cents = np.where(mask, np.round(values * 100.0), 0.0)
+    remainder = np.round(np.asarray(totals) * 100.0) - cents.sum(axis=1)
+    rows = np.nonzero(counts > 0)[0]
+    cents[rows, counts[rows] - 1] += remainder[rows]
+    return cents / 100.0
+
+
+def compute_schedules(principals, rates, interest_periods, counts, methods='flat',
+                      interval_days=INSTALLMENT_INTERVAL_DAYS):
+    """Calcula os cronogramas de vários empréstimos em uma única operação.
+    
+    :param principals: valores liberados, um por empréstimo
+    :param rates: taxas de juros (%) por período de juros
+    :param interest_periods: períodos de juros em dias
+    :param counts: quantidade de parcelas de cada empréstimo
+    :param methods: método de amortização (um para todos ou um por empréstimo)
+    :return: ``LoanSchedules`` com matrizes (empréstimos x parcelas)
+    """
+    principals = np.asarray(principals, dtype=float)
+    counts = np.maximum(np.asarray(counts, dtype=int), 0)
+    n = principals.shape[0]
+    width = int(counts.max()) if n else 0
+    methods = np.broadcast_to(np.asarray(methods, dtype=object), (n,))
+    
+    rate = installment_rates(rates, interest_periods, interval_days)
+    safe_counts = np.maximum(counts, 1)
+    
+    k = np.arange(1, width + 1, dtype=float)[np.newaxis, :]     # número da parcela (1..m)
+    mask = k <= counts[:, np.newaxis]
+    r = rate[:, np.newaxis]
+    p = principals[:, np.newaxis]
+    c = safe_counts[:, np.newaxis].astype(float)
+    growth = (1.0 + r) ** k
+    
+    # Flat: juros compostos sobre o prazo todo, parcelas e amortização iguais
+    flat_total = principals * (1.0 + rate) ** safe_counts
+    flat_amount = np.broadcast_to((flat_total / safe_counts)[:, np.newaxis], (n, width))
+    flat_principal = np.broadcast_to(p / c, (n, width))
+    
+    # Price: parcela constante, amortização crescente
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pmt = np.where(rate > 0, principals * rate / (1.0 - (1.0 + rate) ** -safe_counts), principals / safe_counts)
+    price_principal = (pmt - principals * rate)[:, np.newaxis] * growth / (1.0 + r)
+    price_amount = np.broadcast_to(pmt[:, np.newaxis], (n, width))
+    
+    # SAC: amortização constante, juros sobre o saldo anterior
+    sac_principal = np.broadcast_to(p / c, (n, width))
+    sac_amount = sac_principal + (p - (k - 1.0) * p / c) * r
+    
+    is_price = (methods == 'price')[:, np.newaxis]
+    is_sac = (methods == 'sac')[:, np.newaxis]
+    amount = np.where(is_price, price_amount, np.where(is_sac, sac_amount, flat_amount))
+    principal = np.where(is_price, price_principal, np.where(is_sac, sac_principal, flat_principal))
+    
+    total = np.where(mask, amount, 0.0).sum(axis=1)
+    total = np.where(methods == 'flat', flat_total, total)
+    total = np.where(counts > 0, np.round(total, 2), 0.0)
+    
+    amount = _distribute_cents(amount, total, mask, counts)
+    principal = _distribute_cents(principal, np.round(principals, 2), mask, counts)
+    interest = np.where(mask, np.round(amount - principal, 2), 0.0)
+    
+    return LoanSchedules(amount, principal, interest, mask, total, counts)
+
+
+def schedule_rows(schedules, index):
+    """Lista de (valor, amortização, juros) das parcelas de um empréstimo"""
+    count = int(schedules.counts[index])
+    return [
+        (float(schedules.amount[index, k]), float(schedules.principal[index, k]), float(schedules.interest[index, k]))
+        for k in range(count)
+    ]
+
+
+def split_evenly(totals, counts, principals=None):
+    """Divide cada total em parcelas iguais, ao centavo.
+    
+    Quando ``principals`` é informado, a parte de cada parcela que excede a
+    amortização igual desse valor é tratada como juros.
+    """
+    totals = np.asarray(totals, dtype=float)
+    flat_periods = np.full_like(totals, INSTALLMENT_INTERVAL_DAYS)
+    schedules = compute_schedules(totals, np.zeros_like(totals), flat_periods, counts)
+    if principals is None:
+        return schedules
+    
+    principal = compute_schedules(principals, np.zeros_like(totals), flat_periods, counts).amount
+    interest = np.where(schedules.mask, np.round(schedules.amount - principal, 2), 0.0)
+    return schedules._replace(principal=principal, interest=interest)
@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+"""Leitura em fluxo de extratos e arquivos de retorno bancário.
+
+Cada leitor é um gerador: percorre o arquivo linha a linha, sem carregá-lo
+inteiro na memória, e produz um ``StatementRecord`` por recebimento. O
+parâmetro ``start_line`` permite retomar a leitura depois da última linha já
+processada (checkpoint da importação).
+
+Formatos suportados:
+
+- ``csv``: cabeçalho com as colunas documento, referencia, valor, data e
+  identificador (separador ``;`` ou ``,``);
+- ``cnab240``: retorno de cobrança FEBRABAN, segmentos T (título e sacado)
+  e U (valores e datas) de cada registro de detalhe;
+- ``cnab400``: retorno de cobrança no layout de 400 posições (Bradesco),
+  registros de detalhe tipo 1.
+"""
+import csv
+import re
+from collections import namedtuple
+from datetime import datetime
+
+STATEMENT_FORMATS = [
+    ('csv', 'CSV'),
+    ('cnab240', 'CNAB 240'),
+    ('cnab400', 'CNAB 400'),
+]
+
+# Um recebimento lido do arquivo; ``line_number`` é a última linha que o compõe
+StatementRecord = namedtuple('StatementRecord', [
+    'line_number',
+    'document',     # CPF/CNPJ do pagador, só dígitos
+    'reference',    # referência informada (ex.: número da ordem)
+    'amount',
+    'date',
+    'memo',         # identificador do pagamento (nosso número, id do PIX...)
+])
+
+# Nomes aceitos para cada coluna do CSV
+CSV_COLUMNS = {
+    'document': ('documento', 'cpf_cnpj', 'cpf', 'cnpj', 'document'),
+    'reference': ('referencia', 'referência', 'pedido', 'ordem', 'reference'),
+    'amount': ('valor', 'valor_pago', 'amount'),
+    'date': ('data', 'data_pagamento', 'date'),
+    'memo': ('identificador', 'id', 'txid', 'memo', 'historico', 'histórico'),
+}
+
+
+def only_digits(value):
+    return re.sub(r'[^0-9]', '', value or '')
+
+
+def parse_amount(value):
+    """Converte '1.234,56', '1234.56' ou '1234,56' em float"""
+    value = (value or '').strip().replace('R$', '').replace(' ', '')
+    if not value:
+        return 0.0
+    if ',' in value:
+        value = value.replace('.', '').replace(',', '.')
+    return float(value)
+
+
+def parse_date(value, date_formats=('%d/%m/%Y', '%Y-%m-%d', '%d%m%Y')):
+    """Converte a data do arquivo (por padrão dd/mm/aaaa, aaaa-mm-dd ou ddmmaaaa)"""
+    value = (value or '').strip()
+    for date_format in date_formats:
+        try:
+            return datetime.strptime(value, date_format).date()
+        except ValueError:
+            continue
+    return None
+
+
+def _cnab_amount(value):
+    """Valores CNAB: inteiro com 2 casas decimais implícitas"""
+    digits = only_digits(value)
+    return int(digits) / 100.0 if digits else 0.0
+
+
+def iter_csv_records(path, start_line=0, encoding='utf-8-sig'):
+    with open(path, newline='', encoding=encoding) as statement:
+        header = statement.readline()
+        delimiter = ';' if header.count(';') > header.count(',') else ','
+        columns = [column.strip().lower() for column in next(csv.reader([header], delimiter=delimiter))]
+        positions = {
+            key: next((columns.index(alias) for alias in aliases if alias in columns), None)
+            for key, aliases in CSV_COLUMNS.items()
+        }
+        
+        def get(row, key):
+            position = positions[key]
+            return row[position].strip() if position is not None and position < len(row) else ''
+        
+        # O cabeçalho é a linha 1
+        for line_number, row in enumerate(csv.reader(statement, delimiter=delimiter), start=2):
+            if line_number <= start_line or not any(row):
+                continue
+            yield StatementRecord(
+                line_number,
+                only_digits(get(row, 'document')),
+                get(row, 'reference'),
+                parse_amount(get(row, 'amount')),
+                parse_date(get(row, 'date')),
+                get(row, 'memo'),
+            )
+
+
+def iter_cnab240_records(path, start_line=0, encoding='latin-1'):
+    segment_t = None
+    with open(path, encoding=encoding) as statement:
+        for line_number, line in enumerate(statement, start=1):
+            if line_number <= start_line:
+                continue
+            # Registro de detalhe (tipo 3); segmento na posição 14
+            if len(line) < 240 or line[7] != '3':
+                continue
+            segment = line[13]
+            if segment == 'T':
+                segment_t = line
+            elif segment == 'U' and segment_t:
+                # Tipo de inscrição do sacado: 1 = CPF (11 dígitos), 2 = CNPJ (14 dígitos)
+                document = only_digits(segment_t[133:148])
+                document = document[-11:] if segment_t[132] == '1' else document[-14:]
+                yield StatementRecord(
+                    line_number,
+                    document,
+                    segment_t[58:73].strip(),
+                    _cnab_amount(line[77:92]),
+                    parse_date(line[137:145], ('%d%m%Y',)),
+                    segment_t[37:57].strip(),
+                )
+                segment_t = None
+
+
+def iter_cnab400_records(path, start_line=0, encoding='latin-1'):
+    with open(path, encoding=encoding) as statement:
+        for line_number, line in enumerate(statement, start=1):
+            if line_number <= start_line:
+                continue
+            # Registro de detalhe (tipo 1)
+            if len(line) < 400 or line[0] != '1':
+                continue
+            document = only_digits(line[3:17])
+            # Tipo de inscrição 01 = CPF (11 dígitos), 02 = CNPJ (14 dígitos)
+            document = document[-11:] if line[1:3] == '01' else document[-14:]
+            yield StatementRecord(
+                line_number,
+                document,
+                line[37:62].strip() or line[116:126].strip(),
+                _cnab_amount(line[253:266]),
+                parse_date(line[110:116], ('%d%m%y',)),
+                line[70:82].strip(),
+            )
+
+
+STATEMENT_READERS = {
+    'csv': iter_csv_records,
+    'cnab240': iter_cnab240_records,
+    'cnab400': iter_cnab400_records,
+}
+
+
+def iter_statement_records(path, file_format, start_line=0):
+    """Gerador de recebimentos do arquivo, a partir da linha ``start_line`` (exclusive)"""
+    return STATEMENT_READERS[file_format](path, start_line=start_line)
+
+
+# ---------------------------------------------------------------------------
+# Índice de conciliação (em memória)
+# ---------------------------------------------------------------------------
+
+MatchIndex = namedtuple('MatchIndex', [
+    'documents',    # CPF/CNPJ (dígitos) -> {clientes}
+    'orders',       # número da ordem (maiúsculas) -> (cliente, ordem)
+    'amounts',      # {(cliente, saldo em centavos)} das parcelas abertas
+])
+
+
+def build_match_index(rows):
+    """Monta o índice a partir das parcelas abertas.
+    
+    ``rows`` é um iterável de (cliente, ordem, número da ordem, CPF, CNPJ,
+    saldo da parcela), com os documentos já reduzidos a dígitos.
+    """
+    documents = {}
+    orders = {}
+    amounts = set()
+    for partner_id, order_id, order_name, cpf, cnpj, balance in rows:
+        for document in (cpf, cnpj):
+            if document:
+                documents.setdefault(document, set()).add(partner_id)
+        if order_name:
+            orders[order_name.strip().upper()] = (partner_id, order_id)
+        amounts.add((partner_id, round(balance * 100)))
+    return MatchIndex(documents, orders, amounts)
+
+
+def match_record(index, record):
+    """Recebimento (no formato do motor de alocação) do registro, ou None se não conciliar.
+    
+    A referência com o número da ordem tem prioridade e restringe a alocação
+    àquele empréstimo; sem ela, vale o CPF/CNPJ do pagador. Se o documento
+    pertencer a mais de um cliente, desempata pelo cliente que tem uma
+    parcela aberta com exatamente o valor recebido.
+    """
+    if record.amount <= 0:
+        return None
+    
+    receipt = {'amount': record.amount, 'date': record.date, 'memo': record.memo or record.reference}
+    
+    order = index.orders.get((record.reference or '').strip().upper())
+    if order:
+        receipt.update(partner_id=order[0], order_ids={order[1]})
+        return receipt
+    
+    partners = index.documents.get(record.document, set())
+    if len(partners) > 1:
+        cents = round(record.amount * 100)
+        partners = {partner_id for partner_id in partners if (partner_id, cents) in index.amounts}
+    if len(partners) != 1:
+        return None
+    
+    receipt['partner_id'] = next(iter(partners))
+    return receipt
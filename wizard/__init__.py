@@ -1,3 +1,6 @@
 # wizard/__init__.py
 from . import loan_renegotiation
+from . import loan_renegotiation_terms
 from . import loan_installment_renegotiation_wizard
+from . import loan_installment_renegotiation_batch_wizard
+from . import loan_payment_wizard
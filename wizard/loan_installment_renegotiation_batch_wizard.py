@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from odoo.exceptions import UserError
+from odoo.tools.safe_eval import safe_eval
+import logging
+
+from ..models.loan_perf_sample import instrument
+
+_logger = logging.getLogger(__name__)
+
+class LoanInstallmentRenegotiationBatchWizard(models.TransientModel):
+    """Renegociação em lote das parcelas atrasadas de vários empréstimos.
+    
+    Aplica os mesmos termos às ordens selecionadas (ou às que atendem a um
+    domínio). Ordens sem saldo ou sem atraso são relatadas como falhas sem
+    interromper as demais.
+    """
+    _name = 'loan.installment.renegotiation.batch.wizard'
+    _inherit = 'loan.renegotiation.terms.mixin'
+    _description = 'Wizard de Renegociação de Parcelas em Lote'
+    
+    sale_order_ids = fields.Many2many(
+        'sale.order',
+        string='Empréstimos',
+        domain=[('is_loan_order', '=', True)],
+        help='Empréstimos a renegociar; deixe vazio para usar o filtro abaixo'
+    )
+    
+    order_domain = fields.Char(
+        string='Filtro de Empréstimos',
+        default="[('overdue_installments_count', '>', 0)]",
+        help='Usado quando nenhum empréstimo é selecionado'
+    )
+    
+    currency_id = fields.Many2one(
+        'res.currency',
+        string='Moeda',
+        default=lambda self: self.env.company.currency_id,
+        readonly=True
+    )
+    
+    state = fields.Selection([
+        ('draft', 'Rascunho'),
+        ('done', 'Concluído')
+    ], string='Situação', default='draft', readonly=True)
+    
+    renegotiated_count = fields.Integer(string='Empréstimos Renegociados', readonly=True)
+    
+    failed_count = fields.Integer(string='Falhas', readonly=True)
+    
+    result_log = fields.Text(string='Resultado', readonly=True)
+    
+    @api.model
+    def default_get(self, fields_list):
+        res = super().default_get(fields_list)
+        if self.env.context.get('active_model') == 'sale.order' and self.env.context.get('active_ids'):
+            res['sale_order_ids'] = [(6, 0, self.env.context['active_ids'])]
+        return res
+    
+    def _get_orders(self):
+        """Empréstimos selecionados ou encontrados pelo filtro"""
+        self.ensure_one()
+        if self.sale_order_ids:
+            return self.sale_order_ids
+        
+        domain = safe_eval(self.order_domain or '[]')
+        return self.env['sale.order'].search(domain + [
+            ('is_loan_order', '=', True),
+            ('loan_status', 'in', ['active', 'late']),
+        ])
+    
+    def _try_apply_plans(self, plans):
+        """Aplica os planos; se o lote falhar, reaplica ordem a ordem para isolar as falhas"""
+        try:
+            with self.env.cr.savepoint():
+                self._apply_renegotiation_plans(plans)
+            return {}
+        except Exception:
+            _logger.exception("Falha na renegociação em lote; reaplicando empréstimo a empréstimo")
+            self.env.invalidate_all()
+        
+        failures = {}
+        for plan in plans:
+            try:
+                with self.env.cr.savepoint():
+                    self._apply_renegotiation_plans([plan])
+            except Exception as error:
+                self.env.invalidate_all()
+                failures[plan['order']] = str(error)
+        return failures
+    
+    @instrument('loan.installment.renegotiation.batch.wizard.action_confirm_renegotiation')
+    def action_confirm_renegotiation(self):
+        """Renegocia todos os empréstimos com os mesmos termos"""
+        self.ensure_one()
+        
+        orders = self._get_orders()
+        if not orders:
+            raise UserError("Nenhum empréstimo encontrado para renegociar!")
+        
+        _logger.info("Iniciando renegociação em lote de %s empréstimo(s)", len(orders))
+        
+        # Situação de todas as ordens em uma única consulta
+        situation = orders._get_loan_renegotiation_situation()
+        
+        plans = []
+        failures = {}
+        for order in orders:
+            current_balance, pending_count, overdue_count, _oldest_overdue = situation.get(order.id, (0.0, 0, 0, None))
+            if not order.is_loan_order:
+                failures[order] = "Não é uma ordem de empréstimo"
+            elif current_balance <= 0:
+                failures[order] = "Não há saldo devedor para renegociar"
+            elif not overdue_count:
+                failures[order] = "Não há parcelas atrasadas para renegociar"
+            else:
+                plan = self._prepare_renegotiation_plan(order, current_balance, pending_count)
+                if plan['weeks'] <= 0:
+                    failures[order] = "Prazo da renegociação deve ser maior que zero"
+                else:
+                    plans.append(plan)
+        
+        failures.update(self._try_apply_plans(plans))
+        
+        renegotiated = [plan['order'] for plan in plans if plan['order'] not in failures]
+        lines = [f"✅ {order.name}" for order in renegotiated]
+        lines += [f"❌ {order.name}: {message}" for order, message in failures.items()]
+        
+        self.write({
+            'state': 'done',
+            'renegotiated_count': len(renegotiated),
+            'failed_count': len(failures),
+            'result_log': '\n'.join(lines),
+        })
+        
+        _logger.info("Renegociação em lote concluída: %s renegociados, %s falhas",
+                     len(renegotiated), len(failures))
+        
+        return {
+            'name': 'Renegociação em Lote',
+            'type': 'ir.actions.act_window',
+            'res_model': self._name,
+            'res_id': self.id,
+            'view_mode': 'form',
+            'target': 'new',
+        }
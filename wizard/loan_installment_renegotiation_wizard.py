@@ -1,13 +1,16 @@
 # -*- coding: utf-8 -*-
 from odoo import models, fields, api
-from odoo.exceptions import ValidationError, UserError
-from datetime import datetime, timedelta
+from odoo.exceptions import UserError
 import logging
 
+from ..models.loan_perf_sample import instrument
+from ..tools.loan_renegotiation import RENEGOTIATION_TYPES, simulate_renegotiation
+
 _logger = logging.getLogger(__name__)
 
 class LoanInstallmentRenegotiationWizard(models.TransientModel):
     _name = 'loan.installment.renegotiation.wizard'
+    _inherit = 'loan.renegotiation.terms.mixin'
     _description = 'Wizard de Renegociação de Parcelas Atrasadas'
     
     # ===================================
@@ -38,76 +41,35 @@ class LoanInstallmentRenegotiationWizard(models.TransientModel):
     # SITUAÇÃO ATUAL
     # ===================================
     
+    # Retrato da situação do empréstimo, tirado uma vez ao abrir o wizard.
+    # Os campos abaixo e a simulação são calculados só a partir dele, sem
+    # recarregar as parcelas a cada alteração dos termos.
+    order_snapshot = fields.Json(
+        string='Situação do Empréstimo',
+        compute='_compute_order_snapshot',
+        store=True
+    )
+    
     current_balance = fields.Monetary(
         string='Saldo Devedor Atual',
         currency_field='currency_id',
         compute='_compute_current_situation',
-        store=True,
         help='Valor total das parcelas pendentes'
     )
     
     overdue_installments_count = fields.Integer(
         string='Parcelas Atrasadas',
-        compute='_compute_current_situation',
-        store=True
+        compute='_compute_current_situation'
     )
     
     pending_installments_count = fields.Integer(
         string='Parcelas Pendentes',
-        compute='_compute_current_situation', 
-        store=True
+        compute='_compute_current_situation'
     )
     
     days_overdue = fields.Integer(
         string='Dias de Atraso',
-        compute='_compute_current_situation',
-        store=True
-    )
-    
-    # ===================================
-    # NOVOS TERMOS DA RENEGOCIAÇÃO
-    # ===================================
-    
-    renegotiation_type = fields.Selection([
-        ('extend', 'Estender Prazo'),
-        ('discount', 'Aplicar Desconto'),
-        ('new_terms', 'Novos Termos Completos')
-    ], string='Tipo de Renegociação', required=True, default='extend')
-    
-    # Para extensão de prazo
-    extension_weeks = fields.Integer(
-        string='Estender por (semanas)',
-        default=2,
-        help='Quantas semanas adicionar ao prazo atual'
-    )
-    
-    # Para desconto
-    discount_type = fields.Selection([
-        ('percentage', 'Percentual'),
-        ('fixed', 'Valor Fixo')
-    ], string='Tipo de Desconto', default='percentage')
-    
-    discount_percentage = fields.Float(
-        string='Desconto (%)',
-        default=10.0,
-        help='Percentual de desconto sobre o saldo devedor'
-    )
-    
-    discount_amount = fields.Monetary(
-        string='Valor do Desconto',
-        currency_field='currency_id',
-        help='Valor fixo de desconto'
-    )
-    
-    # Para novos termos completos
-    new_interest_rate = fields.Float(
-        string='Nova Taxa de Juros (%)',
-        help='Nova taxa de juros para o período restante'
-    )
-    
-    new_weeks = fields.Integer(
-        string='Novo Prazo (semanas)',
-        help='Novo prazo total em semanas a partir de hoje'
+        compute='_compute_current_situation'
     )
     
     # ===================================
@@ -134,132 +96,123 @@ class LoanInstallmentRenegotiationWizard(models.TransientModel):
         help='Total de semanas do novo cronograma'
     )
     
-    renegotiation_start_date = fields.Date(
-        string='Data de Início',
-        default=fields.Date.today,
-        required=True,
-        help='Data de início do novo cronograma'
+    preview_schedule = fields.Html(
+        string='Prévia do Cronograma',
+        compute='_compute_new_terms',
+        sanitize=False
     )
     
-    notes = fields.Text(
-        string='Observações',
-        help='Motivo e detalhes da renegociação'
+    scenario_comparison = fields.Html(
+        string='Comparação de Cenários',
+        compute='_compute_new_terms',
+        sanitize=False
     )
     
     # ===================================
     # MÉTODOS COMPUTADOS
     # ===================================
     
-    @api.depends('sale_order_id.loan_installment_ids')
-    def _compute_current_situation(self):
-        """Calcula situação atual do empréstimo"""
+    @api.depends('sale_order_id')
+    def _compute_order_snapshot(self):
+        """Tira o retrato da situação das parcelas abertas (uma consulta)"""
+        orders = self.sale_order_id
+        situation = orders._origin._get_loan_renegotiation_situation() if orders else {}
         for wizard in self:
-            if not wizard.sale_order_id:
-                wizard.current_balance = 0
-                wizard.overdue_installments_count = 0
-                wizard.pending_installments_count = 0
-                wizard.days_overdue = 0
-                continue
-            
-            installments = wizard.sale_order_id.loan_installment_ids
-            
-            # Parcelas pendentes (não pagas)
-            pending_installments = installments.filtered(
-                lambda i: i.status in ['pending', 'late', 'partial']
+            current_balance, pending_count, overdue_count, oldest_overdue = situation.get(
+                wizard.sale_order_id._origin.id, (0.0, 0, 0, None)
             )
-            
-            # Parcelas atrasadas
-            overdue_installments = installments.filtered(
-                lambda i: i.status in ['late', 'partial']
-            )
-            
-            # Saldo devedor = soma das parcelas pendentes - valor já pago
-            current_balance = sum(
-                (inst.amount - inst.amount_paid) for inst in pending_installments
-            )
-            
-            # Dias de atraso (da parcela mais antiga)
-            days_overdue = 0
-            if overdue_installments:
-                oldest_overdue = min(overdue_installments, key=lambda i: i.due_date)
-                days_overdue = (fields.Date.today() - oldest_overdue.due_date).days
-            
-            wizard.current_balance = current_balance
-            wizard.overdue_installments_count = len(overdue_installments)
-            wizard.pending_installments_count = len(pending_installments)
-            wizard.days_overdue = days_overdue
+            wizard.order_snapshot = {
+                'current_balance': current_balance,
+                'pending_count': pending_count,
+                'overdue_count': overdue_count,
+                'oldest_overdue_date': fields.Date.to_string(oldest_overdue) if oldest_overdue else False,
+            }
     
-    @api.depends('renegotiation_type', 'extension_weeks', 'discount_type', 
-                 'discount_percentage', 'discount_amount', 'new_interest_rate', 
-                 'new_weeks', 'current_balance')
-    def _compute_new_terms(self):
-        """Calcula novos termos da renegociação"""
+    @api.depends('order_snapshot')
+    def _compute_current_situation(self):
+        """Calcula situação atual do empréstimo a partir do retrato"""
+        today = fields.Date.today()
         for wizard in self:
-            new_balance = wizard.current_balance
-            new_installment_amount = 0
-            new_total_weeks = 0
+            snapshot = wizard.order_snapshot or {}
+            oldest_overdue = fields.Date.to_date(snapshot.get('oldest_overdue_date'))
             
-            if wizard.renegotiation_type == 'extend':
-                # Extensão de prazo - mantém saldo, redistribui
-                remaining_installments = wizard.pending_installments_count
-                new_total_weeks = remaining_installments + wizard.extension_weeks
-                new_installment_amount = new_balance / new_total_weeks if new_total_weeks else 0
-                
-            elif wizard.renegotiation_type == 'discount':
-                # Aplicar desconto
-                if wizard.discount_type == 'percentage':
-                    discount = new_balance * (wizard.discount_percentage / 100)
-                else:
-                    discount = wizard.discount_amount
-                
-                new_balance = max(0, new_balance - discount)
-                new_total_weeks = wizard.pending_installments_count
-                new_installment_amount = new_balance / new_total_weeks if new_total_weeks else 0
-                
-            elif wizard.renegotiation_type == 'new_terms':
-                # Novos termos completos
-                if wizard.new_interest_rate and wizard.new_weeks:
-                    # Aplica juros no saldo atual
-                    interest_factor = (1 + wizard.new_interest_rate / 100)
-                    new_balance = wizard.current_balance * interest_factor
-                    new_total_weeks = wizard.new_weeks
-                    new_installment_amount = new_balance / new_total_weeks if new_total_weeks else 0
-                else:
-                    new_total_weeks = wizard.new_weeks or wizard.pending_installments_count
-                    new_installment_amount = new_balance / new_total_weeks if new_total_weeks else 0
-            
-            wizard.new_balance = new_balance
-            wizard.new_installment_amount = new_installment_amount
-            wizard.new_total_weeks = new_total_weeks
-    
-    # ===================================
-    # VALIDAÇÕES
-    # ===================================
+            wizard.current_balance = snapshot.get('current_balance', 0.0)
+            wizard.overdue_installments_count = snapshot.get('overdue_count', 0)
+            wizard.pending_installments_count = snapshot.get('pending_count', 0)
+            wizard.days_overdue = (today - oldest_overdue).days if oldest_overdue else 0
     
-    @api.constrains('extension_weeks')
-    def _check_extension_weeks(self):
-        for wizard in self:
-            if wizard.renegotiation_type == 'extend' and wizard.extension_weeks <= 0:
-                raise ValidationError("Extensão deve ser maior que zero!")
+    def _simulate(self, scenarios):
+        """Simula cenários de renegociação sobre o retrato, sem acessar as parcelas"""
+        self.ensure_one()
+        return simulate_renegotiation(self.current_balance, self.pending_installments_count, scenarios)
+    
+    def _render_preview_schedule(self, result):
+        """Tabela com as novas parcelas de uma simulação"""
+        symbol = self.currency_id.symbol or ''
+        due_dates = self.env['loan.holiday']._weekly_due_dates(
+            [self.renegotiation_start_date or fields.Date.today()], [len(result['schedule'])],
+            self.sale_order_id.company_id
+        )[0]
+        rows = ''.join(
+            f"<tr><td>{number}</td><td>{due_date.strftime('%d/%m/%Y')}</td>"
+            f"<td class='text-end'>{symbol} {amount:,.2f}</td>"
+            f"<td class='text-end'>{symbol} {principal:,.2f}</td>"
+            f"<td class='text-end'>{symbol} {interest:,.2f}</td></tr>"
+            for number, ((amount, principal, interest), due_date) in enumerate(zip(result['schedule'], due_dates), start=1)
+        )
+        return (
+            "<table class='table table-sm'><thead><tr><th>Parcela</th><th>Vencimento</th>"
+            "<th class='text-end'>Valor</th><th class='text-end'>Amortização</th>"
+            f"<th class='text-end'>Juros</th></tr></thead><tbody>{rows}</tbody></table>"
+        )
     
-    @api.constrains('discount_percentage')
-    def _check_discount_percentage(self):
-        for wizard in self:
-            if (wizard.renegotiation_type == 'discount' and 
-                wizard.discount_type == 'percentage' and 
-                (wizard.discount_percentage < 0 or wizard.discount_percentage > 100)):
-                raise ValidationError("Desconto deve estar entre 0% e 100%!")
+    def _render_scenario_comparison(self, results):
+        """Tabela comparando os cenários de cada tipo de renegociação"""
+        symbol = self.currency_id.symbol or ''
+        rows = ''.join(
+            f"<tr class='{'table-active' if renegotiation_type == self.renegotiation_type else ''}'>"
+            f"<td>{label}</td>"
+            f"<td class='text-end'>{symbol} {result['new_balance']:,.2f}</td>"
+            f"<td class='text-end'>{result['new_total_weeks']}x {symbol} {result['new_installment_amount']:,.2f}</td></tr>"
+            for (renegotiation_type, label), result in zip(RENEGOTIATION_TYPES, results)
+        )
+        return (
+            "<table class='table table-sm'><thead><tr><th>Cenário</th>"
+            "<th class='text-end'>Novo Saldo</th><th class='text-end'>Parcelas</th>"
+            f"</tr></thead><tbody>{rows}</tbody></table>"
+        )
     
-    @api.constrains('new_weeks')
-    def _check_new_weeks(self):
+    @api.depends('renegotiation_type', 'extension_weeks', 'discount_type', 
+                 'discount_percentage', 'discount_amount', 'new_interest_rate', 
+                 'new_weeks', 'renegotiation_start_date', 'current_balance', 'pending_installments_count')
+    def _compute_new_terms(self):
+        """Simula em memória o cenário escolhido e os demais tipos, lado a lado"""
         for wizard in self:
-            if wizard.renegotiation_type == 'new_terms' and wizard.new_weeks <= 0:
-                raise ValidationError("Novo prazo deve ser maior que zero!")
+            # Um cenário por tipo de renegociação, calculados em uma única chamada
+            results = wizard._simulate([
+                wizard._get_renegotiation_scenario(renegotiation_type)
+                for renegotiation_type, _label in RENEGOTIATION_TYPES
+            ])
+            results_by_type = dict(zip([renegotiation_type for renegotiation_type, _label in RENEGOTIATION_TYPES], results))
+            selected = results_by_type.get(wizard.renegotiation_type)
+            
+            if selected:
+                wizard.new_balance = selected['new_balance']
+                wizard.new_installment_amount = selected['new_installment_amount']
+                wizard.new_total_weeks = selected['new_total_weeks']
+                wizard.preview_schedule = wizard._render_preview_schedule(selected)
+            else:
+                wizard.new_balance = wizard.current_balance
+                wizard.new_installment_amount = 0
+                wizard.new_total_weeks = 0
+                wizard.preview_schedule = False
+            wizard.scenario_comparison = wizard._render_scenario_comparison(results)
     
     # ===================================
     # AÇÃO PRINCIPAL
     # ===================================
     
+    @instrument('loan.installment.renegotiation.wizard.action_confirm_renegotiation')
     def action_confirm_renegotiation(self):
         """Confirma a renegociação e executa as mudanças"""
         self.ensure_one()
@@ -270,85 +223,20 @@ class LoanInstallmentRenegotiationWizard(models.TransientModel):
         if self.overdue_installments_count == 0:
             raise UserError("Não há parcelas atrasadas para renegociar!")
         
-        _logger.info(f"Iniciando renegociação de parcelas para empréstimo {self.sale_order_id.name}")
-        
-        # ================================
-        # ETAPA 1: Marcar parcelas antigas como renegociadas
-        # ================================
+        _logger.info("Iniciando renegociação de parcelas para empréstimo %s", self.sale_order_id.name)
         
-        pending_installments = self.sale_order_id.loan_installment_ids.filtered(
-            lambda i: i.status in ['pending', 'late', 'partial']
-        )
-        
-        for installment in pending_installments:
-            # Força o status para 'renegotiated' sem recalcular
-            installment.sudo().write({
-                'status': 'renegotiated',
-            })
-            
-            # Log da renegociação
-            installment.message_post(
-                body=f"🔄 Parcela renegociada em {fields.Date.today().strftime('%d/%m/%Y')}<br/>"
-                     f"💰 Saldo na renegociação: {self.currency_id.symbol} {installment.amount - installment.amount_paid:,.2f}<br/>"
-                     f"📝 Motivo: {self.notes or 'Renegociação de termos'}"
-            )
-        
-        _logger.info(f"Marcadas {len(pending_installments)} parcelas como renegociadas")
-        
-        # ================================
-        # ETAPA 2: Gerar novas parcelas
-        # ================================
-        
-        installment_obj = self.env['loan.installment']
-        due_date = self.renegotiation_start_date + timedelta(days=7)  # Primeira parcela em 1 semana
-        
-        for i in range(self.new_total_weeks):
-            # Pula fins de semana
-            while due_date.weekday() in [5, 6]:  # Sábado=5, Domingo=6
-                due_date += timedelta(days=1)
-            
-            installment_data = {
-                'sale_order_id': self.sale_order_id.id,
-                'number': i + 1,
-                'due_date': due_date,
-                'amount': self.new_installment_amount,
-                'partner_id': self.partner_id.id,
-            }
-            
-            new_installment = installment_obj.create(installment_data)
-            
-            # Log da criação
-            new_installment.message_post(
-                body=f"🆕 Nova parcela criada via renegociação<br/>"
-                     f"📅 Vencimento: {due_date.strftime('%d/%m/%Y')}<br/>"
-                     f"💰 Valor: {self.currency_id.symbol} {self.new_installment_amount:,.2f}<br/>"
-                     f"🔢 Parcela {i + 1} de {self.new_total_weeks}"
-            )
-            
-            # Próxima parcela (7 dias depois)
-            due_date += timedelta(days=7)
-        
-        _logger.info(f"Criadas {self.new_total_weeks} novas parcelas")
-        
-        # ================================
-        # ETAPA 3: Atualizar empréstimo
-        # ================================
-        
-        self.sale_order_id.message_post(
-            body=f"🔄 <strong>RENEGOCIAÇÃO REALIZADA</strong><br/>"
-                 f"📊 Tipo: {dict(self._fields['renegotiation_type'].selection)[self.renegotiation_type]}<br/>"
-                 f"💰 Saldo renegociado: {self.currency_id.symbol} {self.current_balance:,.2f}<br/>"
-                 f"💳 Novo saldo: {self.currency_id.symbol} {self.new_balance:,.2f}<br/>"
-                 f"📅 Novas parcelas: {self.new_total_weeks}x {self.currency_id.symbol} {self.new_installment_amount:,.2f}<br/>"
-                 f"📝 Observações: {self.notes or 'Nenhuma'}<br/>"
-                 f"👤 Realizada por: {self.env.user.name}"
-        )
+        # O plano usa a situação atual do banco, não o retrato tirado na abertura do wizard
+        current_balance, pending_count, _overdue_count, _oldest_overdue = \
+            self.sale_order_id._get_loan_renegotiation_situation().get(self.sale_order_id.id, (0.0, 0, 0, None))
+        if current_balance <= 0:
+            raise UserError("Não há saldo devedor para renegociar!")
         
-        # Atualiza status se necessário
-        if self.sale_order_id.loan_status == 'late':
-            self.sale_order_id.loan_status = 'active'
+        # Mesmo fluxo da renegociação em lote: parcelas abertas marcadas como
+        # renegociadas, novo cronograma criado de uma vez e um resumo na ordem
+        plan = self._prepare_renegotiation_plan(self.sale_order_id, current_balance, pending_count)
+        self._apply_renegotiation_plans([plan])
         
-        _logger.info(f"Renegociação concluída para empréstimo {self.sale_order_id.name}")
+        _logger.info("Renegociação concluída para empréstimo %s", self.sale_order_id.name)
         
         # ================================
         # RETORNO: Abre lista das novas parcelas
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from odoo.exceptions import UserError, ValidationError
+import logging
+
+from ..models.loan_perf_sample import instrument
+
+_logger = logging.getLogger(__name__)
+
+class LoanPaymentWizard(models.TransientModel):
+    _name = 'loan.payment.wizard'
+    _description = 'Wizard de Registro de Pagamento de Parcela'
+    
+    allocation_mode = fields.Selection([
+        ('installment', 'Parcela Selecionada'),
+        ('waterfall', 'Distribuir nas Parcelas do Cliente (mais antigas primeiro)')
+    ], string='Aplicar em', required=True, default='installment')
+    
+    installment_id = fields.Many2one(
+        'loan.installment',
+        string='Parcela',
+        readonly=True
+    )
+    
+    partner_id = fields.Many2one(
+        'res.partner',
+        string='Cliente',
+        compute='_compute_partner_id',
+        store=True,
+        readonly=False
+    )
+    
+    sale_order_ids = fields.Many2many(
+        'sale.order',
+        string='Empréstimos',
+        domain="[('partner_id', '=', partner_id), ('is_loan_order', '=', True)]",
+        help='Restringe a distribuição a estes empréstimos; deixe vazio para todos os do cliente'
+    )
+    
+    currency_id = fields.Many2one(
+        'res.currency',
+        string='Moeda',
+        compute='_compute_partner_id',
+        store=True
+    )
+    
+    amount = fields.Monetary(
+        string='Valor Recebido',
+        currency_field='currency_id',
+        required=True
+    )
+    
+    max_amount = fields.Monetary(
+        string='Saldo da Parcela',
+        currency_field='currency_id',
+        readonly=True
+    )
+    
+    payment_date = fields.Date(
+        string='Data do Pagamento',
+        required=True,
+        default=fields.Date.context_today
+    )
+    
+    memo = fields.Char(
+        string='Referência',
+        help='Ex.: número do comprovante ou identificador do PIX'
+    )
+    
+    allocation_preview = fields.Html(
+        string='Distribuição',
+        compute='_compute_allocation_preview',
+        sanitize=False
+    )
+    
+    unallocated_amount = fields.Monetary(
+        string='Valor sem Parcela',
+        currency_field='currency_id',
+        compute='_compute_allocation_preview'
+    )
+    
+    @api.depends('installment_id')
+    def _compute_partner_id(self):
+        for wizard in self:
+            wizard.partner_id = wizard.installment_id.partner_id or wizard.partner_id
+            wizard.currency_id = wizard.installment_id.currency_id or wizard.currency_id or self.env.company.currency_id
+    
+    def _get_receipts(self):
+        """O recebimento do wizard no formato do motor de alocação"""
+        self.ensure_one()
+        return [{
+            'partner_id': self.partner_id.id,
+            'amount': self.amount,
+            'order_ids': set(self.sale_order_ids._origin.ids),
+            'date': self.payment_date,
+            'memo': self.memo,
+        }]
+    
+    @api.depends('allocation_mode', 'partner_id', 'sale_order_ids', 'amount')
+    def _compute_allocation_preview(self):
+        """Prévia da distribuição em cascata, calculada em memória"""
+        installment_obj = self.env['loan.installment']
+        for wizard in self:
+            if wizard.allocation_mode != 'waterfall' or not wizard.partner_id or wizard.amount <= 0:
+                wizard.allocation_preview = False
+                wizard.unallocated_amount = 0.0
+                continue
+            
+            allocations, leftovers = installment_obj._prepare_payment_allocation(wizard._get_receipts())
+            installments = installment_obj.browse([installment_id for _index, installment_id, _amount in allocations])
+            symbol = wizard.currency_id.symbol or ''
+            rows = ''.join(
+                f"<tr><td>{installment.display_name}</td><td>{installment.due_date.strftime('%d/%m/%Y')}</td>"
+                f"<td class='text-end'>{symbol} {amount:,.2f}</td></tr>"
+                for (_index, _installment_id, amount), installment in zip(allocations, installments)
+            )
+            wizard.allocation_preview = (
+                "<table class='table table-sm'><thead><tr><th>Parcela</th><th>Vencimento</th>"
+                f"<th class='text-end'>Valor</th></tr></thead><tbody>{rows}</tbody></table>"
+            )
+            wizard.unallocated_amount = leftovers[0]
+    
+    @api.constrains('amount')
+    def _check_amount(self):
+        for wizard in self:
+            if wizard.amount <= 0:
+                raise ValidationError("O valor recebido deve ser maior que zero!")
+    
+    @instrument('loan.payment.wizard.action_confirm_payment')
+    def action_confirm_payment(self):
+        """Lança o pagamento no razão (na parcela ou distribuído em cascata)"""
+        self.ensure_one()
+        if self.allocation_mode == 'waterfall':
+            return self._confirm_waterfall_payment()
+        
+        installment = self.installment_id
+        if not installment:
+            raise UserError("Selecione a parcela!")
+        
+        remaining = installment.amount - installment.amount_paid
+        if self.currency_id.compare_amounts(self.amount, remaining) > 0:
+            raise UserError(
+                f"Valor recebido ({self.currency_id.symbol} {self.amount:,.2f}) maior que o saldo "
+                f"da parcela ({self.currency_id.symbol} {remaining:,.2f})!"
+            )
+        
+        installment._create_payments(
+            {installment.id: self.amount}, 'manual', date=self.payment_date, memo=self.memo
+        )
+        installment._log_events('payment', amounts={installment.id: self.amount}, bodies={
+            installment.id: f"💰 Pagamento registrado: {self.currency_id.symbol} {self.amount:,.2f}"
+                            f"{f' ({self.memo})' if self.memo else ''}"
+        })
+        
+        _logger.info("Pagamento de %s registrado na parcela %s", self.amount, installment.id)
+        return {'type': 'ir.actions.act_window_close'}
+    
+    def _confirm_waterfall_payment(self):
+        """Distribui o valor nas parcelas abertas do cliente, com uma única mensagem"""
+        if not self.partner_id:
+            raise UserError("Selecione o cliente!")
+        
+        allocations, leftovers, payments = self.env['loan.installment']._allocate_payments(self._get_receipts())
+        if self.currency_id.compare_amounts(leftovers[0], 0.0) > 0:
+            # O erro desfaz os lançamentos já feitos nesta transação
+            raise UserError(
+                f"Valor recebido maior que o saldo em aberto do cliente: sobram "
+                f"{self.currency_id.symbol} {leftovers[0]:,.2f} sem parcela!"
+            )
+        
+        # Uma única mensagem consolidada no cliente
+        symbol = self.currency_id.symbol
+        lines = [
+            f"{payment.installment_id.display_name}: {symbol} {payment.amount:,.2f}"
+            for payment in payments
+        ]
+        self.partner_id.message_post(
+            body=f"💰 Recebimento de {symbol} {self.amount:,.2f} distribuído em {len(payments)} parcela(s)"
+                 f"{f' ({self.memo})' if self.memo else ''}<br/>" + "<br/>".join(lines)
+        )
+        
+        _logger.info("Recebimento de %s distribuído em %s parcelas do cliente %s",
+                     self.amount, len(payments), self.partner_id.id)
+        return {'type': 'ir.actions.act_window_close'}
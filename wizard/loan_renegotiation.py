@@ -2,6 +2,9 @@
 from odoo import models, fields, api
 from odoo.exceptions import ValidationError
 
+from ..models.loan_perf_sample import instrument
+from ..tools.loan_schedule import AMORTIZATION_METHODS, compute_schedules
+
 class LoanRenegotiationWizard(models.TransientModel):
     _name = 'loan.renegotiation.wizard'
     _description = 'Wizard de Renegociação de Empréstimo'
@@ -49,6 +52,26 @@ class LoanRenegotiationWizard(models.TransientModel):
         default=4
     )
     
+    amortization_method = fields.Selection(
+        AMORTIZATION_METHODS,
+        string='Sistema de Amortização',
+        required=True,
+        default='flat'
+    )
+    
+    # Simulação do novo empréstimo (mesmo motor usado na geração das parcelas)
+    simulated_total_amount = fields.Monetary(
+        string='Total a Pagar (Simulação)',
+        currency_field='currency_id',
+        compute='_compute_simulation'
+    )
+    
+    simulated_installment_amount = fields.Monetary(
+        string='Primeira Parcela (Simulação)',
+        currency_field='currency_id',
+        compute='_compute_simulation'
+    )
+    
     start_date = fields.Date(
         string='Data de Início',
         default=fields.Date.today,
@@ -69,6 +92,19 @@ class LoanRenegotiationWizard(models.TransientModel):
         for rec in self:
             rec.amount_to_client = rec.new_loan_amount - rec.balance_due
     
+    @api.depends('amount_to_client', 'interest_rate', 'weeks', 'amortization_method')
+    def _compute_simulation(self):
+        schedules = compute_schedules(
+            principals=[max(rec.amount_to_client, 0.0) for rec in self],
+            rates=[rec.interest_rate for rec in self],
+            interest_periods=[7] * len(self),
+            counts=[max(rec.weeks, 0) for rec in self],
+            methods=[rec.amortization_method or 'flat' for rec in self],
+        )
+        for index, rec in enumerate(self):
+            rec.simulated_total_amount = float(schedules.total[index])
+            rec.simulated_installment_amount = float(schedules.amount[index, 0]) if rec.weeks > 0 else 0.0
+    
     @api.constrains('new_loan_amount', 'balance_due')
     def _check_new_loan_amount(self):
         for rec in self:
@@ -78,14 +114,13 @@ class LoanRenegotiationWizard(models.TransientModel):
                     f'({rec.currency_id.symbol} {rec.balance_due:,.2f})'
                 )
     
+    @instrument('loan.renegotiation.wizard.action_confirm_renegotiation')
     def action_confirm_renegotiation(self):
         """Confirma a renegociação"""
         self.ensure_one()
         
-        # Busca produto de empréstimo
-        loan_product = self.env['product.product'].search([
-            ('is_loan_product', '=', True)
-        ], limit=1)
+        # Produto de empréstimo da empresa (cache do registro)
+        loan_product, _tax_ids = self.env['product.product']._get_loan_product(self.original_order_id.company_id)
         
         if not loan_product:
             raise ValidationError('Nenhum produto de empréstimo encontrado!')
@@ -99,6 +134,7 @@ class LoanRenegotiationWizard(models.TransientModel):
             'loan_released_amount': self.amount_to_client,
             'loan_interest_rate': self.interest_rate,
             'loan_weeks': self.weeks,
+            'loan_amortization_method': self.amortization_method,
             'loan_start_date': self.start_date,
             'order_line': [(0, 0, {
                 'product_id': loan_product.id,
@@ -107,16 +143,16 @@ class LoanRenegotiationWizard(models.TransientModel):
             })],
         })
         
-        # Marca parcelas antigas como pagas
+        # Quita as parcelas antigas no razão com lançamentos de renegociação
+        # (não contam como dinheiro recebido nos relatórios de caixa)
         unpaid_installments = self.original_order_id.loan_installment_ids.filtered(
             lambda i: i.status != 'paid'
         )
-        
-        for installment in unpaid_installments:
-            installment.write({
-                'amount_paid': installment.amount,
-                'payment_date': fields.Date.today(),
-            })
+        unpaid_installments._create_payments(
+            {installment.id: installment.amount - installment.amount_paid for installment in unpaid_installments},
+            'renegotiation',
+            memo=new_order.name,
+        )
         
         # Atualiza status do empréstimo original
         self.original_order_id.write({
@@ -0,0 +1,234 @@
+# -*- coding: utf-8 -*-
+from odoo import models, fields, api
+from odoo.exceptions import ValidationError
+from odoo.tools import html_escape, split_every
+import logging
+
+from ..models.sale_order import LOAN_BULK_CREATE_CONTEXT, LOAN_INSTALLMENT_BATCH_SIZE, LOAN_OPEN_INSTALLMENT_STATES
+from ..tools.loan_renegotiation import RENEGOTIATION_TYPES, renegotiated_terms
+from ..tools.loan_schedule import schedule_rows, split_evenly
+
+_logger = logging.getLogger(__name__)
+
+class LoanRenegotiationTermsMixin(models.AbstractModel):
+    """Termos de renegociação de parcelas e aplicação em lote.
+    
+    Compartilhado pelo wizard de um empréstimo e pelo wizard de renegociação
+    em lote: os mesmos termos valem para todas as ordens, os cronogramas são
+    montados em memória e gravados com escritas agrupadas e um create em lote.
+    """
+    _name = 'loan.renegotiation.terms.mixin'
+    _description = 'Termos de Renegociação de Parcelas'
+    
+    currency_id = fields.Many2one('res.currency', string='Moeda')
+    
+    # ===================================
+    # NOVOS TERMOS DA RENEGOCIAÇÃO
+    # ===================================
+    
+    renegotiation_type = fields.Selection(
+        RENEGOTIATION_TYPES,
+        string='Tipo de Renegociação',
+        required=True,
+        default='extend'
+    )
+    
+    # Para extensão de prazo
+    extension_weeks = fields.Integer(
+        string='Estender por (semanas)',
+        default=2,
+        help='Quantas semanas adicionar ao prazo atual'
+    )
+    
+    # Para desconto
+    discount_type = fields.Selection([
+        ('percentage', 'Percentual'),
+        ('fixed', 'Valor Fixo')
+    ], string='Tipo de Desconto', default='percentage')
+    
+    discount_percentage = fields.Float(
+        string='Desconto (%)',
+        default=10.0,
+        help='Percentual de desconto sobre o saldo devedor'
+    )
+    
+    discount_amount = fields.Monetary(
+        string='Valor do Desconto',
+        currency_field='currency_id',
+        help='Valor fixo de desconto'
+    )
+    
+    # Para novos termos completos
+    new_interest_rate = fields.Float(
+        string='Nova Taxa de Juros (%)',
+        help='Nova taxa de juros para o período restante'
+    )
+    
+    new_weeks = fields.Integer(
+        string='Novo Prazo (semanas)',
+        help='Novo prazo total em semanas a partir de hoje'
+    )
+    
+    renegotiation_start_date = fields.Date(
+        string='Data de Início',
+        default=fields.Date.today,
+        required=True,
+        help='Data de início do novo cronograma'
+    )
+    
+    notes = fields.Text(
+        string='Observações',
+        help='Motivo e detalhes da renegociação'
+    )
+    
+    # ===================================
+    # VALIDAÇÕES
+    # ===================================
+    
+    @api.constrains('extension_weeks')
+    def _check_extension_weeks(self):
+        for wizard in self:
+            if wizard.renegotiation_type == 'extend' and wizard.extension_weeks <= 0:
+                raise ValidationError("Extensão deve ser maior que zero!")
+    
+    @api.constrains('discount_percentage')
+    def _check_discount_percentage(self):
+        for wizard in self:
+            if (wizard.renegotiation_type == 'discount' and 
+                wizard.discount_type == 'percentage' and 
+                (wizard.discount_percentage < 0 or wizard.discount_percentage > 100)):
+                raise ValidationError("Desconto deve estar entre 0% e 100%!")
+    
+    @api.constrains('new_weeks')
+    def _check_new_weeks(self):
+        for wizard in self:
+            if wizard.renegotiation_type == 'new_terms' and wizard.new_weeks <= 0:
+                raise ValidationError("Novo prazo deve ser maior que zero!")
+    
+    # ===================================
+    # CÁLCULO DOS NOVOS TERMOS
+    # ===================================
+    
+    def _get_renegotiation_scenario(self, renegotiation_type=None):
+        """Termos do wizard como cenário do simulador (opcionalmente com outro tipo)"""
+        self.ensure_one()
+        return {
+            'renegotiation_type': renegotiation_type or self.renegotiation_type,
+            'extension_weeks': self.extension_weeks,
+            'discount_type': self.discount_type,
+            'discount_percentage': self.discount_percentage,
+            'discount_amount': self.discount_amount,
+            'new_interest_rate': self.new_interest_rate,
+            'new_weeks': self.new_weeks,
+        }
+    
+    def _get_renegotiated_terms(self, current_balance, pending_count):
+        """Retorna (novo saldo, total de semanas) para um saldo devedor"""
+        self.ensure_one()
+        return renegotiated_terms(current_balance, pending_count, self._get_renegotiation_scenario())
+    
+    def _prepare_renegotiation_plan(self, order, current_balance, pending_count):
+        """Plano de renegociação de uma ordem (ainda sem gravar nada)"""
+        new_balance, new_total_weeks = self._get_renegotiated_terms(current_balance, pending_count)
+        return {
+            'order': order,
+            'current_balance': current_balance,
+            'new_balance': new_balance,
+            'weeks': new_total_weeks,
+        }
+    
+    # ===================================
+    # APLICAÇÃO EM LOTE
+    # ===================================
+    
+    def _apply_renegotiation_plans(self, plans):
+        """Aplica os planos de renegociação de várias ordens de uma vez.
+        
+        As parcelas abertas de todas as ordens são marcadas como renegociadas em
+        uma única escrita, os novos cronogramas são criados em lote e cada ordem
+        recebe uma única mensagem de resumo. Retorna as novas parcelas.
+        """
+        self.ensure_one()
+        if not plans:
+            return self.env['loan.installment']
+        
+        orders = self.env['sale.order'].concat(*(plan['order'] for plan in plans))
+        
+        # Cronogramas de todas as ordens calculados de uma vez
+        schedules = split_evenly(
+            [plan['new_balance'] for plan in plans],
+            [plan['weeks'] for plan in plans],
+            principals=[min(plan['current_balance'], plan['new_balance']) for plan in plans],
+        )
+        
+        # Vencimentos semanais ajustados para dias úteis, em lote por empresa
+        holiday_obj = self.env['loan.holiday']
+        weeks_by_order = {plan['order'].id: plan['weeks'] for plan in plans}
+        due_dates = {}
+        for company, company_orders in orders.grouped('company_id').items():
+            dates = holiday_obj._weekly_due_dates(
+                [self.renegotiation_start_date] * len(company_orders),
+                [weeks_by_order[order_id] for order_id in company_orders.ids],
+                company,
+            )
+            due_dates.update(zip(company_orders.ids, dates))
+        
+        # ETAPA 1: marca as parcelas abertas como renegociadas (uma escrita)
+        old_installments = orders.loan_installment_ids.filtered(
+            lambda i: i.status in LOAN_OPEN_INSTALLMENT_STATES
+        )
+        old_installments._log_events('renegotiation', amounts={
+            installment.id: installment.amount - installment.amount_paid for installment in old_installments
+        }, notify=False)
+        old_installments.sudo().write({'is_renegotiated': True})
+        replaced_counts = {
+            order.id: len(installments)
+            for order, installments in old_installments.grouped('sale_order_id').items()
+        }
+        
+        # ETAPA 2: novas parcelas de todas as ordens em um create em lote
+        vals_list = []
+        for index, plan in enumerate(plans):
+            order = plan['order']
+            for number, ((amount, principal, interest), due_date) in enumerate(
+                    zip(schedule_rows(schedules, index), due_dates[order.id]), start=1):
+                vals_list.append({
+                    'sale_order_id': order.id,
+                    'number': number,
+                    'due_date': due_date,
+                    'amount': amount,
+                    'principal_amount': principal,
+                    'interest_amount': interest,
+                    'partner_id': order.partner_id.id,
+                })
+        
+        installment_obj = self.env['loan.installment'].with_context(**LOAN_BULK_CREATE_CONTEXT)
+        new_installments = installment_obj.browse()
+        for batch in split_every(LOAN_INSTALLMENT_BATCH_SIZE, vals_list, list):
+            new_installments |= installment_obj.create(batch)
+        
+        # ETAPA 3: ordens atrasadas voltam a ficar ativas (uma escrita)
+        orders.filtered(lambda o: o.loan_status == 'late').write({'loan_status': 'active'})
+        
+        # Uma mensagem de resumo por ordem, gravadas de uma vez
+        type_label = dict(self._fields['renegotiation_type'].selection)[self.renegotiation_type]
+        bodies = {}
+        for index, plan in enumerate(plans):
+            order = plan['order']
+            symbol = order.currency_id.symbol
+            first_amount = schedules.amount[index, 0] if plan['weeks'] else 0.0
+            bodies[order.id] = (
+                f"🔄 <strong>RENEGOCIAÇÃO REALIZADA</strong><br/>"
+                f"📊 Tipo: {type_label}<br/>"
+                f"💰 Saldo renegociado: {symbol} {plan['current_balance']:,.2f} "
+                f"({replaced_counts.get(order.id, 0)} parcelas substituídas)<br/>"
+                f"💳 Novo saldo: {symbol} {plan['new_balance']:,.2f}<br/>"
+                f"📅 Novas parcelas: {plan['weeks']}x {symbol} {first_amount:,.2f}<br/>"
+                f"📝 Observações: {html_escape(self.notes or 'Nenhuma')}<br/>"
+                f"👤 Realizada por: {html_escape(self.env.user.name)}"
+            )
+        orders._message_log_batch(bodies=bodies)
+        
+        _logger.info("Renegociação aplicada a %s empréstimo(s): %s parcelas substituídas, %s criadas",
+                     len(orders), len(old_installments), len(new_installments))
+        return new_installments